@@ -0,0 +1,26 @@
+"""items price index
+
+Revision ID: 0b6e3f9a2c57
+Revises: f4a8d1c3b692
+Create Date: 2026-10-18 23:48:26.104539
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0b6e3f9a2c57'
+down_revision: Union[str, None] = 'f4a8d1c3b692'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_items_price_id', 'items', ['price', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_items_price_id', table_name='items')
@@ -0,0 +1,34 @@
+"""stall neighbors
+
+Revision ID: 5d2a7e8c4f10
+Revises: 0b6e3f9a2c57
+Create Date: 2026-10-19 01:12:57.630284
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5d2a7e8c4f10'
+down_revision: Union[str, None] = '0b6e3f9a2c57'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # 内容は api.recommendations のバックグラウンド処理（または python -m api.recommendations）が作成する
+    op.create_table('stall_neighbors',
+    sa.Column('stall_id', sa.Integer(), nullable=False),
+    sa.Column('neighbor_id', sa.Integer(), nullable=False),
+    sa.Column('score', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['neighbor_id'], ['stalls.id'], ),
+    sa.ForeignKeyConstraint(['stall_id'], ['stalls.id'], ),
+    sa.PrimaryKeyConstraint('stall_id', 'neighbor_id')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('stall_neighbors')
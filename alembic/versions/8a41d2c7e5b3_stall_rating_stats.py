@@ -0,0 +1,50 @@
+"""stall rating stats
+
+Revision ID: 8a41d2c7e5b3
+Revises: 3c9d009dabdf
+Create Date: 2026-10-18 10:12:41.503118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8a41d2c7e5b3'
+down_revision: Union[str, None] = '3c9d009dabdf'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('stall_rating_stats',
+    sa.Column('stall_id', sa.Integer(), nullable=False),
+    sa.Column('rating_count', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('rating_sum', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('rating_1', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('rating_2', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('rating_3', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('rating_4', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('rating_5', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('updated_at', sa.TIMESTAMP(), server_default=sa.text('now()'), nullable=True),
+    sa.ForeignKeyConstraint(['stall_id'], ['stalls.id'], ),
+    sa.PrimaryKeyConstraint('stall_id')
+    )
+    # 既存のレビューから集計を作成
+    op.execute(
+        "INSERT INTO stall_rating_stats "
+        "(stall_id, rating_count, rating_sum, rating_1, rating_2, rating_3, rating_4, rating_5) "
+        "SELECT stall_id, COUNT(id), SUM(rating), "
+        "SUM(CASE WHEN rating = 1 THEN 1 ELSE 0 END), "
+        "SUM(CASE WHEN rating = 2 THEN 1 ELSE 0 END), "
+        "SUM(CASE WHEN rating = 3 THEN 1 ELSE 0 END), "
+        "SUM(CASE WHEN rating = 4 THEN 1 ELSE 0 END), "
+        "SUM(CASE WHEN rating = 5 THEN 1 ELSE 0 END) "
+        "FROM reviews GROUP BY stall_id"
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('stall_rating_stats')
@@ -0,0 +1,32 @@
+"""job leases
+
+Revision ID: 9e3b6f1d2a84
+Revises: 5d2a7e8c4f10
+Create Date: 2026-10-19 09:41:08.513270
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9e3b6f1d2a84'
+down_revision: Union[str, None] = '5d2a7e8c4f10'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # 行はバックグラウンド処理（api.recommendations）がリースを取得するときに作成する
+    op.create_table('job_leases',
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('owner', sa.String(length=100), nullable=False),
+    sa.Column('expires_at', sa.TIMESTAMP(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('job_leases')
@@ -0,0 +1,58 @@
+"""access path indexes
+
+Revision ID: c5f0e19b7a26
+Revises: 8a41d2c7e5b3
+Create Date: 2026-10-18 13:40:07.215934
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c5f0e19b7a26'
+down_revision: Union[str, None] = '8a41d2c7e5b3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_stalls_created_at', 'stalls', ['created_at'], unique=False)
+    op.create_index('ix_stalls_owner_name', 'stalls', ['owner_name'], unique=False)
+    op.create_index('ix_stalls_stall_name', 'stalls', ['stall_name'], unique=False)
+    op.create_index('ix_items_created_at', 'items', ['created_at'], unique=False)
+    op.create_index('ix_items_stall_id_created_at', 'items', ['stall_id', 'created_at'], unique=False)
+    op.create_index('ix_items_item_name', 'items', ['item_name'], unique=False)
+    op.create_index('ix_reviews_created_at', 'reviews', ['created_at'], unique=False)
+    op.create_index('ix_reviews_stall_id_created_at', 'reviews', ['stall_id', 'created_at'], unique=False)
+    op.create_index('ix_reviews_stall_id_rating', 'reviews', ['stall_id', 'rating'], unique=False)
+    op.create_index('ix_reviews_user_id_created_at', 'reviews', ['user_id', 'created_at'], unique=False)
+
+
+def _ensure_foreign_key_index(table: str, column: str, dropping: tuple) -> None:
+    # MySQLは外部キー列にインデックスを要求し、複合インデックスがあると自動作成のインデックスを削除するため、
+    # 複合インデックスを削除する前に単一列のインデックスを作り直す
+    bind = op.get_bind()
+    if bind.dialect.name != 'mysql':
+        return
+    indexes = sa.inspect(bind).get_indexes(table)
+    if not any(ix['column_names'][:1] == [column] and ix['name'] not in dropping for ix in indexes):
+        op.create_index(column, table, [column], unique=False)
+
+
+def downgrade() -> None:
+    _ensure_foreign_key_index('reviews', 'user_id', ('ix_reviews_user_id_created_at',))
+    _ensure_foreign_key_index('reviews', 'stall_id', ('ix_reviews_stall_id_created_at', 'ix_reviews_stall_id_rating'))
+    _ensure_foreign_key_index('items', 'stall_id', ('ix_items_stall_id_created_at',))
+    op.drop_index('ix_reviews_user_id_created_at', table_name='reviews')
+    op.drop_index('ix_reviews_stall_id_rating', table_name='reviews')
+    op.drop_index('ix_reviews_stall_id_created_at', table_name='reviews')
+    op.drop_index('ix_reviews_created_at', table_name='reviews')
+    op.drop_index('ix_items_item_name', table_name='items')
+    op.drop_index('ix_items_stall_id_created_at', table_name='items')
+    op.drop_index('ix_items_created_at', table_name='items')
+    op.drop_index('ix_stalls_stall_name', table_name='stalls')
+    op.drop_index('ix_stalls_owner_name', table_name='stalls')
+    op.drop_index('ix_stalls_created_at', table_name='stalls')
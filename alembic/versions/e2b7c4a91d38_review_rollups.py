@@ -0,0 +1,46 @@
+"""review rollups
+
+Revision ID: e2b7c4a91d38
+Revises: c5f0e19b7a26
+Create Date: 2026-10-18 21:05:33.418260
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e2b7c4a91d38'
+down_revision: Union[str, None] = 'c5f0e19b7a26'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('review_rollups',
+    sa.Column('stall_id', sa.Integer(), nullable=False),
+    sa.Column('granularity', sa.String(length=6), nullable=False),
+    sa.Column('bucket_start', sa.TIMESTAMP(), nullable=False),
+    sa.Column('review_count', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('rating_sum', sa.Integer(), server_default='0', nullable=False),
+    sa.ForeignKeyConstraint(['stall_id'], ['stalls.id'], ),
+    sa.PrimaryKeyConstraint('stall_id', 'granularity', 'bucket_start')
+    )
+    # 既存のレビューから集計を作成
+    for granularity, date_format in (
+        ('minute', '%Y-%m-%d %H:%i:00'),
+        ('hour', '%Y-%m-%d %H:00:00'),
+        ('day', '%Y-%m-%d 00:00:00'),
+    ):
+        op.execute(
+            "INSERT INTO review_rollups (stall_id, granularity, bucket_start, review_count, rating_sum) "
+            f"SELECT stall_id, '{granularity}', DATE_FORMAT(created_at, '{date_format}') AS bucket_start, "
+            "COUNT(id), SUM(rating) "
+            "FROM reviews WHERE created_at IS NOT NULL GROUP BY stall_id, bucket_start"
+        )
+
+
+def downgrade() -> None:
+    op.drop_table('review_rollups')
@@ -0,0 +1,28 @@
+"""stall location
+
+Revision ID: f4a8d1c3b692
+Revises: e2b7c4a91d38
+Create Date: 2026-10-18 22:31:09.857412
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f4a8d1c3b692'
+down_revision: Union[str, None] = 'e2b7c4a91d38'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('stalls', sa.Column('latitude', sa.Float(precision=53), nullable=True))
+    op.add_column('stalls', sa.Column('longitude', sa.Float(precision=53), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('stalls', 'longitude')
+    op.drop_column('stalls', 'latitude')
@@ -0,0 +1,56 @@
+import json
+import os
+
+from fastapi import HTTPException, Request
+from pydantic import ValidationError
+
+# 一括作成で受け付ける最大行数
+MAX_BULK_ROWS = int(os.getenv("MAX_BULK_ROWS", "10000"))
+
+
+# JSON配列またはNDJSON（Content-Type: application/x-ndjson）の本文を行のリストとして読み込む
+async def read_bulk_rows(request: Request, max_rows: int = MAX_BULK_ROWS):
+    body = await request.body()
+    content_type = request.headers.get("content-type", "")
+    try:
+        if "ndjson" in content_type or "jsonlines" in content_type:
+            rows = [json.loads(line) for line in body.splitlines() if line.strip()]
+        else:
+            rows = json.loads(body)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid JSON body: {e}")
+    if not isinstance(rows, list):
+        raise HTTPException(status_code=400, detail="Request body must be a JSON array or NDJSON")
+    if not rows:
+        raise HTTPException(status_code=400, detail="No rows to create")
+    if len(rows) > max_rows:
+        raise HTTPException(status_code=413, detail=f"At most {max_rows} rows can be created at once")
+    return rows
+
+
+# 各行をスキーマで検証し、(検証済みの (入力での位置, 行) のリスト, 行ごとのエラー) を返す
+def validate_rows(rows: list, schema):
+    valid, errors = [], []
+    for index, row in enumerate(rows):
+        try:
+            valid.append((index, schema.model_validate(row)))
+        except ValidationError as e:
+            errors.append({"index": index, "errors": e.errors(include_url=False, include_context=False)})
+    return valid, errors
+
+
+# 同じ一括作成の中で重複している値を行ごとのエラーとして返す（rows は validate_rows の (位置, 行) のリスト）
+def find_duplicates(rows: list, fields: tuple):
+    errors = []
+    for field in fields:
+        seen = {}
+        for index, row in rows:
+            value = getattr(row, field)
+            if value in seen:
+                errors.append({
+                    "index": index,
+                    "errors": [{"loc": [field], "msg": f"Duplicate of row {seen[value]}", "type": "duplicate"}],
+                })
+            else:
+                seen[value] = index
+    return errors
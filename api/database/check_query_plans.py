@@ -0,0 +1,141 @@
+import asyncio
+import logging
+import os
+import re
+import sys
+from datetime import datetime
+
+# 既定ではインメモリのSQLiteでモデルのクエリを検査する（DB_URLを指定するとそのDBで検査する）
+os.environ.setdefault("DB_URL", "sqlite+aiosqlite://")
+
+from sqlalchemy import event
+
+from api.database.db import ModelBase, Session, engine
+from api.database.models import Item, Review, ReviewRollup, Stall, StallNeighbor, StallRatingStats, User
+from api.database.pagination import encode_cursor
+
+logger = logging.getLogger(__name__)
+
+CURSOR = encode_cursor(datetime(2024, 9, 14, 12, 0, 0), 1)
+
+# 検査するモデルのクエリ（名前, 呼び出し）
+# ランキング（屋台数分の集計行を並べ替える）とエクスポート（全件を読む）は全件走査が前提のため対象外
+QUERIES = [
+    ("Stall.get_list", lambda: Stall.get_list()),
+    ("Stall.get_list(cursor)", lambda: Stall.get_list(cursor=CURSOR)),
+    ("Stall.get_list_rows(cursor)", lambda: Stall.get_list_rows(["id", "stall_name"], cursor=CURSOR)),
+    ("Stall.get_by_id", lambda: Stall.get_by_id(1)),
+    ("Stall.get_by_owner_name", lambda: Stall.get_by_owner_name("owner")),
+    ("Stall.get_by_stall_name", lambda: Stall.get_by_stall_name("stall")),
+    ("Stall.get_detail", lambda: Stall.get_detail(1)),
+    ("Item.get_list", lambda: Item.get_list()),
+    ("Item.get_list(cursor)", lambda: Item.get_list(cursor=CURSOR)),
+    ("Item.get_by_id", lambda: Item.get_by_id(1)),
+    ("Item.get_list_by_stall_id", lambda: Item.get_list_by_stall_id(1)),
+    ("Item.get_list_by_stall_id(cursor)", lambda: Item.get_list_by_stall_id(1, cursor=CURSOR)),
+    ("Item.get_list_rows(stall_id, cursor)", lambda: Item.get_list_rows(["id", "item_name"], stall_id=1, cursor=CURSOR)),
+    ("Item.get_by_item_name", lambda: Item.get_by_item_name("item")),
+    ("User.get_by_username", lambda: User.get_by_username("user")),
+    ("User.get_by_email", lambda: User.get_by_email("user@example.com")),
+    ("User.get_by_id", lambda: User.get_by_id(1)),
+    ("Review.get_list", lambda: Review.get_list()),
+    ("Review.get_list(cursor)", lambda: Review.get_list(cursor=CURSOR)),
+    ("Review.get_by_id", lambda: Review.get_by_id(1)),
+    ("Review.get_list_by_user_id", lambda: Review.get_list_by_user_id(1)),
+    ("Review.get_list_by_user_id(cursor)", lambda: Review.get_list_by_user_id(1, cursor=CURSOR)),
+    ("Review.get_by_stall_id", lambda: Review.get_by_stall_id(1)),
+    ("Review.get_by_stall_id(cursor)", lambda: Review.get_by_stall_id(1, cursor=CURSOR)),
+    ("Review.get_list_rows(stall_id, cursor)", lambda: Review.get_list_rows(["id", "rating"], stall_id=1, cursor=CURSOR)),
+    ("Review.get_list_rows(user_id, cursor)", lambda: Review.get_list_rows(["id", "rating"], user_id=1, cursor=CURSOR)),
+    ("Item.search_rows(price)", lambda: Item.search_rows(["id", "price"], min_price=100, max_price=500)),
+    ("Item.search_rows(created_at)", lambda: Item.search_rows(["id", "price"], max_price=500, sort="created_at")),
+    ("Review.get_user_ratings", lambda: Review.get_user_ratings(1)),
+    ("Stall.get_rows_by_ids", lambda: Stall.get_rows_by_ids(["id", "stall_name"], [1, 2, 3])),
+    ("StallNeighbor.get_for_stalls", lambda: StallNeighbor.get_for_stalls([1, 2, 3])),
+    ("StallRatingStats.get_by_stall_id", lambda: StallRatingStats.get_by_stall_id(1)),
+    ("StallRatingStats.get_summaries", lambda: StallRatingStats.get_summaries([1, 2, 3])),
+    ("ReviewRollup.get_buckets", lambda: ReviewRollup.get_buckets(1, "hour", start=datetime(2024, 1, 1), end=datetime(2024, 1, 2))),
+]
+
+# テーブルの全件走査・並べ替え用の一時領域の使用を退行とみなす
+SQLITE_FULL_SCAN = re.compile(r"^SCAN \w+$|USE TEMP B-TREE")
+MYSQL_FULL_SCAN = re.compile(r"type=ALL|Using filesort")
+
+
+# 呼び出し中に発行されたSQLとパラメータを記録する
+async def capture_statements(call):
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        await call()
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+        await Session.remove()
+    return statements
+
+
+# 実行計画を1行ずつの文字列で返す
+async def explain(statement, parameters):
+    async with engine.connect() as conn:
+        if engine.dialect.name == "sqlite":
+            result = await conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters)
+            return [row[3] for row in result]
+        result = await conn.exec_driver_sql("EXPLAIN " + statement, parameters)
+        return [
+            f"table={row['table']} type={row['type']} key={row['key']} extra={row['Extra']}"
+            for row in result.mappings()
+        ]
+
+
+def find_full_scans(plan):
+    pattern = SQLITE_FULL_SCAN if engine.dialect.name == "sqlite" else MYSQL_FULL_SCAN
+    return [line for line in plan if pattern.search(line)]
+
+
+# 1つのクエリを実行し、全件走査になっている (名前, SQL, 実行計画) のリストを返す
+async def check_query(name, call):
+    regressions = []
+    for statement, parameters in await capture_statements(call):
+        plan = await explain(statement, parameters)
+        print(f"{name}: {' | '.join(plan)}")
+        if find_full_scans(plan):
+            regressions.append((name, statement, plan))
+    return regressions
+
+
+# 屋台が存在しないと途中で終わるクエリ（Stall.get_detail）のために1件だけ作成する
+async def create_fixture_rows():
+    await Stall.create(stall_name="stall", owner_name="owner")
+    await Session.remove()
+
+
+async def check():
+    if engine.dialect.name == "sqlite":
+        async with engine.begin() as conn:
+            await conn.run_sync(ModelBase.metadata.create_all)
+        await create_fixture_rows()
+    regressions = []
+    for name, call in QUERIES:
+        regressions += await check_query(name, call)
+    return regressions
+
+
+# モデルのクエリが全件走査に退行していないかを検査するコマンド
+# 使い方: poetry run python -m api.database.check_query_plans
+async def main():
+    logging.basicConfig(level=logging.INFO)
+    try:
+        regressions = await check()
+    finally:
+        await engine.dispose()
+    for name, statement, plan in regressions:
+        logger.error(f"{name} が全件走査になっています\n{statement}\n{' | '.join(plan)}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -1,14 +1,83 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base, scoped_session
+import os
+import random
+from asyncio import current_task
+from contextvars import ContextVar
 
-# 同期処理用のデータベースURL
-DB_URL = "mysql://root@db:3306/demo?charset=utf8"
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, async_scoped_session
+from sqlalchemy.orm import Session as OrmSession, declarative_base
+from sqlalchemy.sql.dml import UpdateBase
 
-# 同期用のエンジンを作成
-engine = create_engine(DB_URL, echo=True)
-# 同期用のセッションを作成
-Session = scoped_session(
-    sessionmaker(autocommit=False, autoflush=False, bind=engine)
+from api.database.pool import InstrumentedAsyncQueuePool
+
+# 非同期処理用のデータベースURL（テストでは sqlite+aiosqlite:///... を指定する）
+DB_URL = os.getenv("DB_URL", "mysql+aiomysql://root@db:3306/demo?charset=utf8")
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    return os.getenv(name, str(default)).lower() in ("1", "true", "yes", "on")
+
+
+# エンジンの設定（環境変数で調整する）
+def engine_options(url: str) -> dict:
+    options = {"echo": _env_bool("DB_ECHO", False)}
+    # インメモリのSQLiteは単一接続（StaticPool）のためプール設定を行わない
+    if url.startswith("sqlite") and (":memory:" in url or url.rstrip("/").endswith(":")):
+        return options
+    options.update({
+        "poolclass": InstrumentedAsyncQueuePool,
+        "pool_size": int(os.getenv("DB_POOL_SIZE", "10")),
+        "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "20")),
+        "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "1800")),
+        "pool_pre_ping": _env_bool("DB_POOL_PRE_PING", True),
+        "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT", "10")),
+    })
+    return options
+
+
+# 読み取り専用のレプリカのURL（カンマ区切り、未指定の場合はすべてプライマリで処理する）
+DB_REPLICA_URLS = [url.strip() for url in os.getenv("DB_REPLICA_URLS", "").split(",") if url.strip()]
+
+# 非同期用のエンジンを作成
+engine = create_async_engine(DB_URL, **engine_options(DB_URL))
+replica_engines = [create_async_engine(url, **engine_options(url)) for url in DB_REPLICA_URLS]
+# 遅延や障害で外れたレプリカ（api.database.replicas が更新する）
+unhealthy_replicas = set()
+
+# 処理中のリクエストの読み取りをレプリカに振り分けてよいか（GETでのみTrueにする）
+use_replica: ContextVar = ContextVar("use_replica", default=False)
+
+
+def choose_replica():
+    candidates = [replica for replica in replica_engines if replica not in unhealthy_replicas]
+    return random.choice(candidates) if candidates else None
+
+
+# 書き込みと、読み取りが許可されていない処理のクエリはプライマリに送るセッション
+class RoutingSession(OrmSession):
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if replica_engines and use_replica.get() and not self._flushing and not isinstance(clause, UpdateBase):
+            # 1つのセッションでは同じレプリカを使い続ける（外れた場合のみ選び直す）
+            replica = self.info.get("replica")
+            if replica is None or replica in unhealthy_replicas:
+                replica = self.info["replica"] = choose_replica()
+            if replica is not None:
+                return replica.sync_engine
+        return engine.sync_engine
+
+
+# 非同期用のセッションファクトリ（commit後に属性を再読み込みしない）
+session_factory = async_sessionmaker(
+    bind=engine, sync_session_class=RoutingSession, autoflush=False, expire_on_commit=False
 )
+# リクエスト（asyncioタスク）ごとのセッション
+Session = async_scoped_session(session_factory, scopefunc=current_task)
 # モデルのベースクラス
 ModelBase = declarative_base()
+
+
+# リクエスト終了時にタスクごとのセッションを破棄する依存関数
+async def remove_session():
+    try:
+        yield
+    finally:
+        await Session.remove()
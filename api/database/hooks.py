@@ -0,0 +1,25 @@
+import logging
+from collections import defaultdict
+
+logger = logging.getLogger(__name__)
+
+# テーブル名 -> commit後に呼び出す関数のリスト
+_listeners = defaultdict(list)
+
+
+# commit後に呼び出す関数を登録するデコレータ
+# 関数には作成・更新・削除されたオブジェクトのリストが渡される（一括更新の場合は空のリスト）
+def on_commit(table: str):
+    def decorator(func):
+        _listeners[table].append(func)
+        return func
+    return decorator
+
+
+# モデルのcommit後に呼び出す（リスナーの失敗は書き込みの結果に影響させない）
+def notify_commit(table: str, objects=()):
+    for func in _listeners[table]:
+        try:
+            func(list(objects))
+        except Exception as e:
+            logger.error(f"Commit listener for {table} failed: {e}")
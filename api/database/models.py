@@ -1,112 +1,285 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Text, TIMESTAMP, PrimaryKeyConstraint
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, ForeignKey, Text, TIMESTAMP, PrimaryKeyConstraint, Index, Float, cast, insert, select, update, delete, case, text, literal, or_
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import relationship, selectinload
 from sqlalchemy.sql import func
-from api.database.db import Session as db_session
+from api.database.db import Session as db_session, session_factory
 import logging
+from datetime import timedelta
 
 from api.database.db import ModelBase
+from api.database.pagination import DEFAULT_LIMIT, paginate, paginate_rows
+from api.database.hooks import notify_commit
 
 # ロガーの設定
 logger = logging.getLogger(__name__)
 
+# SQLiteではCURRENT_TIMESTAMPと同じ秒単位の形式で日時を保存する（MySQLのTIMESTAMPも秒単位）
+Timestamp = TIMESTAMP().with_variant(
+    sqlite.DATETIME(storage_format="%(year)04d-%(month)02d-%(day)02d %(hour)02d:%(minute)02d:%(second)02d"),
+    "sqlite",
+)
+
+# 複数行INSERT1文あたりの行数
+BULK_INSERT_CHUNK_SIZE = 1000
+
+
+async def bulk_insert(cls, rows: list):
+    # 複数行INSERTで挿入し、採番されたidを行の順番で返す（commitは呼び出し元が行う）
+    table = cls.__table__
+    if db_session.bind.dialect.insert_returning:
+        result = await db_session.execute(
+            insert(table).returning(table.c.id, sort_by_parameter_order=True), rows
+        )
+        return list(result.scalars().all())
+    # RETURNINGが使えないMySQLでは、単純な複数行INSERTの採番が連続することを利用する
+    step = (await db_session.execute(text("SELECT @@auto_increment_increment"))).scalar() or 1
+    ids = []
+    for start in range(0, len(rows), BULK_INSERT_CHUNK_SIZE):
+        chunk = rows[start:start + BULK_INSERT_CHUNK_SIZE]
+        result = await db_session.execute(insert(table).values(chunk))
+        first_id = result.lastrowid
+        ids.extend(first_id + i * step for i in range(len(chunk)))
+    return ids
+
+
+async def bulk_create(cls, rows: list):
+    # 1トランザクションで一括作成し、採番されたidのリストを返す（失敗時はNone）
+    try:
+        ids = await bulk_insert(cls, rows)
+        await db_session.commit()
+        notify_commit(cls.__tablename__, [cls(id=id, **row) for id, row in zip(ids, rows)])
+        return ids
+    except Exception as e:
+        await db_session.rollback()
+        logger.error(f"Failed to bulk create {cls.__tablename__}: {e}")
+        return None
+
 # Stallモデル（屋台）
 class Stall(ModelBase):
     __tablename__ = "stalls"
+    # 一覧（created_at, id 順）と名前での検索に対応するインデックス
+    __table_args__ = (
+        Index("ix_stalls_created_at", "created_at"),
+        Index("ix_stalls_owner_name", "owner_name"),
+        Index("ix_stalls_stall_name", "stall_name"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     stall_name = Column(String(100), nullable=False)
     owner_name = Column(String(100), nullable=False)
     thumbnail_URL = Column(String(200), nullable=True)
-    created_at = Column(TIMESTAMP, server_default=func.now())
+    # 地図用の位置（未設定の屋台は近くの屋台の検索に含めない）
+    # MySQLの FLOAT は単精度で約1mの誤差が出るため、倍精度（DOUBLE）にする
+    latitude = Column(Float(precision=53), nullable=True)
+    longitude = Column(Float(precision=53), nullable=True)
+    created_at = Column(Timestamp, server_default=func.now())
 
     # StallとItem、Reviewのリレーション
     items = relationship("Item", back_populates="stall")
     reviews = relationship("Review", back_populates="stall")
     
     @classmethod
-    def create(
-        cls, stall_name: str, owner_name: str, thumbnail_URL: str = None
+    async def create(
+        cls, stall_name: str, owner_name: str, thumbnail_URL: str = None,
+        latitude: float = None, longitude: float = None,
     ):
         try:
-            new_stall = cls(stall_name=stall_name, owner_name=owner_name, thumbnail_URL=thumbnail_URL)
+            new_stall = cls(
+                stall_name=stall_name, owner_name=owner_name, thumbnail_URL=thumbnail_URL,
+                latitude=latitude, longitude=longitude,
+            )
             db_session.add(new_stall)
-            db_session.commit()
+            await db_session.commit()
+            notify_commit(cls.__tablename__, [new_stall])
             return True
         except Exception as e:
-            db_session.rollback()
+            await db_session.rollback()
             logger.error(f"Failed to create stall: {e}")
             return False
 
     @classmethod
-    def get_list(cls):
-        return db_session.query(cls).all()
+    async def create_many(cls, rows: list):
+        return await bulk_create(cls, rows)
+
+    @classmethod
+    async def get_existing_ids(cls, ids: list):
+        # 指定したidのうち存在する屋台のidを集合で返す
+        return set((await db_session.scalars(select(cls.id).where(cls.id.in_(set(ids))))).all())
 
     @classmethod
-    def get_by_id(cls, stall_id: int):
-        return db_session.query(cls).filter(cls.id == stall_id).first()
+    async def get_list(cls, limit: int = DEFAULT_LIMIT, cursor: str = None):
+        return await paginate(select(cls), cls, limit=limit, cursor=cursor)
+
+    @classmethod
+    async def get_list_rows(cls, columns, limit: int = DEFAULT_LIMIT, cursor: str = None):
+        # get_list と同じページを指定した列のタプルで返す
+        return await paginate_rows(cls, columns, limit=limit, cursor=cursor)
+
+    @classmethod
+    async def get_by_id(cls, stall_id: int):
+        return await db_session.scalar(select(cls).where(cls.id == stall_id).limit(1))
     
     @classmethod
-    def get_by_owner_name(cls, owner_name: str):
-        return db_session.query(cls).filter(cls.owner_name == owner_name).first()
+    async def get_detail(cls, stall_id: int, review_limit: int = 10):
+        # 屋台・商品・評価集計・最新のレビューを3回のクエリで取得する
+        # (屋台, 集計, 最新のレビューのリスト) を返す（屋台が無い場合はNone）
+        stmt = (
+            select(cls, StallRatingStats)
+            .outerjoin(StallRatingStats, StallRatingStats.stall_id == cls.id)
+            .where(cls.id == stall_id)
+            .options(selectinload(cls.items))
+        )
+        row = (await db_session.execute(stmt)).first()
+        if row is None:
+            return None
+        stall, stats = row
+        reviews = []
+        if review_limit > 0:
+            reviews = (await db_session.scalars(
+                select(Review)
+                .where(Review.stall_id == stall_id)
+                .order_by(Review.created_at.desc(), Review.id.desc())
+                .limit(review_limit)
+            )).all()
+        return stall, stats, reviews
+
+    @classmethod
+    async def get_name_rows(cls):
+        # 検索インデックス用に (id, stall_name, owner_name) を返す
+        return (await db_session.execute(select(cls.id, cls.stall_name, cls.owner_name))).all()
+
+    @classmethod
+    async def get_rows_by_ids(cls, columns, ids):
+        # 指定したidの屋台を指定した列のタプルで返す（順序は不定）
+        if not ids:
+            return []
+        return (await db_session.execute(
+            select(*(getattr(cls, column) for column in columns)).where(cls.id.in_(ids))
+        )).all()
 
     @classmethod
-    def get_by_stall_name(cls, stall_name: str):
-        return db_session.query(cls).filter(cls.stall_name == stall_name).first()
+    async def get_location_rows(cls):
+        # 近くの屋台の索引用に、位置が設定された屋台を返す
+        return (await db_session.execute(
+            select(cls.id, cls.stall_name, cls.owner_name, cls.thumbnail_URL, cls.latitude, cls.longitude)
+            .where(cls.latitude.is_not(None), cls.longitude.is_not(None))
+        )).all()
+
+    @classmethod
+    async def get_by_owner_name(cls, owner_name: str):
+        return await db_session.scalar(select(cls).where(cls.owner_name == owner_name).limit(1))
+
+    @classmethod
+    async def get_by_stall_name(cls, stall_name: str):
+        return await db_session.scalar(select(cls).where(cls.stall_name == stall_name).limit(1))
     
     @classmethod
-    def update_thumbnail_URL(cls, stall_id: int, thumbnail_URL: str):
+    async def update_thumbnail_URL(cls, stall_id: int, thumbnail_URL: str):
+        return await cls._update(stall_id, "thumbnail URL", thumbnail_URL=thumbnail_URL)
+
+    @classmethod
+    async def update_location(cls, stall_id: int, latitude: float = None, longitude: float = None):
+        # 両方Noneの場合は位置を削除する
+        return await cls._update(stall_id, "location", latitude=latitude, longitude=longitude)
+
+    @classmethod
+    async def _update(cls, stall_id: int, label: str, **values):
+        # 更新後の屋台をcommit後の処理（検索・位置の索引など）に渡すため、読み込んでから更新する
         try:
-            db_session.query(cls).filter(cls.id == stall_id).update({cls.thumbnail_URL: thumbnail_URL})
-            db_session.commit()
+            stall = await db_session.get(cls, stall_id)
+            if stall is None:
+                return False
+            for key, value in values.items():
+                setattr(stall, key, value)
+            await db_session.commit()
+            notify_commit(cls.__tablename__, [stall])
             return True
         except Exception as e:
-            db_session.rollback()
-            logger.error(f"Failed to update thumbnail URL: {e}")
+            await db_session.rollback()
+            logger.error(f"Failed to update {label}: {e}")
             return False
 
 
 # Itemモデル（品物）
 class Item(ModelBase):
     __tablename__ = "items"
+    # 一覧・屋台ごとの一覧（created_at, id 順）・価格順と名前での検索に対応するインデックス
+    __table_args__ = (
+        Index("ix_items_created_at", "created_at"),
+        Index("ix_items_stall_id_created_at", "stall_id", "created_at"),
+        Index("ix_items_item_name", "item_name"),
+        Index("ix_items_price_id", "price", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     stall_id = Column(Integer, ForeignKey("stalls.id"), nullable=False)
     item_name = Column(String(100), nullable=False)
     price = Column(Integer, nullable=False)
-    created_at = Column(TIMESTAMP, server_default=func.now())
+    created_at = Column(Timestamp, server_default=func.now())
 
     # ItemとStallのリレーション
     stall = relationship("Stall", back_populates="items")
 
     @classmethod
-    def get_list(cls):
-        return db_session.query(cls).all()
+    async def get_list(cls, limit: int = DEFAULT_LIMIT, cursor: str = None):
+        return await paginate(select(cls), cls, limit=limit, cursor=cursor)
     
     @classmethod
-    def create(
+    async def create(
         cls, stall_id: int, item_name: str, price: int 
     ):
         try:
             new_item = cls(stall_id=stall_id, item_name=item_name, price=price)
             db_session.add(new_item)
-            db_session.commit()
+            await db_session.commit()
+            notify_commit(cls.__tablename__, [new_item])
             return True
         except Exception as e:
-            db_session.rollback()
+            await db_session.rollback()
             logger.error(f"Failed to create stall: {e}")
             return False
+
+    @classmethod
+    async def create_many(cls, rows: list):
+        return await bulk_create(cls, rows)
     
     @classmethod
-    def get_by_id(cls, item_id: int):
-        return db_session.query(cls).filter(cls.id == item_id).first()
+    async def get_by_id(cls, item_id: int):
+        return await db_session.scalar(select(cls).where(cls.id == item_id).limit(1))
+
+    @classmethod
+    async def get_list_by_stall_id(cls, stall_id: int, limit: int = DEFAULT_LIMIT, cursor: str = None):
+        stmt = select(cls).where(cls.stall_id == stall_id)
+        return await paginate(stmt, cls, limit=limit, cursor=cursor)
 
     @classmethod
-    def get_list_by_stall_id(cls, stall_id: int):
-        return db_session.query(cls).filter(cls.stall_id == stall_id).all()
+    async def get_list_rows(cls, columns, stall_id: int = None, limit: int = DEFAULT_LIMIT, cursor: str = None):
+        # get_list / get_list_by_stall_id と同じページを指定した列のタプルで返す
+        criteria = [] if stall_id is None else [cls.stall_id == stall_id]
+        return await paginate_rows(cls, columns, *criteria, limit=limit, cursor=cursor)
     
     @classmethod
-    def get_by_item_name(cls, item_name: str):
-        return db_session.query(cls).filter(cls.item_name == item_name).first()
+    async def get_name_rows(cls):
+        # 検索・価格の索引用に (id, stall_id, item_name, price) を返す
+        return (await db_session.execute(select(cls.id, cls.stall_id, cls.item_name, cls.price))).all()
+
+    @classmethod
+    async def search_rows(
+        cls, columns, min_price: int = None, max_price: int = None, sort: str = "price", limit: int = DEFAULT_LIMIT
+    ):
+        # 価格の範囲で絞り込み、価格順（price, id）または作成順（created_at, id）に指定した列のタプルで返す
+        stmt = select(*(getattr(cls, column) for column in columns))
+        if min_price is not None:
+            stmt = stmt.where(cls.price >= min_price)
+        if max_price is not None:
+            stmt = stmt.where(cls.price <= max_price)
+        order = (cls.price, cls.id) if sort == "price" else (cls.created_at, cls.id)
+        return (await db_session.execute(stmt.order_by(*order).limit(limit))).all()
+
+    @classmethod
+    async def get_by_item_name(cls, item_name: str):
+        return await db_session.scalar(select(cls).where(cls.item_name == item_name).limit(1))
 
 
 # Userモデル（ユーザー）
@@ -117,56 +290,85 @@ class User(ModelBase):
     username = Column(String(50), nullable=False, unique=True)
     password = Column(String(255), nullable=False)
     email = Column(String(100), nullable=False, unique=True)
-    created_at = Column(TIMESTAMP, server_default=func.now())
+    created_at = Column(Timestamp, server_default=func.now())
 
     # UserとReviewのリレーション
     reviews = relationship("Review", back_populates="user")
     
     @classmethod
-    def create(
+    async def create(
         cls, username: str, password: str, email: str 
     ):
         try:
             new_user = cls(username=username, password=password, email=email)
             db_session.add(new_user)
-            db_session.commit()
+            await db_session.commit()
             return True
         except Exception as e:
-            db_session.rollback()
+            await db_session.rollback()
             logger.error(f"Failed to create stall: {e}")
             return False
 
     @classmethod
-    def get_list(cls):
-        return db_session.query(cls).all()
+    async def create_many(cls, rows: list):
+        return await bulk_create(cls, rows)
+
+    @classmethod
+    async def get_existing_keys(cls, usernames: list, emails: list):
+        # 既に使われているユーザー名・メールアドレスを (ユーザー名の集合, メールアドレスの集合) で返す
+        rows = (await db_session.execute(
+            select(cls.username, cls.email).where(or_(cls.username.in_(usernames), cls.email.in_(emails)))
+        )).all()
+        return {row.username for row in rows}, {row.email for row in rows}
+
+    @classmethod
+    async def get_list(cls):
+        return (await db_session.scalars(select(cls))).all()
     
     @classmethod
-    def get_by_username(cls, username: str):
-        return db_session.query(cls).filter(cls.username == username).first()
+    async def get_by_username(cls, username: str):
+        return await db_session.scalar(select(cls).where(cls.username == username).limit(1))
 
     @classmethod
-    def get_by_email(cls, email: str):
-        return db_session.query(cls).filter(cls.email == email).first()
+    async def get_by_email(cls, email: str):
+        return await db_session.scalar(select(cls).where(cls.email == email).limit(1))
 
     @classmethod
-    def get_by_id(cls, user_id: int):
-        return db_session.query(cls).filter(cls.id == user_id).first()
+    async def get_by_id(cls, user_id: int):
+        return await db_session.scalar(select(cls).where(cls.id == user_id).limit(1))
     
     @classmethod
-    def authenticate(cls, username: str, password: str):
-        return db_session.query(cls).filter(cls.username == username, cls.password == password).first()
+    async def update_password(cls, user_id: int, password: str):
+        try:
+            user = await db_session.get(cls, user_id)
+            if user is None:
+                return False
+            user.password = password
+            await db_session.commit()
+            return True
+        except Exception as e:
+            await db_session.rollback()
+            logger.error(f"Failed to update password: {e}")
+            return False
     
 
 # Reviewモデル（レビュー）
 class Review(ModelBase):
     __tablename__ = "reviews"
+    # 一覧・屋台ごと・ユーザーごとの一覧（created_at, id 順）と評価の集計に対応するインデックス
+    __table_args__ = (
+        Index("ix_reviews_created_at", "created_at"),
+        Index("ix_reviews_stall_id_created_at", "stall_id", "created_at"),
+        Index("ix_reviews_stall_id_rating", "stall_id", "rating"),
+        Index("ix_reviews_user_id_created_at", "user_id", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     stall_id = Column(Integer, ForeignKey("stalls.id"), nullable=False)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     rating = Column(Integer, nullable=False)
     comment = Column(Text, nullable=False)
-    created_at = Column(TIMESTAMP, server_default=func.now())
+    created_at = Column(Timestamp, server_default=func.now())
     
 
     # ReviewとStall、Userのリレーション
@@ -174,33 +376,437 @@ class Review(ModelBase):
     user = relationship("User", back_populates="reviews")
 
     @classmethod
-    def create(
+    async def create(
         cls, stall_id: int, user_id: int, rating: int, comment: str
     ):
         try:
-            new_review = cls(stall_id=stall_id, user_id=user_id, rating=rating, comment=comment)
+            # 時間帯ごとの集計と一致させるため、作成日時はDBの現在時刻を明示して保存する
+            created_at = await ReviewRollup.now()
+            new_review = cls(stall_id=stall_id, user_id=user_id, rating=rating, comment=comment, created_at=created_at)
             db_session.add(new_review)
-            db_session.commit()
+            # 集計テーブルもレビューと同じトランザクションで更新する
+            await StallRatingStats.apply(stall_id=stall_id, rating=rating, delta=1)
+            await ReviewRollup.apply([(stall_id, created_at, rating, 1)])
+            await db_session.commit()
+            notify_commit(cls.__tablename__, [new_review])
             
             # ここでTrueではなく、作成したオブジェクトを返す
             return new_review
         except Exception as e:
-            db_session.rollback()
+            await db_session.rollback()
             logger.error(f"Failed to create review: {e}")
             return None  # 失敗時はNoneを返すようにする
     
     @classmethod
-    def get_list(cls):
-        return db_session.query(cls).all()
+    async def create_many(cls, rows: list):
+        # 複数行INSERTで一括作成し、集計テーブルも同じトランザクションで更新する（失敗時はNone）
+        try:
+            created_at = await ReviewRollup.now()
+            rows = [{**row, "created_at": created_at} for row in rows]
+            ids = await bulk_insert(cls, rows)
+            counts = {}
+            for row in rows:
+                key = (row["stall_id"], row["rating"])
+                counts[key] = counts.get(key, 0) + 1
+            # 同時に走る他の書き込みとデッドロックしないよう、常に同じ順番で行をロックする
+            # （create・delete と同じく、評価集計の後に時間帯ごとの集計を更新する）
+            for (stall_id, rating), count in sorted(counts.items()):
+                await StallRatingStats.apply(stall_id=stall_id, rating=rating, delta=count)
+            await ReviewRollup.apply([(row["stall_id"], created_at, row["rating"], 1) for row in rows])
+            await db_session.commit()
+            notify_commit(cls.__tablename__, [cls(id=id, **row) for id, row in zip(ids, rows)])
+            return ids
+        except Exception as e:
+            await db_session.rollback()
+            logger.error(f"Failed to create reviews: {e}")
+            return None
+
+    @classmethod
+    async def get_list(cls, limit: int = DEFAULT_LIMIT, cursor: str = None):
+        return await paginate(select(cls), cls, limit=limit, cursor=cursor)
+
+    @classmethod
+    async def get_by_id(cls, review_id: int):
+        return await db_session.scalar(select(cls).where(cls.id == review_id).limit(1))
+
+    @classmethod
+    async def get_list_by_user_id(cls, user_id: int, limit: int = DEFAULT_LIMIT, cursor: str = None):
+        stmt = select(cls).where(cls.user_id == user_id)
+        return await paginate(stmt, cls, limit=limit, cursor=cursor)
+
+    @classmethod
+    async def get_by_stall_id(cls, stall_id: int, limit: int = DEFAULT_LIMIT, cursor: str = None):
+        stmt = select(cls).where(cls.stall_id == stall_id)
+        return await paginate(stmt, cls, limit=limit, cursor=cursor)
+
+    @classmethod
+    async def get_list_rows(cls, columns, stall_id: int = None, user_id: int = None, limit: int = DEFAULT_LIMIT, cursor: str = None):
+        # get_list / get_by_stall_id / get_list_by_user_id と同じページを指定した列のタプルで返す
+        criteria = []
+        if stall_id is not None:
+            criteria.append(cls.stall_id == stall_id)
+        if user_id is not None:
+            criteria.append(cls.user_id == user_id)
+        return await paginate_rows(cls, columns, *criteria, limit=limit, cursor=cursor)
+
+    @classmethod
+    async def iter_export_batches(cls, since=None, stall_id: int = None, user_id: int = None, batch_size: int = 1000):
+        # サーバーサイドカーソルでbatch_size件ずつ行（タプル）を返す
+        # レスポンスのストリーミング中も使えるよう、リクエストとは別のセッションを使う
+        stmt = select(cls.id, cls.stall_id, cls.user_id, cls.rating, cls.comment, cls.created_at).order_by(cls.id)
+        if since is not None:
+            stmt = stmt.where(cls.created_at >= since)
+        if stall_id is not None:
+            stmt = stmt.where(cls.stall_id == stall_id)
+        if user_id is not None:
+            stmt = stmt.where(cls.user_id == user_id)
+        async with session_factory() as session:
+            result = await session.stream(stmt.execution_options(yield_per=batch_size))
+            async for rows in result.partitions():
+                yield rows
+
+    @classmethod
+    async def iter_rating_batches(cls, after_id: int = 0, batch_size: int = 10000):
+        # 推薦の集計用に、after_id より後のレビューの (id, user_id, stall_id, rating) を id 順に batch_size 件ずつ返す
+        stmt = select(cls.id, cls.user_id, cls.stall_id, cls.rating).where(cls.id > after_id).order_by(cls.id)
+        async with session_factory() as session:
+            result = await session.stream(stmt.execution_options(yield_per=batch_size))
+            async for rows in result.partitions():
+                yield rows
+
+    @classmethod
+    async def get_user_ratings(cls, user_id: int):
+        # ユーザーのレビューの (stall_id, rating) を返す（件数が少ないため屋台ごとの集計は呼び出し元で行う）
+        return (await db_session.execute(select(cls.stall_id, cls.rating).where(cls.user_id == user_id))).all()
+
+    @classmethod
+    async def delete(cls, review_id: int):
+        try:
+            review = await db_session.scalar(select(cls).where(cls.id == review_id).limit(1))
+            if review is None:
+                return False
+            await db_session.delete(review)
+            await StallRatingStats.apply(stall_id=review.stall_id, rating=review.rating, delta=-1)
+            if review.created_at is not None:
+                await ReviewRollup.apply([(review.stall_id, review.created_at, review.rating, -1)])
+            await db_session.commit()
+            notify_commit(cls.__tablename__, [review])
+            return True
+        except Exception as e:
+            await db_session.rollback()
+            logger.error(f"Failed to delete review: {e}")
+            return False
+
+
+# StallRatingStatsモデル（屋台ごとの評価集計）
+# reviewsの作成・削除と同じトランザクションで差分更新する
+class StallRatingStats(ModelBase):
+    __tablename__ = "stall_rating_stats"
+
+    stall_id = Column(Integer, ForeignKey("stalls.id"), primary_key=True)
+    rating_count = Column(Integer, nullable=False, default=0, server_default="0")
+    rating_sum = Column(Integer, nullable=False, default=0, server_default="0")
+    rating_1 = Column(Integer, nullable=False, default=0, server_default="0")
+    rating_2 = Column(Integer, nullable=False, default=0, server_default="0")
+    rating_3 = Column(Integer, nullable=False, default=0, server_default="0")
+    rating_4 = Column(Integer, nullable=False, default=0, server_default="0")
+    rating_5 = Column(Integer, nullable=False, default=0, server_default="0")
+    updated_at = Column(Timestamp, server_default=func.now(), onupdate=func.now())
+
+    stall = relationship("Stall")
 
     @classmethod
-    def get_by_id(cls, review_id: int):
-        return db_session.query(cls).filter(cls.id == review_id).first()
+    def _increments(cls, rating: int, delta: int):
+        bucket = getattr(cls, f"rating_{rating}")
+        return {
+            cls.rating_count: cls.rating_count + delta,
+            cls.rating_sum: cls.rating_sum + rating * delta,
+            bucket: bucket + delta,
+        }
 
     @classmethod
-    def get_list_by_user_id(cls, user_id: int):
-        return db_session.query(cls).filter(cls.user_id == user_id).all()
+    async def apply(cls, stall_id: int, rating: int, delta: int = 1):
+        # 呼び出し元のトランザクション内で加算する（commitは呼び出し元が行う）
+        stmt = (
+            update(cls)
+            .where(cls.stall_id == stall_id)
+            .values(cls._increments(rating, delta))
+            .execution_options(synchronize_session=False)
+        )
+        result = await db_session.execute(stmt)
+        if result.rowcount or delta < 0:
+            return
+        try:
+            async with db_session.begin_nested():
+                db_session.add(cls(
+                    stall_id=stall_id, rating_count=delta, rating_sum=rating * delta,
+                    **{f"rating_{i}": delta if i == rating else 0 for i in range(1, 6)}
+                ))
+        except IntegrityError:
+            # 別のトランザクションが先に行を作成した場合は加算し直す
+            await db_session.execute(stmt)
+
+    @classmethod
+    async def get_by_stall_id(cls, stall_id: int):
+        return await db_session.scalar(select(cls).where(cls.stall_id == stall_id).limit(1))
+
+    @classmethod
+    async def get_summary(cls, stall_id: int):
+        return cls.summarize(await cls.get_by_stall_id(stall_id))
+
+    @classmethod
+    async def get_summaries(cls, stall_ids: list):
+        # 複数屋台の集計を1回のクエリで取得する（レビューが無い屋台は0件）
+        rows = (await db_session.scalars(select(cls).where(cls.stall_id.in_(stall_ids)))).all() if stall_ids else []
+        stats_by_id = {stats.stall_id: stats for stats in rows}
+        return [
+            {"stall_id": stall_id, **cls.summarize(stats_by_id.get(stall_id))}
+            for stall_id in stall_ids
+        ]
+
+    @classmethod
+    async def get_ranking(cls, limit: int = 3, min_count: int = 3):
+        # 平均評価の高い順に屋台と集計を返す
+        average = cast(cls.rating_sum, Float) / cls.rating_count
+        stmt = (
+            select(Stall, cls)
+            .join(cls, cls.stall_id == Stall.id)
+            .where(cls.rating_count >= min_count)
+            .order_by(average.desc(), cls.stall_id)
+            .limit(limit)
+        )
+        return (await db_session.execute(stmt)).all()
+
+    @classmethod
+    async def rebuild(cls):
+        # reviewsテーブルから集計を作り直す
+        try:
+            await db_session.execute(delete(cls))
+            columns = [
+                Review.stall_id,
+                func.count(Review.id),
+                func.sum(Review.rating),
+            ] + [
+                func.sum(case((Review.rating == i, 1), else_=0)) for i in range(1, 6)
+            ]
+            await db_session.execute(
+                insert(cls).from_select(
+                    ["stall_id", "rating_count", "rating_sum",
+                     "rating_1", "rating_2", "rating_3", "rating_4", "rating_5"],
+                    select(*columns).group_by(Review.stall_id),
+                )
+            )
+            await db_session.commit()
+            return True
+        except Exception as e:
+            await db_session.rollback()
+            logger.error(f"Failed to rebuild rating stats: {e}")
+            return False
+
+    @staticmethod
+    def summarize(stats):
+        # レビューが無い屋台は0件として返す
+        if stats is None or not stats.rating_count:
+            return {
+                "average_rating": 0.0,
+                "rating_count": 0,
+                "rating_distribution": [0, 0, 0, 0, 0],
+            }
+        return {
+            "average_rating": stats.rating_sum / stats.rating_count,
+            "rating_count": stats.rating_count,
+            "rating_distribution": [
+                stats.rating_1, stats.rating_2, stats.rating_3, stats.rating_4, stats.rating_5
+            ],
+        }
+
+
+# ReviewRollupモデル（屋台ごと・時間帯ごとのレビュー数と評価の合計）
+# reviewsの作成・削除と同じトランザクションで差分更新する
+class ReviewRollup(ModelBase):
+    __tablename__ = "review_rollups"
+
+    # 集計の粒度 -> 区切りの長さ
+    GRANULARITIES = {
+        "minute": timedelta(minutes=1),
+        "hour": timedelta(hours=1),
+        "day": timedelta(days=1),
+    }
+
+    stall_id = Column(Integer, ForeignKey("stalls.id"), primary_key=True)
+    granularity = Column(String(6), primary_key=True)
+    bucket_start = Column(Timestamp, primary_key=True)
+    review_count = Column(Integer, nullable=False, default=0, server_default="0")
+    rating_sum = Column(Integer, nullable=False, default=0, server_default="0")
+
+    @classmethod
+    async def now(cls):
+        # レビューの created_at（server_default）と同じDBの時計で現在時刻を取得する
+        return (await db_session.scalar(select(func.now()))).replace(microsecond=0, tzinfo=None)
+
+    @staticmethod
+    def truncate(created_at, granularity: str):
+        if granularity == "minute":
+            return created_at.replace(second=0, microsecond=0)
+        if granularity == "hour":
+            return created_at.replace(minute=0, second=0, microsecond=0)
+        return created_at.replace(hour=0, minute=0, second=0, microsecond=0)
 
     @classmethod
-    def get_by_stall_id(cls, stall_id: int):
-        return db_session.query(cls).filter(cls.stall_id == stall_id).all()
\ No newline at end of file
+    async def apply(cls, changes: list):
+        # changes は (stall_id, created_at, rating, delta) のリスト（commitは呼び出し元が行う）
+        totals = {}
+        for stall_id, created_at, rating, delta in changes:
+            for granularity in cls.GRANULARITIES:
+                key = (stall_id, granularity, cls.truncate(created_at, granularity))
+                count, rating_sum = totals.get(key, (0, 0))
+                totals[key] = (count + delta, rating_sum + rating * delta)
+        # 同時に走る他の書き込みとデッドロックしないよう、常に同じ順番で行をロックする
+        for (stall_id, granularity, bucket_start), (count, rating_sum) in sorted(totals.items()):
+            stmt = (
+                update(cls)
+                .where(cls.stall_id == stall_id, cls.granularity == granularity, cls.bucket_start == bucket_start)
+                .values({cls.review_count: cls.review_count + count, cls.rating_sum: cls.rating_sum + rating_sum})
+                .execution_options(synchronize_session=False)
+            )
+            result = await db_session.execute(stmt)
+            if result.rowcount or count < 0:
+                continue
+            try:
+                async with db_session.begin_nested():
+                    db_session.add(cls(
+                        stall_id=stall_id, granularity=granularity, bucket_start=bucket_start,
+                        review_count=count, rating_sum=rating_sum,
+                    ))
+            except IntegrityError:
+                # 別のトランザクションが先に行を作成した場合は加算し直す
+                await db_session.execute(stmt)
+
+    @classmethod
+    async def get_buckets(cls, stall_id: int, granularity: str, start=None, end=None, limit: int = 1000):
+        # [start, end) の区切りのうち新しい方から limit 件を古い順に返す（レビューが無い区切りは含まない）
+        stmt = select(cls.bucket_start, cls.review_count, cls.rating_sum).where(
+            cls.stall_id == stall_id, cls.granularity == granularity, cls.review_count > 0
+        )
+        if start is not None:
+            stmt = stmt.where(cls.bucket_start >= cls.truncate(start, granularity))
+        if end is not None:
+            stmt = stmt.where(cls.bucket_start < end)
+        rows = (await db_session.execute(stmt.order_by(cls.bucket_start.desc()).limit(limit))).all()
+        return rows[::-1]
+
+    @classmethod
+    def _truncate_sql(cls, column, granularity: str, dialect: str):
+        formats = {"minute": ("%Y-%m-%d %H:%i:00", "%Y-%m-%d %H:%M:00"),
+                   "hour": ("%Y-%m-%d %H:00:00", "%Y-%m-%d %H:00:00"),
+                   "day": ("%Y-%m-%d 00:00:00", "%Y-%m-%d 00:00:00")}
+        mysql_format, sqlite_format = formats[granularity]
+        if dialect == "sqlite":
+            return func.strftime(sqlite_format, column)
+        return func.date_format(column, mysql_format)
+
+    @classmethod
+    async def rebuild(cls):
+        # reviewsテーブルから集計を作り直す
+        try:
+            await db_session.execute(delete(cls))
+            dialect = db_session.bind.dialect.name
+            for granularity in cls.GRANULARITIES:
+                bucket_start = cls._truncate_sql(Review.created_at, granularity, dialect)
+                await db_session.execute(
+                    insert(cls).from_select(
+                        ["stall_id", "granularity", "bucket_start", "review_count", "rating_sum"],
+                        select(
+                            Review.stall_id, literal(granularity), bucket_start,
+                            func.count(Review.id), func.sum(Review.rating),
+                        ).where(Review.created_at.is_not(None)).group_by(Review.stall_id, bucket_start),
+                    )
+                )
+            await db_session.commit()
+            return True
+        except Exception as e:
+            await db_session.rollback()
+            logger.error(f"Failed to rebuild review rollups: {e}")
+            return False
+
+
+# StallNeighborモデル（屋台ごとの評価が似ている屋台の上位K件）
+# api.recommendations のバックグラウンド処理がレビューから計算して書き込む
+class StallNeighbor(ModelBase):
+    __tablename__ = "stall_neighbors"
+
+    stall_id = Column(Integer, ForeignKey("stalls.id"), primary_key=True)
+    neighbor_id = Column(Integer, ForeignKey("stalls.id"), primary_key=True)
+    score = Column(Float, nullable=False)
+
+    @classmethod
+    async def get_for_stalls(cls, stall_ids):
+        # 指定した屋台の (stall_id, neighbor_id, score) を返す
+        if not stall_ids:
+            return []
+        return (await db_session.execute(
+            select(cls.stall_id, cls.neighbor_id, cls.score).where(cls.stall_id.in_(stall_ids))
+        )).all()
+
+    @classmethod
+    async def replace(cls, neighbors: dict, clear: bool = False):
+        # neighbors は stall_id -> [(neighbor_id, score), ...]。指定した屋台の行を入れ替える
+        # clear=True の場合は指定されていない屋台の行も削除する（全件の再計算用）
+        try:
+            if clear:
+                await db_session.execute(delete(cls))
+            stall_ids = sorted(neighbors)
+            for start in range(0, len(stall_ids), BULK_INSERT_CHUNK_SIZE):
+                chunk = stall_ids[start:start + BULK_INSERT_CHUNK_SIZE]
+                if not clear:
+                    await db_session.execute(delete(cls).where(cls.stall_id.in_(chunk)))
+                rows = [
+                    {"stall_id": stall_id, "neighbor_id": neighbor_id, "score": score}
+                    for stall_id in chunk
+                    for neighbor_id, score in neighbors[stall_id]
+                ]
+                if rows:
+                    await db_session.execute(insert(cls), rows)
+            await db_session.commit()
+            return True
+        except Exception as e:
+            await db_session.rollback()
+            logger.error(f"Failed to replace stall neighbors: {e}")
+            return False
+
+
+# JobLeaseモデル（複数のプロセスのうち1つだけでバックグラウンド処理を動かすためのリース）
+class JobLease(ModelBase):
+    __tablename__ = "job_leases"
+
+    name = Column(String(50), primary_key=True)
+    owner = Column(String(100), nullable=False)
+    expires_at = Column(Timestamp, nullable=False)
+
+    @classmethod
+    async def acquire(cls, name: str, owner: str, seconds: int):
+        # 期限が切れているか owner が持っているリースを取得・延長し、取得できたかを返す
+        try:
+            # プロセスごとの時計のずれの影響を受けないよう、期限はDBの時計で決める
+            now = (await db_session.scalar(select(func.now()))).replace(microsecond=0, tzinfo=None)
+            expires_at = now + timedelta(seconds=seconds)
+            result = await db_session.execute(
+                update(cls)
+                .where(cls.name == name, or_(cls.owner == owner, cls.expires_at < now))
+                .values(owner=owner, expires_at=expires_at)
+                .execution_options(synchronize_session=False)
+            )
+            if not result.rowcount:
+                try:
+                    async with db_session.begin_nested():
+                        db_session.add(cls(name=name, owner=owner, expires_at=expires_at))
+                except IntegrityError:
+                    # 他のプロセスが期限内のリースを持っている
+                    await db_session.rollback()
+                    return False
+            await db_session.commit()
+            return True
+        except Exception as e:
+            await db_session.rollback()
+            logger.error(f"Failed to acquire job lease {name}: {e}")
+            return False
@@ -0,0 +1,64 @@
+import base64
+import json
+from datetime import datetime
+
+from sqlalchemy import and_, literal, or_, select, tuple_
+
+from api.database.db import Session as db_session
+
+# 1ページあたりの件数
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+
+
+class InvalidCursorError(ValueError):
+    pass
+
+
+# (created_at, id) を不透明なカーソル文字列に変換する（created_at がNULLの行のカーソルは None のまま保存する）
+def encode_cursor(created_at: datetime, id: int) -> str:
+    payload = json.dumps([created_at.isoformat() if created_at is not None else None, id])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return None if created_at is None else datetime.fromisoformat(created_at), int(id)
+    except (ValueError, TypeError) as e:
+        raise InvalidCursorError(f"Invalid cursor: {cursor}") from e
+
+
+def _keyset(stmt, cls, limit: int, cursor: str):
+    if cursor:
+        created_at, id = decode_cursor(cursor)
+        if created_at is None:
+            # created_at がNULLの行は昇順の先頭に並ぶ（MySQL・SQLite）ため、残りのNULLの行とNULLでない行すべてが続く
+            stmt = stmt.where(or_(and_(cls.created_at.is_(None), cls.id > id), cls.created_at.is_not(None)))
+        else:
+            # 行値の比較ではバインドに列の型が引き継がれないため明示する（NULLの行は比較で除かれる）
+            created_at = literal(created_at, cls.created_at.type)
+            stmt = stmt.where(tuple_(cls.created_at, cls.id) > tuple_(created_at, id))
+    return stmt.order_by(cls.created_at, cls.id).limit(limit + 1)
+
+
+# (created_at, id) 順のキーセットページネーション
+# 次ページがある場合は (rows, next_cursor)、無い場合は (rows, None) を返す
+async def paginate(stmt, cls, limit: int = DEFAULT_LIMIT, cursor: str = None):
+    limit = max(1, min(limit, MAX_LIMIT))
+    rows = (await db_session.scalars(_keyset(stmt, cls, limit, cursor))).all()
+    if len(rows) <= limit:
+        return rows, None
+    last = rows[limit - 1]
+    return rows[:limit], encode_cursor(last.created_at, last.id)
+
+
+# paginate と同じ順序で、指定した列だけをタプルで返す（ORMオブジェクトを作らない）
+async def paginate_rows(cls, columns, *criteria, limit: int = DEFAULT_LIMIT, cursor: str = None):
+    limit = max(1, min(limit, MAX_LIMIT))
+    # カーソル用の列を末尾に加えて取得し、返す前に取り除く
+    stmt = select(*(getattr(cls, column) for column in columns), cls.created_at, cls.id).where(*criteria)
+    rows = (await db_session.execute(_keyset(stmt, cls, limit, cursor))).all()
+    next_cursor = encode_cursor(*rows[limit - 1][-2:]) if len(rows) > limit else None
+    return [tuple(row[:-2]) for row in rows[:limit]], next_cursor
@@ -0,0 +1,50 @@
+import time
+
+from sqlalchemy import exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+
+# 接続取得の待ち時間を記録するコネクションプール
+class InstrumentedAsyncQueuePool(AsyncAdaptedQueuePool):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            return super().connect()
+        except exc.TimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - start
+            self.checkouts += 1
+            self.wait_seconds_total += waited
+            self.wait_seconds_max = max(self.wait_seconds_max, waited)
+
+
+# プールの状態を辞書で返す
+def pool_status(pool):
+    status = {"pool_class": type(pool).__name__}
+    if isinstance(pool, AsyncAdaptedQueuePool):
+        status.update({
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "idle": pool.checkedin(),
+            "overflow": max(pool.overflow(), 0),
+            "max_overflow": pool._max_overflow,
+            "timeout": pool.timeout(),
+        })
+    if isinstance(pool, InstrumentedAsyncQueuePool):
+        status.update({
+            "checkouts": pool.checkouts,
+            "timeouts": pool.timeouts,
+            "wait_seconds_total": pool.wait_seconds_total,
+            "wait_seconds_avg": pool.wait_seconds_total / pool.checkouts if pool.checkouts else 0.0,
+            "wait_seconds_max": pool.wait_seconds_max,
+        })
+    return status
@@ -0,0 +1,31 @@
+import asyncio
+import logging
+import sys
+
+from api.database.db import Session, engine
+from api.database.models import ReviewRollup, StallRatingStats
+
+logger = logging.getLogger(__name__)
+
+
+# reviewsテーブルからstall_rating_statsとreview_rollupsを再計算するコマンド
+# 使い方: poetry run python -m api.database.rebuild_rating_stats
+async def main():
+    logging.basicConfig(level=logging.INFO)
+    try:
+        if not await StallRatingStats.rebuild():
+            logger.error("stall_rating_stats の再計算に失敗しました")
+            return 1
+        logger.info("stall_rating_stats を再計算しました")
+        if not await ReviewRollup.rebuild():
+            logger.error("review_rollups の再計算に失敗しました")
+            return 1
+        logger.info("review_rollups を再計算しました")
+        return 0
+    finally:
+        await Session.remove()
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,212 @@
+import asyncio
+import logging
+import os
+import time
+from contextvars import ContextVar
+
+from sqlalchemy import event, text
+from starlette.datastructures import MutableHeaders
+from starlette.requests import HTTPConnection
+
+from api.database.db import Session, replica_engines, unhealthy_replicas, use_replica
+
+logger = logging.getLogger(__name__)
+
+# レプリカの死活・遅延を確認する間隔（秒）
+DB_REPLICA_CHECK_INTERVAL = float(os.getenv("DB_REPLICA_CHECK_INTERVAL", "5"))
+# この秒数以上遅れているレプリカには振り分けない
+DB_REPLICA_MAX_LAG = float(os.getenv("DB_REPLICA_MAX_LAG", "5"))
+# 書き込んだクライアントの読み取りをプライマリに固定する秒数
+DB_REPLICA_STICKY_SECONDS = int(os.getenv("DB_REPLICA_STICKY_SECONDS", "5"))
+
+STICKY_COOKIE = "db_primary_until"
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+# 処理中のリクエストでエラーになったレプリカ（ReplicaRoutingMiddleware がリクエストごとにリストを入れる）
+replica_errors: ContextVar = ContextVar("replica_errors", default=None)
+
+
+# MySQLのレプリカの遅延（秒）。レプリケーションが止まっている場合はNone、レプリカでない場合は0
+async def replication_lag(conn):
+    if conn.dialect.name != "mysql":
+        return 0.0
+    for statement, column in (
+        ("SHOW REPLICA STATUS", "Seconds_Behind_Source"),
+        ("SHOW SLAVE STATUS", "Seconds_Behind_Master"),
+    ):
+        try:
+            row = (await conn.execute(text(statement))).mappings().first()
+        except Exception:
+            continue
+        if row is None:
+            return 0.0
+        lag = row.get(column)
+        return None if lag is None else float(lag)
+    return 0.0
+
+
+# 定期的にレプリカを確認し、遅れている・応答しないものを振り分け先から外す
+class ReplicaMonitor:
+    def __init__(self, interval: float, max_lag: float):
+        self.interval = interval
+        self.max_lag = max_lag
+        self._status = {}
+        self._task = None
+
+    def _mark(self, replica, healthy: bool, lag=None, error=None):
+        if healthy:
+            if replica in unhealthy_replicas:
+                logger.info(f"Replica {replica.url.render_as_string()} is back in rotation")
+            unhealthy_replicas.discard(replica)
+        else:
+            if replica not in unhealthy_replicas:
+                logger.warning(f"Replica {replica.url.render_as_string()} removed from rotation: {error}")
+            unhealthy_replicas.add(replica)
+        self._status[replica] = {"healthy": healthy, "lag": lag, "error": error, "checked_at": time.time()}
+
+    async def check(self, replica):
+        try:
+            async with replica.connect() as conn:
+                await conn.execute(text("SELECT 1"))
+                lag = await replication_lag(conn)
+        except Exception as e:
+            self._mark(replica, False, error=str(e))
+            return
+        if lag is None:
+            self._mark(replica, False, error="replication is not running")
+        elif lag > self.max_lag:
+            self._mark(replica, False, lag=lag, error=f"replication lag {lag}s")
+        else:
+            self._mark(replica, True, lag=lag)
+
+    async def check_all(self):
+        await asyncio.gather(*(self.check(replica) for replica in replica_engines))
+
+    async def _run(self):
+        while True:
+            await self.check_all()
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if replica_engines:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def status(self):
+        return [
+            {"url": replica.url.render_as_string(), **self._status.get(replica, {"healthy": replica not in unhealthy_replicas})}
+            for replica in replica_engines
+        ]
+
+
+replica_monitor = ReplicaMonitor(interval=DB_REPLICA_CHECK_INTERVAL, max_lag=DB_REPLICA_MAX_LAG)
+
+
+# 接続が切れたレプリカは次の確認を待たずに外し、リクエストはプライマリでやり直す
+def _handle_replica_error(replica):
+    def handle_error(context):
+        errors = replica_errors.get()
+        if errors is not None:
+            errors.append(replica)
+        if context.is_disconnect or context.connection is None:
+            replica_monitor._mark(replica, False, error=str(context.original_exception))
+    return handle_error
+
+
+def watch_replica(replica):
+    event.listen(replica.sync_engine, "handle_error", _handle_replica_error(replica))
+
+
+for _replica in replica_engines:
+    watch_replica(_replica)
+
+
+def _is_sticky(scope) -> bool:
+    until = HTTPConnection(scope).cookies.get(STICKY_COOKIE)
+    try:
+        return until is not None and float(until) > time.time()
+    except ValueError:
+        return False
+
+
+# GETの読み取りをレプリカに振り分けるASGIミドルウェア
+# 書き込みに成功したクライアントにはCookieを付け、しばらくの間は読み取りもプライマリで処理する
+# レプリカのエラーで失敗した読み取りは、応答を返す前に1回だけプライマリでやり直す
+class ReplicaRoutingMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not replica_engines:
+            return await self.app(scope, receive, send)
+
+        if scope["method"] in SAFE_METHODS and not _is_sticky(scope):
+            if not await self._call_on_replica(scope, receive, send):
+                logger.warning(f"Retrying {scope['method']} {scope['path']} on the primary after a replica error")
+                # 失敗したレプリカを選んだセッションは使わず、新しいセッションでやり直す
+                await Session.remove()
+                await self._call(scope, _replay(receive), send, False)
+            return
+        await self._call(scope, receive, send, False)
+
+    async def _call_on_replica(self, scope, receive, send) -> bool:
+        # レプリカで処理し、レプリカのエラーで5xxになった場合は応答を送らずにFalseを返す
+        errors = []
+        errors_token = replica_errors.set(errors)
+        started = False
+        failed = False
+
+        async def send_unless_failed(message):
+            nonlocal started, failed
+            if message["type"] == "http.response.start":
+                if errors and message["status"] >= 500:
+                    failed = True
+                    return
+                started = True
+            if not failed:
+                await send(message)
+
+        try:
+            await self._call(scope, receive, send_unless_failed, True)
+        except Exception:
+            if not errors or started:
+                raise
+            failed = True
+        finally:
+            replica_errors.reset(errors_token)
+        return not failed
+
+    async def _call(self, scope, receive, send, read_replica: bool):
+        method = scope["method"]
+        token = use_replica.set(read_replica)
+
+        async def send_with_cookie(message):
+            if message["type"] == "http.response.start" and method not in SAFE_METHODS and message["status"] < 400:
+                until = int(time.time()) + DB_REPLICA_STICKY_SECONDS
+                MutableHeaders(scope=message).append(
+                    "set-cookie",
+                    f"{STICKY_COOKIE}={until}; Max-Age={DB_REPLICA_STICKY_SECONDS}; Path=/; HttpOnly; SameSite=Lax",
+                )
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_cookie)
+        finally:
+            use_replica.reset(token)
+
+
+# やり直しでは空の本文を渡す（読み取りのリクエストは本文を持たない）
+def _replay(receive):
+    replayed = False
+
+    async def replay():
+        nonlocal replayed
+        if not replayed:
+            replayed = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        return await receive()
+    return replay
@@ -0,0 +1,174 @@
+import heapq
+import logging
+import math
+import os
+
+from api.database.hooks import on_commit
+from api.database.models import Stall
+from api.index_refresher import IndexRefresher
+
+logger = logging.getLogger(__name__)
+
+# グリッドの1マスの大きさ（メートル、南北方向）
+GEO_CELL_SIZE_M = float(os.getenv("GEO_CELL_SIZE_M", "100"))
+# 他のワーカーでの更新を拾うために索引を作り直す間隔（秒、0で無効）
+GEO_REFRESH_INTERVAL = float(os.getenv("GEO_REFRESH_INTERVAL", "60"))
+
+EARTH_RADIUS_M = 6371008.8
+# 緯度1度あたりの距離（メートル）
+METERS_PER_DEGREE = math.pi * EARTH_RADIUS_M / 180
+
+
+def distance_m(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    # 2点間の大円距離（ハーバサイン公式）
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+# 緯度・経度を一定の角度で区切った一様グリッドの索引（マス -> 屋台idの集合）
+class GridIndex:
+    def __init__(self, cell_size_m: float):
+        self.cell_degrees = cell_size_m / METERS_PER_DEGREE
+        self._cells = {}
+        # 屋台id -> (緯度, 経度, マス, 返す内容)
+        self._points = {}
+
+    def __len__(self):
+        return len(self._points)
+
+    def clear(self):
+        self._cells.clear()
+        self._points.clear()
+
+    def _cell(self, latitude: float, longitude: float):
+        return math.floor(latitude / self.cell_degrees), math.floor(longitude / self.cell_degrees)
+
+    def add(self, id: int, latitude: float, longitude: float, document: dict):
+        self.remove(id)
+        cell = self._cell(latitude, longitude)
+        self._points[id] = (latitude, longitude, cell, document)
+        self._cells.setdefault(cell, set()).add(id)
+
+    def remove(self, id: int):
+        point = self._points.pop(id, None)
+        if point is None:
+            return
+        ids = self._cells[point[2]]
+        ids.discard(id)
+        if not ids:
+            del self._cells[point[2]]
+
+    def _ring_cells(self, row: int, col: int, ring: int, bounds):
+        # (row, col) からチェビシェフ距離でちょうど ring マス離れたマス（範囲外は除く）
+        row_min, col_min, row_max, col_max = bounds
+        if ring == 0:
+            cells = [(row, col)]
+        else:
+            cells = [(row - ring, c) for c in range(col - ring, col + ring + 1)]
+            cells += [(row + ring, c) for c in range(col - ring, col + ring + 1)]
+            cells += [(r, col - ring) for r in range(row - ring + 1, row + ring)]
+            cells += [(r, col + ring) for r in range(row - ring + 1, row + ring)]
+        return [
+            self._cells.get((r, c), ()) for r, c in cells
+            if row_min <= r <= row_max and col_min <= c <= col_max
+        ]
+
+    def _ring_min_distance(self, latitude: float, longitude: float, row: int, col: int, ring: int) -> float:
+        # ring マス目にある屋台までの距離の下限（ring マス目の屋台は緯度か経度の少なくとも一方で ring マス離れている）
+        if ring == 0:
+            return 0.0
+        lat_gap = min(latitude - (row - ring + 1) * self.cell_degrees, (row + ring) * self.cell_degrees - latitude)
+        lon_gap = min(longitude - (col - ring + 1) * self.cell_degrees, (col + ring) * self.cell_degrees - longitude)
+        # 経度の差が lon_gap 以上の点までの距離は、その経線までの距離より短くならない
+        lon_sin = math.cos(math.radians(latitude)) * math.sin(math.radians(min(90.0, lon_gap)))
+        return min(lat_gap * METERS_PER_DEGREE, EARTH_RADIUS_M * math.asin(min(1.0, lon_sin)))
+
+    def nearby(self, latitude: float, longitude: float, radius_m: float, limit: int):
+        # 半径を囲む範囲のマスを中心から1周ずつ調べ、近い順に limit 件を返す
+        dlat = radius_m / METERS_PER_DEGREE
+        # 経度方向は高緯度ほど狭くなるため、範囲の中で最も赤道から遠い緯度で幅を求める
+        max_abs_lat = min(89.9, abs(latitude) + dlat)
+        dlon = min(180.0, dlat / math.cos(math.radians(max_abs_lat)))
+        row_min, col_min = self._cell(latitude - dlat, longitude - dlon)
+        row_max, col_max = self._cell(latitude + dlat, longitude + dlon)
+        row, col = self._cell(latitude, longitude)
+        max_ring = max(row - row_min, row_max - row, col - col_min, col_max - col)
+
+        # 範囲内のマスより屋台のあるマスの方が少なければ、屋台のあるマスだけを周ごとに分ける
+        if (row_max - row_min + 1) * (col_max - col_min + 1) <= len(self._cells):
+            bounds = (row_min, col_min, row_max, col_max)
+            rings = ((ring, self._ring_cells(row, col, ring, bounds)) for ring in range(max_ring + 1))
+        else:
+            by_ring = {}
+            for (cell_row, cell_col), ids in self._cells.items():
+                if row_min <= cell_row <= row_max and col_min <= cell_col <= col_max:
+                    by_ring.setdefault(max(abs(cell_row - row), abs(cell_col - col)), []).append(ids)
+            rings = sorted(by_ring.items())
+
+        # 見つけた中で近い limit 件（先頭が最も遠いものになるよう符号を反転して持つ）
+        found = []
+        for ring, cells in rings:
+            min_distance = self._ring_min_distance(latitude, longitude, row, col, ring)
+            # これより外側の周には、半径内の屋台も今の limit 件目より近い屋台もない
+            if min_distance > radius_m or (len(found) == limit and min_distance > -found[0][0]):
+                break
+            for ids in cells:
+                for id in ids:
+                    point_lat, point_lon, _, document = self._points[id]
+                    distance = distance_m(latitude, longitude, point_lat, point_lon)
+                    if distance > radius_m:
+                        continue
+                    if len(found) < limit:
+                        heapq.heappush(found, (-distance, -id, document))
+                    elif (-distance, -id) > found[0][:2]:
+                        heapq.heapreplace(found, (-distance, -id, document))
+        return [
+            {**document, "distance_m": round(-distance, 1)}
+            for distance, _, document in sorted(found, key=lambda c: (c[0], c[1]), reverse=True)
+        ]
+
+
+geo_index = GridIndex(GEO_CELL_SIZE_M)
+
+
+def _document(id, stall_name, owner_name, thumbnail_URL, latitude, longitude):
+    return {
+        "id": id,
+        "stall_name": stall_name,
+        "owner_name": owner_name,
+        "thumbnail_URL": thumbnail_URL,
+        "latitude": latitude,
+        "longitude": longitude,
+    }
+
+
+def _index_stall(stall):
+    if stall.latitude is None or stall.longitude is None:
+        geo_index.remove(stall.id)
+        return
+    geo_index.add(stall.id, stall.latitude, stall.longitude, _document(
+        stall.id, stall.stall_name, stall.owner_name, stall.thumbnail_URL, stall.latitude, stall.longitude,
+    ))
+
+
+# 起動時にDBから索引を作る
+async def build_geo_index():
+    # 読み込みが終わってから入れ替え、作り直し中も検索に答えられるようにする
+    index = GridIndex(GEO_CELL_SIZE_M)
+    for row in await Stall.get_location_rows():
+        index.add(row.id, row.latitude, row.longitude, _document(*row))
+    geo_index._cells, geo_index._points = index._cells, index._points
+    logger.info(f"Geo index built with {len(geo_index)} stalls")
+
+
+geo_refresher = IndexRefresher("geo index", build_geo_index, GEO_REFRESH_INTERVAL)
+
+
+# 作成・位置やサムネイルを変更した屋台を索引に反映する
+@on_commit("stalls")
+def _index_stalls(stalls):
+    for stall in stalls:
+        _index_stall(stall)
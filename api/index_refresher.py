@@ -0,0 +1,34 @@
+import asyncio
+import logging
+
+from api.database.db import Session
+
+logger = logging.getLogger(__name__)
+
+
+# メモリ上の索引を一定間隔でDBから作り直す（commit時の更新はプロセス内のみのため、他のワーカーでの更新を拾う）
+class IndexRefresher:
+    def __init__(self, name: str, build, interval: float):
+        self.name = name
+        self.build = build
+        self.interval = interval
+        self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.build()
+            except Exception as e:
+                logger.error(f"Failed to refresh {self.name}: {e}")
+            finally:
+                await Session.remove()
+
+    def start(self):
+        if self.interval > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
@@ -0,0 +1,194 @@
+import asyncio
+import json
+import logging
+import os
+from collections import defaultdict
+
+from api.database.db import Session
+from api.database.hooks import on_commit
+from api.database.models import StallRatingStats
+
+logger = logging.getLogger(__name__)
+
+# 同じ話題のイベントを送る最短間隔（この間の更新は1回にまとめる）
+LIVE_EVENT_INTERVAL = float(os.getenv("LIVE_EVENT_INTERVAL", "1"))
+# 他のワーカープロセスでの更新を拾うために再計算する間隔（0で無効）
+LIVE_POLL_INTERVAL = float(os.getenv("LIVE_POLL_INTERVAL", "5"))
+# 接続を維持するためのコメントを送る間隔
+LIVE_KEEPALIVE_INTERVAL = float(os.getenv("LIVE_KEEPALIVE_INTERVAL", "15"))
+
+# SSEのレスポンスをキャッシュ・バッファリングさせない
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+# 話題（ランキング、または ("rating", 屋台id)）
+RANKING = "ranking"
+
+
+def rating_topic(stall_id: int):
+    return ("rating", stall_id)
+
+
+# 平均評価の上位屋台（/reviews/top-ranking と同じ形式）
+async def load_ranking(limit: int = 3, min_count: int = 3):
+    ranking = await StallRatingStats.get_ranking(limit=limit, min_count=min_count)
+    return [
+        {
+            "stall_name": stall.stall_name,
+            "thumbnail_URL": stall.thumbnail_URL,
+            "ownwer_name": stall.owner_name,
+            **StallRatingStats.summarize(stats),
+        }
+        for stall, stats in ranking
+    ]
+
+
+# 話題ごとに最新のスナップショットを1回だけ計算し、接続中の全クライアントに配る
+class LiveFeed:
+    def __init__(self, interval: float, poll_interval: float, keepalive_interval: float):
+        self.interval = interval
+        self.poll_interval = poll_interval
+        self.keepalive_interval = keepalive_interval
+        # 話題 -> クライアントごとのキュー（最新のイベントだけを保持する）
+        self._subscribers = defaultdict(set)
+        # 話題 -> (JSON, SSEのイベント)
+        self._snapshots = {}
+        self._locks = defaultdict(asyncio.Lock)
+        self._dirty = set()
+        self._flush_task = None
+        self._poller = None
+        self._last_flush = 0.0
+        self._version = 0
+
+    def subscriber_count(self):
+        return sum(len(queues) for queues in self._subscribers.values())
+
+    def start(self):
+        if self.poll_interval > 0:
+            self._poller = asyncio.create_task(self._poll())
+
+    async def stop(self):
+        for task in (self._poller, self._flush_task):
+            if task is not None:
+                task.cancel()
+        self._poller = self._flush_task = None
+
+    # 話題の集計が変わった可能性があることを記録し、間隔をあけて再計算する
+    def mark_dirty(self, topics):
+        for topic in topics:
+            if self._subscribers.get(topic):
+                self._dirty.add(topic)
+        if self._dirty and self._flush_task is None:
+            self._flush_task = asyncio.get_running_loop().create_task(self._flush_later())
+
+    async def _flush_later(self):
+        loop = asyncio.get_running_loop()
+        try:
+            await asyncio.sleep(max(0.0, self._last_flush + self.interval - loop.time()))
+            self._last_flush = loop.time()
+            await self._flush()
+        except Exception as e:
+            logger.error(f"Failed to refresh live feed: {e}")
+        finally:
+            self._flush_task = None
+            # 再計算中に届いた更新は次の間隔で送る
+            if self._dirty:
+                self.mark_dirty(())
+
+    async def _flush(self):
+        dirty, self._dirty = self._dirty, set()
+        updates = {}
+        try:
+            if RANKING in dirty:
+                updates[RANKING] = await load_ranking()
+            stall_ids = sorted(topic[1] for topic in dirty if topic != RANKING)
+            # 複数屋台の集計は1回のクエリで取得する
+            for summary in await StallRatingStats.get_summaries(stall_ids):
+                updates[rating_topic(summary["stall_id"])] = summary
+        finally:
+            await Session.remove()
+        for topic, data in updates.items():
+            self._publish(topic, data)
+
+    async def _poll(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            self.mark_dirty(list(self._subscribers))
+
+    def _publish(self, topic, data):
+        subscribers = self._subscribers.get(topic)
+        # 再計算中に全員が切断した話題のスナップショットは残さない（次の購読者が改めて計算する）
+        if not subscribers:
+            return
+        payload = json.dumps(data, ensure_ascii=False)
+        previous = self._snapshots.get(topic)
+        # 集計が変わっていなければ送らない
+        if previous is not None and previous[0] == payload:
+            return
+        self._version += 1
+        name = topic if topic == RANKING else topic[0]
+        event = f"id: {self._version}\nevent: {name}\ndata: {payload}\n\n"
+        self._snapshots[topic] = (payload, event)
+        for queue in subscribers:
+            # 読み出しが遅いクライアントには最新のイベントだけを残す
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(event)
+
+    async def _load(self, topic):
+        try:
+            if topic == RANKING:
+                return await load_ranking()
+            return (await StallRatingStats.get_summaries([topic[1]]))[0]
+        finally:
+            await Session.remove()
+
+    async def _snapshot(self, topic):
+        # 同時に接続したクライアントの初回スナップショットも1回の計算で済ませる
+        async with self._locks[topic]:
+            if topic not in self._snapshots:
+                self._publish(topic, await self._load(topic))
+            return self._snapshots[topic][1]
+
+    # クライアント1件分のSSEを生成する
+    async def stream(self, topic):
+        queue = asyncio.Queue(maxsize=1)
+        self._subscribers[topic].add(queue)
+        try:
+            sent = await self._snapshot(topic)
+            yield sent
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), self.keepalive_interval)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                # 初回に送ったスナップショットと同じイベントは送らない
+                if event != sent:
+                    sent = event
+                    yield event
+        finally:
+            self._subscribers[topic].discard(queue)
+            if not self._subscribers[topic]:
+                # 購読者がいない間は更新を追わないため、古いスナップショットを残さない
+                del self._subscribers[topic]
+                self._snapshots.pop(topic, None)
+                self._locks.pop(topic, None)
+
+
+live_feed = LiveFeed(
+    interval=LIVE_EVENT_INTERVAL,
+    poll_interval=LIVE_POLL_INTERVAL,
+    keepalive_interval=LIVE_KEEPALIVE_INTERVAL,
+)
+
+
+# レビューの作成・削除で該当屋台の集計とランキングが変わる
+@on_commit("reviews")
+def _reviews_committed(reviews):
+    live_feed.mark_dirty([RANKING] + [rating_topic(review.stall_id) for review in reviews])
+
+
+# 屋台名やサムネイルの変更はランキングの表示に影響する
+@on_commit("stalls")
+def _stalls_committed(stalls):
+    live_feed.mark_dirty([RANKING])
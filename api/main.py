@@ -1,9 +1,53 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+import logging
+
+from fastapi import FastAPI, Depends
 from fastapi.middleware.cors import CORSMiddleware
 
-from api.routers import stall, user, review, item, auth
+from api.database.db import remove_session
+from api.database.replicas import ReplicaRoutingMiddleware, replica_monitor
+from api.geo import geo_refresher
+from api.price_index import price_index_refresher
+from api.search import search_refresher
+from api.recommendations import RECOMMEND_JOB, recommendation_job
+from api.live import live_feed
+from api.metrics import MetricsMiddleware
+from api.review_queue import REVIEW_WRITE_BEHIND, review_queue
+from api.routers import stall, stall_detail, user, review, item, auth, internal, search
+from api import warmup
+from api.thumbnails import THUMBNAIL_URL_PREFIX, shutdown_executor as shutdown_thumbnail_executor, thumbnail_files
+
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if REVIEW_WRITE_BEHIND:
+        review_queue.start()
+    live_feed.start()
+    replica_monitor.start()
+    geo_refresher.start()
+    price_index_refresher.start()
+    search_refresher.start()
+    if RECOMMEND_JOB:
+        recommendation_job.start()
+    # 接続プール・検索・位置・価格のインデックス・よく使うクエリを準備してからリクエストを受け付ける
+    await warmup.start(app)
+    yield
+    # 終了時は準備中に戻し、溜まっているレビューを書き込んでから止める
+    await warmup.stop()
+    await review_queue.stop()
+    await live_feed.stop()
+    await replica_monitor.stop()
+    await geo_refresher.stop()
+    await price_index_refresher.stop()
+    await search_refresher.stop()
+    await recommendation_job.stop()
+    shutdown_thumbnail_executor()
 
-app = FastAPI()
+
+# リクエストごとにDBセッションを破棄する
+app = FastAPI(lifespan=lifespan, dependencies=[Depends(remove_session)])
 
 # CORSの設定を追加
 app.add_middleware(
@@ -14,8 +58,20 @@ app.add_middleware(
     allow_headers=["*"],  # すべてのHTTPヘッダーを許可
 )
 
+# ルートごとのレイテンシとSQLの実行数を記録する（/metrics で公開）
+app.add_middleware(MetricsMiddleware)
+
+# DB_REPLICA_URLS を指定した場合、GETの読み取りをレプリカに振り分ける
+app.add_middleware(ReplicaRoutingMiddleware)
+
 app.include_router(stall.router)
+app.include_router(stall_detail.router)
 app.include_router(user.router)
 app.include_router(review.router)
 app.include_router(item.router)
 app.include_router(auth.router)
+app.include_router(internal.router)
+app.include_router(search.router)
+
+# アップロードされたサムネイルの配信
+app.mount(THUMBNAIL_URL_PREFIX, thumbnail_files(), name="thumbnails")
@@ -0,0 +1,177 @@
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextvars import ContextVar
+from dataclasses import dataclass
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# レイテンシ（秒）とリクエストあたりのクエリ数のヒストグラムの区切り
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+# 1リクエストで発行してよいクエリ数（超えると警告をログに出す）
+# 例: QUERY_BUDGETS="GET /reviews/top-ranking=2,GET /stalls/{stall_id}/full=3"
+DEFAULT_QUERY_BUDGET = int(os.getenv("QUERY_BUDGET", "20"))
+
+
+def _parse_budgets(value: str) -> dict:
+    budgets = {}
+    for entry in value.split(","):
+        if not entry.strip():
+            continue
+        route, _, budget = entry.rpartition("=")
+        budgets[route.strip()] = int(budget)
+    return budgets
+
+
+QUERY_BUDGETS = _parse_budgets(os.getenv("QUERY_BUDGETS", ""))
+
+
+@dataclass
+class RequestStats:
+    queries: int = 0
+    db_seconds: float = 0.0
+
+
+# 処理中のリクエストのクエリ数とDB時間（リクエスト外のクエリはNone）
+_request_stats: ContextVar = ContextVar("request_stats", default=None)
+
+
+# 全エンジンのSQL実行を計測する（読み取り用のエンジンが増えても対象になる）
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started_at", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started_at = conn.info["query_started_at"].pop()
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_seconds += time.perf_counter() - started_at
+
+
+@event.listens_for(Engine, "handle_error")
+def _handle_error(exception_context):
+    conn = exception_context.connection
+    if conn is not None and conn.info.get("query_started_at"):
+        _after_cursor_execute(conn, None, None, None, None, False)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        self.latency = defaultdict(lambda: Histogram(LATENCY_BUCKETS))
+        self.query_count = defaultdict(lambda: Histogram(QUERY_COUNT_BUCKETS))
+        self.db_seconds = defaultdict(float)
+        self.responses = defaultdict(int)
+        self.budget_exceeded = defaultdict(int)
+
+    def record(self, method: str, route: str, status: int, seconds: float, stats: RequestStats):
+        key = (method, route)
+        budget = QUERY_BUDGETS.get(f"{method} {route}", DEFAULT_QUERY_BUDGET)
+        with self._lock:
+            self.latency[key].observe(seconds)
+            self.query_count[key].observe(stats.queries)
+            self.db_seconds[key] += stats.db_seconds
+            self.responses[(method, route, str(status))] += 1
+            if stats.queries > budget:
+                self.budget_exceeded[key] += 1
+        if stats.queries > budget:
+            logger.warning(f"{method} {route} issued {stats.queries} queries (budget {budget})")
+
+    # Prometheusのテキスト形式で出力する
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            _render_histogram(lines, "http_request_duration_seconds", "Request latency by route", self.latency)
+            _render_histogram(lines, "http_request_db_queries", "SQL statements per request by route", self.query_count)
+            _render_counter(lines, "http_requests_total", "Responses by route and status", self.responses, ("method", "route", "status"))
+            _render_counter(lines, "http_request_db_seconds_total", "Time spent in SQL statements by route", self.db_seconds)
+            _render_counter(lines, "http_request_query_budget_exceeded_total", "Requests over the query budget by route", self.budget_exceeded)
+        return "\n".join(lines) + "\n"
+
+
+def _labels(names, values) -> str:
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{name}="{value}"')
+    return ",".join(pairs)
+
+
+def _render_counter(lines, name, help, values, label_names=("method", "route")):
+    lines.append(f"# HELP {name} {help}")
+    lines.append(f"# TYPE {name} counter")
+    for key, value in sorted(values.items()):
+        lines.append(f"{name}{{{_labels(label_names, key)}}} {value}")
+
+
+def _render_histogram(lines, name, help, histograms):
+    lines.append(f"# HELP {name} {help}")
+    lines.append(f"# TYPE {name} histogram")
+    for key, histogram in sorted(histograms.items()):
+        labels = _labels(("method", "route"), key)
+        cumulative = 0
+        for bound, count in zip(histogram.buckets, histogram.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+        lines.append(f"{name}_sum{{{labels}}} {histogram.sum}")
+        lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+
+
+metrics = Metrics()
+
+
+# ルートごとのレイテンシ・ステータス・クエリ数を記録するASGIミドルウェア
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        status = 500
+        started_at = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            _request_stats.reset(token)
+            # パスではなくルートのテンプレートで集計する（一致しないパスはまとめる）
+            route = getattr(scope.get("route"), "path", "unmatched")
+            metrics.record(scope["method"], route, status, time.perf_counter() - started_at, stats)
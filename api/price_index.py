@@ -0,0 +1,78 @@
+import logging
+import os
+from bisect import bisect_left, insort
+
+from api.database.hooks import on_commit
+from api.database.models import Item
+from api.index_refresher import IndexRefresher
+
+logger = logging.getLogger(__name__)
+
+# 他のワーカーでの更新を拾うために索引を作り直す間隔（秒、0で無効）
+PRICE_INDEX_REFRESH_INTERVAL = float(os.getenv("PRICE_INDEX_REFRESH_INTERVAL", "60"))
+# 一度にこの件数以上追加する場合は1件ずつ挿入せず、まとめて並べ直す
+PRICE_INDEX_MERGE_THRESHOLD = 64
+
+# 索引が返す行の列
+PRICE_INDEX_COLUMNS = ("stall_id", "item_name", "price", "id")
+
+
+# (price, id) 順に並べた商品の配列。価格の範囲を二分探索で求め、O(log n + k) で返す
+class PriceIndex:
+    def __init__(self):
+        # _keys[i] = (price, id)、_rows[i] = PRICE_INDEX_COLUMNS の順のタプル
+        self._keys = []
+        self._rows = []
+        self.ready = False
+
+    def __len__(self):
+        return len(self._keys)
+
+    def load(self, rows):
+        rows = sorted(rows, key=lambda row: (row[2], row[3]))
+        self._keys = [(row[2], row[3]) for row in rows]
+        self._rows = rows
+        self.ready = True
+
+    def add(self, stall_id: int, item_name: str, price: int, id: int):
+        key = (price, id)
+        position = bisect_left(self._keys, key)
+        if position < len(self._keys) and self._keys[position] == key:
+            self._rows[position] = (stall_id, item_name, price, id)
+            return
+        self._keys.insert(position, key)
+        self._rows.insert(position, (stall_id, item_name, price, id))
+
+    def add_many(self, rows):
+        if len(rows) < PRICE_INDEX_MERGE_THRESHOLD:
+            for row in rows:
+                self.add(*row)
+            return
+        # 既存の配列は並んでいるため、連結して並べ直してもほぼ線形時間で済む
+        merged = {row[3]: row for row in self._rows}
+        merged.update((row[3], tuple(row)) for row in rows)
+        self.load(merged.values())
+
+    def range(self, min_price: int = None, max_price: int = None, limit: int = 50):
+        start = 0 if min_price is None else bisect_left(self._keys, (min_price,))
+        # idは整数のため、(max_price + 1,) より前が max_price 以下の商品
+        end = len(self._keys) if max_price is None else bisect_left(self._keys, (max_price + 1,))
+        return self._rows[start:min(end, start + limit)]
+
+
+price_index = PriceIndex()
+
+
+# 起動時にDBから索引を作る（読み込みが終わってから入れ替える）
+async def build_price_index():
+    price_index.load([(stall_id, item_name, price, id) for id, stall_id, item_name, price in await Item.get_name_rows()])
+    logger.info(f"Price index built with {len(price_index)} items")
+
+
+price_index_refresher = IndexRefresher("price index", build_price_index, PRICE_INDEX_REFRESH_INTERVAL)
+
+
+# 作成された商品を索引に追加する
+@on_commit("items")
+def _index_items(items):
+    price_index.add_many([(item.stall_id, item.item_name, item.price, item.id) for item in items])
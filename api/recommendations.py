@@ -0,0 +1,297 @@
+import argparse
+import asyncio
+import logging
+import os
+import socket
+import sys
+import time
+
+import numpy as np
+from scipy import sparse
+
+from api.database.db import Session, _env_bool, engine
+from api.database.models import JobLease, Review, Stall, StallNeighbor
+
+logger = logging.getLogger(__name__)
+
+# 屋台ごとに保存する似ている屋台の数
+RECOMMEND_TOP_K = int(os.getenv("RECOMMEND_TOP_K", "20"))
+# 共通の評価者が少ない組の類似度を弱める度合い（類似度に n / (n + この値) を掛ける）
+RECOMMEND_SHRINKAGE = float(os.getenv("RECOMMEND_SHRINKAGE", "10"))
+# APIのプロセス内でバックグラウンド処理を行うか（複数のプロセスで有効にしても、リースを持つ1つだけが更新する）
+RECOMMEND_JOB = _env_bool("RECOMMEND_JOB", True)
+# 更新するプロセスが持つリースの期間（秒、更新のたびに延長し、止まったプロセスのリースはこの時間で切れる）
+RECOMMEND_LEASE_SECONDS = int(os.getenv("RECOMMEND_LEASE_SECONDS", "300"))
+# 新しいレビューを取り込んで、影響する屋台だけを再計算する間隔（秒）
+RECOMMEND_REFRESH_INTERVAL = float(os.getenv("RECOMMEND_REFRESH_INTERVAL", "60"))
+# 全件を読み直して再計算する間隔（秒、削除されたレビューはここで反映される）
+RECOMMEND_FULL_REFRESH_INTERVAL = float(os.getenv("RECOMMEND_FULL_REFRESH_INTERVAL", "3600"))
+
+# job_leases の行の名前
+RECOMMEND_LEASE_NAME = "recommendations"
+
+# 評価の中間値（これより高い評価は似ている屋台を薦め、低い評価は遠ざける）
+RATING_MIDPOINT = 3.0
+RATING_HALF_RANGE = 2.0
+
+
+# ユーザー×屋台の評価（同じ屋台への複数のレビューは平均する）
+class RatingMatrix:
+    def __init__(self):
+        # (user_id, stall_id) -> [評価の合計, 件数]
+        self._ratings = {}
+        self._stalls_by_user = {}
+        self._users_by_stall = {}
+        self.last_review_id = 0
+
+    def __len__(self):
+        return len(self._ratings)
+
+    def add(self, rows):
+        # (id, user_id, stall_id, rating) を取り込み、評価が変わったユーザーの集合を返す
+        users = set()
+        if rows:
+            # 行は id 順に渡される
+            self.last_review_id = max(self.last_review_id, rows[-1][0])
+        for id, user_id, stall_id, rating in rows:
+            entry = self._ratings.setdefault((user_id, stall_id), [0, 0])
+            entry[0] += rating
+            entry[1] += 1
+            self._stalls_by_user.setdefault(user_id, set()).add(stall_id)
+            self._users_by_stall.setdefault(stall_id, set()).add(user_id)
+            users.add(user_id)
+        return users
+
+    def stalls_of(self, users):
+        return set().union(*(self._stalls_by_user.get(user_id, ()) for user_id in users))
+
+    def users_of(self, stalls):
+        return set().union(*(self._users_by_stall.get(stall_id, ()) for stall_id in stalls))
+
+    def build(self):
+        # (平均との差の行列, 評価の有無の行列, 屋台idの配列) を返す（行がユーザー、列が屋台の疎行列）
+        keys = np.array(list(self._ratings), dtype=np.int64).reshape(-1, 2)
+        totals = np.array(list(self._ratings.values()), dtype=np.float64).reshape(-1, 2)
+        users, user_index = np.unique(keys[:, 0], return_inverse=True)
+        stall_ids, stall_index = np.unique(keys[:, 1], return_inverse=True)
+        ratings = totals[:, 0] / totals[:, 1]
+        # ユーザーごとの評価の甘さ・辛さを取り除く（調整コサイン類似度）
+        user_means = np.bincount(user_index, weights=ratings, minlength=len(users)) / np.bincount(
+            user_index, minlength=len(users)
+        )
+        shape = (len(users), len(stall_ids))
+        centered = sparse.csc_matrix((ratings - user_means[user_index], (user_index, stall_index)), shape=shape)
+        rated = sparse.csc_matrix((np.ones(len(ratings)), (user_index, stall_index)), shape=shape)
+        return centered, rated, stall_ids
+
+
+def compute_neighbors(centered, rated, stall_ids, targets=None, top_k: int = 20, shrinkage: float = 10.0):
+    # targets（屋台idの配列、Noneは全件）の各屋台について、類似度が正の上位 top_k 件を返す
+    # 戻り値は stall_id -> [(neighbor_id, score), ...]（類似度の高い順）
+    if targets is None:
+        columns = np.arange(len(stall_ids))
+    else:
+        columns = np.flatnonzero(np.isin(stall_ids, targets))
+    norms = np.sqrt(np.asarray(centered.multiply(centered).sum(axis=0)).ravel())
+    inverse_norms = np.divide(1.0, norms, out=np.zeros_like(norms), where=norms > 0)
+
+    # 類似度 = 内積 / (ノルムの積) × 共通の評価者数による縮小
+    dots = (centered[:, columns].T @ centered).tocsr()
+    dots = sparse.diags(inverse_norms[columns]) @ dots @ sparse.diags(inverse_norms)
+    shared = (rated[:, columns].T @ rated).tocsr()
+    shared.data = shared.data / (shared.data + shrinkage)
+    similarities = dots.multiply(shared).tocsr()
+
+    neighbors = {}
+    for row, column in enumerate(columns):
+        start, end = similarities.indptr[row], similarities.indptr[row + 1]
+        indices = similarities.indices[start:end]
+        scores = similarities.data[start:end]
+        keep = (indices != column) & (scores > 0)
+        indices, scores = indices[keep], scores[keep]
+        if len(scores) > top_k:
+            best = np.argpartition(-scores, top_k)[:top_k]
+            indices, scores = indices[best], scores[best]
+        order = np.argsort(-scores, kind="stable")
+        neighbors[int(stall_ids[column])] = [
+            (int(stall_ids[index]), round(float(score), 6)) for index, score in zip(indices[order], scores[order])
+        ]
+    return neighbors
+
+
+# 似ている屋台の表を作り、新しいレビューが入るたびに影響する屋台だけを作り直す
+class RecommendationJob:
+    def __init__(self, interval: float, full_interval: float, top_k: int, shrinkage: float, lease_seconds: int):
+        self.interval = interval
+        self.full_interval = full_interval
+        self.top_k = top_k
+        self.shrinkage = shrinkage
+        self.lease_seconds = lease_seconds
+        self.matrix = RatingMatrix()
+        self._last_full = None
+        self._task = None
+        self._status = {}
+
+    async def _load(self, matrix: RatingMatrix):
+        users = set()
+        async for rows in Review.iter_rating_batches(after_id=matrix.last_review_id):
+            users |= matrix.add(rows)
+        return users
+
+    async def _compute(self, targets=None):
+        matrix = self.matrix
+        if not len(matrix):
+            return {}
+        # 行列の計算はイベントループを止めないよう別スレッドで行う
+        def run():
+            centered, rated, stall_ids = matrix.build()
+            target_ids = None if targets is None else np.array(sorted(targets), dtype=np.int64)
+            return compute_neighbors(centered, rated, stall_ids, target_ids, self.top_k, self.shrinkage)
+        return await asyncio.to_thread(run)
+
+    async def refresh_full(self):
+        started = time.perf_counter()
+        matrix = RatingMatrix()
+        await self._load(matrix)
+        self.matrix = matrix
+        neighbors = await self._compute()
+        if not await StallNeighbor.replace(neighbors, clear=True):
+            raise RuntimeError("failed to write stall neighbors")
+        self._last_full = time.monotonic()
+        self._record("full", len(neighbors), started)
+
+    async def refresh(self):
+        # 前回以降のレビューを取り込む（id順に読むため、採番より後にcommitされたレビューは次の全件再計算で反映される）
+        started = time.perf_counter()
+        users = await self._load(self.matrix)
+        if not users:
+            return
+        # 評価したユーザーの平均が変わるため、そのユーザーが評価した屋台の列がすべて変わり、
+        # それらの屋台と共通の評価者を持つ屋台の類似度も変わる
+        changed = self.matrix.stalls_of(users)
+        affected = self.matrix.stalls_of(self.matrix.users_of(changed))
+        neighbors = await self._compute(affected)
+        # 評価されている屋台が類似度を持たなくなった場合も古い行を消す
+        neighbors = {stall_id: neighbors.get(stall_id, []) for stall_id in affected}
+        if not await StallNeighbor.replace(neighbors):
+            raise RuntimeError("failed to write stall neighbors")
+        self._record("incremental", len(neighbors), started)
+
+    def _record(self, kind: str, stalls: int, started: float):
+        self._status = {
+            "leader": True,
+            "last_refresh": kind,
+            "stalls": stalls,
+            "ratings": len(self.matrix),
+            "last_review_id": self.matrix.last_review_id,
+            "seconds": round(time.perf_counter() - started, 3),
+            "finished_at": time.time(),
+        }
+        logger.info(f"Recommendation {kind} refresh updated {stalls} stalls in {self._status['seconds']}s")
+
+    @property
+    def owner(self):
+        # gunicornはアプリを読み込んだ後にforkするため、プロセスidは呼び出すたびに求める
+        return f"{socket.gethostname()}:{os.getpid()}"
+
+    async def run_once(self):
+        try:
+            if not await JobLease.acquire(RECOMMEND_LEASE_NAME, self.owner, self.lease_seconds):
+                # 他のプロセスが更新している。後でリースを取得した場合は全件から計算し直す
+                self._last_full = None
+                self._status["leader"] = False
+                return
+            self._status["leader"] = True
+            if self._last_full is None or time.monotonic() - self._last_full >= self.full_interval:
+                await self.refresh_full()
+            else:
+                await self.refresh()
+        except Exception as e:
+            self._status["error"] = str(e)
+            logger.error(f"Recommendation refresh failed: {e}")
+        finally:
+            await Session.remove()
+
+    async def _run(self):
+        while True:
+            await self.run_once()
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self.interval > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def status(self):
+        return {"running": self._task is not None, **self._status}
+
+
+recommendation_job = RecommendationJob(
+    interval=RECOMMEND_REFRESH_INTERVAL,
+    full_interval=RECOMMEND_FULL_REFRESH_INTERVAL,
+    top_k=RECOMMEND_TOP_K,
+    shrinkage=RECOMMEND_SHRINKAGE,
+    lease_seconds=RECOMMEND_LEASE_SECONDS,
+)
+
+
+# ユーザーの評価と似ている屋台の表から、まだ評価していない屋台を薦める
+# 各屋台のスコアは (似ている度合い) と (評価した屋台への評価を -1〜1 にしたもの) の内積
+async def recommend(user_id: int, limit: int = 10):
+    ratings = await Review.get_user_ratings(user_id)
+    if not ratings:
+        return []
+    # 同じ屋台への複数のレビューは平均し、-1〜1 にする
+    totals = {}
+    for stall_id, rating in ratings:
+        total = totals.setdefault(stall_id, [0, 0])
+        total[0] += rating
+        total[1] += 1
+    rated = {stall_id: (total / count - RATING_MIDPOINT) / RATING_HALF_RANGE for stall_id, (total, count) in totals.items()}
+    rows = [row for row in await StallNeighbor.get_for_stalls(list(rated)) if row[1] not in rated]
+    if not rows:
+        return []
+    sources, candidates, similarities = zip(*rows)
+    candidate_ids, candidate_index = np.unique(np.array(candidates, dtype=np.int64), return_inverse=True)
+    weights = np.array([rated[stall_id] for stall_id in sources]) * np.array(similarities)
+    scores = np.bincount(candidate_index, weights=weights, minlength=len(candidate_ids))
+    best = [index for index in np.argsort(-scores, kind="stable")[:limit] if scores[index] > 0]
+    if not best:
+        return []
+    columns = ["id", "stall_name", "owner_name", "thumbnail_URL"]
+    stalls = {row[0]: row for row in await Stall.get_rows_by_ids(columns, [int(candidate_ids[i]) for i in best])}
+    return [
+        {**dict(zip(columns, stalls[int(candidate_ids[index])])), "score": round(float(scores[index]), 4)}
+        for index in best
+        if int(candidate_ids[index]) in stalls
+    ]
+
+
+# 似ている屋台の表を作るコマンド（--watch で定期的な更新を続ける）
+# 使い方: poetry run python -m api.recommendations [--watch]
+async def main(argv=None):
+    parser = argparse.ArgumentParser(description="屋台の推薦に使う似ている屋台の表を作成する")
+    parser.add_argument("--watch", action="store_true", help="RECOMMEND_REFRESH_INTERVAL ごとに更新を続ける")
+    args = parser.parse_args(argv)
+    if args.watch and recommendation_job.interval <= 0:
+        parser.error("--watch requires RECOMMEND_REFRESH_INTERVAL > 0")
+    logging.basicConfig(level=logging.INFO)
+    try:
+        if args.watch:
+            await recommendation_job._run()
+        await recommendation_job.refresh_full()
+        return 0
+    except Exception as e:
+        logger.error(f"stall_neighbors の作成に失敗しました: {e}")
+        return 1
+    finally:
+        await Session.remove()
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,75 @@
+import hashlib
+import os
+
+from fastapi import Request, Response
+
+from api.cache import LRUCache
+from api.database.db import replica_engines, use_replica
+from api.database.hooks import on_commit
+
+# 一覧系レスポンスのキャッシュ設定
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "1024"))
+# commitによる無効化はプロセス内のみなので、他のワーカーでの更新はTTLで反映する
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "10"))
+
+# テーブル名 -> レスポンスのキャッシュ（キー: パスとクエリ、値: (ETag, 本文)）
+_caches = {
+    table: LRUCache(maxsize=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL)
+    for table in ("stalls", "items")
+}
+# 無効化の世代（生成中に無効化されたレスポンスをキャッシュしないため）
+_generations = {table: 0 for table in _caches}
+
+
+def invalidate(table: str):
+    _generations[table] += 1
+    _caches[table].clear()
+
+
+@on_commit("stalls")
+def _invalidate_stalls(objects):
+    invalidate("stalls")
+
+
+@on_commit("items")
+def _invalidate_items(objects):
+    invalidate("items")
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match is None:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [value.strip() for value in if_none_match.split(",")]
+    return etag in candidates or f"W/{etag}" in candidates
+
+
+def _reads_primary() -> bool:
+    # レプリカを使う構成で、書き込み直後などでプライマリに固定されたリクエストか
+    return bool(replica_engines) and not use_replica.get()
+
+
+# tableのデータから作られるJSONレスポンスをETag付きでキャッシュする
+# build はシリアライズ済みのJSON（bytes）を返すコルーチン関数
+async def cached_json_response(request: Request, table: str, build):
+    cache = _caches[table]
+    key = (request.url.path, tuple(sorted(request.query_params.multi_items())))
+    # キャッシュは遅れたレプリカから作られている場合があるため、プライマリに固定されたリクエストでは読まない
+    # （プライマリから作った本文は最新なので保存する）
+    entry = None if _reads_primary() else cache.get(key)
+    if entry is None:
+        generation = _generations[table]
+        body = await build()
+        entry = ('"' + hashlib.sha256(body).hexdigest()[:32] + '"', body)
+        if generation == _generations[table]:
+            cache.set(key, entry)
+    etag, body = entry
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def cache_stats():
+    return {table: cache.stats() for table, cache in _caches.items()}
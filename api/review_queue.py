@@ -0,0 +1,128 @@
+import asyncio
+import logging
+import os
+
+from api.database.db import Session, _env_bool
+from api.database.models import Review
+
+logger = logging.getLogger(__name__)
+
+# レビューをまとめて書き込むモード（無効の場合は1件ずつcommitする）
+REVIEW_WRITE_BEHIND = _env_bool("REVIEW_WRITE_BEHIND", False)
+# 待ち行列の上限（超えた場合は503を返す）
+REVIEW_QUEUE_MAX_SIZE = int(os.getenv("REVIEW_QUEUE_MAX_SIZE", "1000"))
+# 1回の書き込みでまとめる件数と、最初の1件から書き込むまでの最大待ち時間
+REVIEW_BATCH_SIZE = int(os.getenv("REVIEW_BATCH_SIZE", "100"))
+REVIEW_FLUSH_INTERVAL_MS = int(os.getenv("REVIEW_FLUSH_INTERVAL_MS", "50"))
+
+
+class QueueFullError(Exception):
+    pass
+
+
+# 検証済みのレビューを溜め、複数行INSERTでまとめて書き込む
+class ReviewWriteQueue:
+    def __init__(self, maxsize: int, batch_size: int, flush_interval: float):
+        self.maxsize = maxsize
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = None
+        self._worker = None
+        self._closing = False
+        self.enqueued = 0
+        self.written = 0
+        self.failed = 0
+        self.rejected = 0
+        self.batches = 0
+
+    @property
+    def running(self):
+        return self._worker is not None and not self._closing
+
+    def start(self):
+        self._queue = asyncio.Queue(maxsize=self.maxsize)
+        self._closing = False
+        self._worker = asyncio.create_task(self._run())
+
+    def submit(self, row: dict):
+        if not self.running:
+            raise QueueFullError("Review queue is not running")
+        try:
+            self._queue.put_nowait(row)
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise QueueFullError("Review queue is full")
+        self.enqueued += 1
+
+    # 受け付けを止め、溜まっているレビューを書き込んでから終了する
+    async def stop(self):
+        if self._worker is None:
+            return
+        self._closing = True
+        await self._queue.join()
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+
+    async def _collect(self):
+        # 最初の1件が届いてから batch_size 件または flush_interval 秒まで待つ
+        batch = [await self._queue.get()]
+        deadline = asyncio.get_running_loop().time() + self.flush_interval
+        while len(batch) < self.batch_size:
+            timeout = deadline - asyncio.get_running_loop().time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            try:
+                await self._flush(batch)
+            except Exception as e:
+                self.failed += len(batch)
+                logger.error(f"Failed to flush {len(batch)} reviews: {e}")
+            finally:
+                await Session.remove()
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _flush(self, batch):
+        self.batches += 1
+        if await Review.create_many(batch) is not None:
+            self.written += len(batch)
+            return
+        # 存在しない屋台へのレビューなどが混ざっている場合は1件ずつ書き込み、失敗した行だけを捨てる
+        for row in batch:
+            if await Review.create(**row) is None:
+                self.failed += 1
+            else:
+                self.written += 1
+
+    def stats(self):
+        return {
+            "enabled": self.running,
+            "depth": self._queue.qsize() if self._queue is not None else 0,
+            "maxsize": self.maxsize,
+            "batch_size": self.batch_size,
+            "flush_interval_ms": round(self.flush_interval * 1000),
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "batches": self.batches,
+        }
+
+
+review_queue = ReviewWriteQueue(
+    maxsize=REVIEW_QUEUE_MAX_SIZE,
+    batch_size=REVIEW_BATCH_SIZE,
+    flush_interval=REVIEW_FLUSH_INTERVAL_MS / 1000,
+)
@@ -2,9 +2,20 @@ from fastapi import FastAPI, Depends, HTTPException, APIRouter, status
 from fastapi.security import OAuth2PasswordRequestForm, OAuth2PasswordBearer
 from pydantic import BaseModel
 from jose import JWTError, jwt
+from dataclasses import dataclass
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session as OrmSession, object_session
+from api.cache import LRUCache
 from api.database.models import User
 from passlib.context import CryptContext
+from passlib.exc import MissingBackendError
+from passlib.registry import get_crypt_handler
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import hmac
 import logging
+import os
+import re
 
 logger = logging.getLogger(__name__)
 
@@ -13,7 +24,52 @@ router = APIRouter()
 SECRET_KEY = "your-secret-key"
 ALGORITHM = "HS256"
 
+# 認証済みユーザーのキャッシュ（ユーザー名 -> Principal）
+# ワーカープロセスごとに保持するため、他プロセスでの変更はTTLで反映される
+principal_cache = LRUCache(
+    maxsize=int(os.getenv("AUTH_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("AUTH_CACHE_TTL", "60")),
+)
 
+# パスワードハッシュの設定（コストは PASSWORD_HASH_ROUNDS で調整する）
+PASSWORD_HASH_SCHEME = os.getenv("PASSWORD_HASH_SCHEME", "pbkdf2_sha256")
+PASSWORD_HASH_ROUNDS = os.getenv("PASSWORD_HASH_ROUNDS")
+
+
+# bcrypt・argon2 などは別のパッケージが必要なため、実装が入っているかを調べる
+def _has_backend(scheme: str) -> bool:
+    has_backend = getattr(get_crypt_handler(scheme), "has_backend", None)
+    return has_backend is None or has_backend()
+
+
+# 以前に使っていた可能性のあるハッシュ方式（照合はでき、次回ログイン時に PASSWORD_HASH_SCHEME で保存し直す）
+# 実装が入っていない方式は除く（その方式のハッシュは照合できない形式としてログインを失敗させる）
+PASSWORD_HASH_LEGACY_SCHEMES = [
+    scheme
+    for scheme in (scheme.strip() for scheme in os.getenv(
+        "PASSWORD_HASH_LEGACY_SCHEMES",
+        "pbkdf2_sha256,pbkdf2_sha512,sha256_crypt,sha512_crypt,bcrypt,bcrypt_sha256,argon2,scrypt",
+    ).split(","))
+    if scheme and scheme != PASSWORD_HASH_SCHEME and _has_backend(scheme)
+]
+pwd_context = CryptContext(
+    # 先頭の方式でハッシュ化し、それ以外は deprecated として扱う
+    schemes=[PASSWORD_HASH_SCHEME, *PASSWORD_HASH_LEGACY_SCHEMES],
+    deprecated="auto",
+    **({f"{PASSWORD_HASH_SCHEME}__rounds": int(PASSWORD_HASH_ROUNDS)} if PASSWORD_HASH_ROUNDS else {}),
+)
+
+# ハッシュ計算はイベントループを止めないよう専用のスレッドプールで行う
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+# 待ち行列の上限（超えた場合は503を返す）
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "64"))
+# 一括作成で1回のジョブにまとめてハッシュ化する件数（ジョブごとに待ち行列を通し、ログインを長く待たせない）
+PASSWORD_HASH_BULK_CHUNK_SIZE = 8
+_hash_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+_hash_pending = 0
+
+# passlibの設定にない方式も含め、ハッシュらしい形式（$scheme$... や {SCHEME}...）の値
+_HASH_LIKE_PATTERN = re.compile(r"^(\$[a-z0-9_-]+\$|\{[A-Z0-9_-]+\})")
 
 # トークンURLの設定
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
@@ -22,25 +78,121 @@ class Token(BaseModel):
     access_token: str
     token_type: str
 
-def verify_password(plain_password, stored_password):
-    # パスワードを直接比較
-    return plain_password == stored_password
+# リクエスト処理で使うユーザー情報（ORMオブジェクトの代わりにキャッシュする）
+@dataclass(frozen=True)
+class Principal:
+    id: int
+    username: str
+    email: str
+
+async def get_principal(username: str):
+    principal = principal_cache.get(username)
+    if principal is None:
+        user = await User.get_by_username(username)
+        if user is None:
+            return None
+        principal = Principal(id=user.id, username=user.username, email=user.email)
+        principal_cache.set(username, principal)
+    return principal
+
+def invalidate_principal(username: str):
+    principal_cache.delete(username)
+
+# ユーザーの更新・削除はcommit後にキャッシュから取り除く
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _collect_changed_user(mapper, connection, target):
+    session = object_session(target)
+    if session is None:
+        principal_cache.clear()
+        return
+    changed = session.info.setdefault("changed_usernames", set())
+    changed.add(target.username)
+    # ユーザー名が変更された場合は変更前の名前も対象にする
+    changed.update(inspect(target).attrs.username.history.deleted)
+
+@event.listens_for(OrmSession, "after_bulk_update")
+@event.listens_for(OrmSession, "after_bulk_delete")
+def _collect_bulk_user_change(context):
+    if context.mapper.class_ is User:
+        context.session.info["clear_principals"] = True
 
-def get_password_hash(password):
-    # ハッシュ化せずそのまま返す（今後ハッシュ化しない）
-    return password
+@event.listens_for(OrmSession, "after_commit")
+def _invalidate_changed_users(session):
+    if session.info.pop("clear_principals", False):
+        principal_cache.clear()
+    for username in session.info.pop("changed_usernames", ()):
+        invalidate_principal(username)
 
-def verify_token(token: str):
+@event.listens_for(OrmSession, "after_rollback")
+def _discard_changed_users(session):
+    session.info.pop("clear_principals", None)
+    session.info.pop("changed_usernames", None)
+
+async def _run_hash_job(func, *args):
+    global _hash_pending
+    if _hash_pending >= PASSWORD_HASH_MAX_PENDING:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many password hashing requests",
+            headers={"Retry-After": "1"},
+        )
+    _hash_pending += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_hash_executor, func, *args)
+    finally:
+        _hash_pending -= 1
+
+def _verify_and_update(plain_password, stored_password):
+    if pwd_context.identify(stored_password, required=False) is None:
+        if _HASH_LIKE_PATTERN.match(stored_password):
+            # 照合できない方式のハッシュを平文として比べない
+            logger.warning("Stored password uses an unknown hash scheme")
+            return False, None
+        # ハッシュ化される前に登録された平文のパスワード
+        if not hmac.compare_digest(plain_password.encode(), stored_password.encode()):
+            return False, None
+        return True, pwd_context.hash(plain_password)
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
+        return pwd_context.verify_and_update(plain_password, stored_password)
+    except MissingBackendError as e:
+        # 実装が使えなくなった方式のハッシュは照合の失敗として扱う（500にしない）
+        logger.error(f"Cannot verify password hash: {e}")
+        return False, None
+
+async def verify_password(plain_password, stored_password):
+    # (一致したか, 保存し直すハッシュ) を返す
+    # 平文やコストが変わったハッシュは新しいハッシュを返すので、呼び出し元で保存する
+    return await _run_hash_job(_verify_and_update, plain_password, stored_password)
+
+async def get_password_hash(password):
+    return await _run_hash_job(pwd_context.hash, password)
+
+def _hash_all(passwords):
+    return [pwd_context.hash(password) for password in passwords]
+
+async def get_password_hashes(passwords):
+    # 一括作成用（PASSWORD_HASH_BULK_CHUNK_SIZE 件ずつ待ち行列に入れる）
+    hashes = []
+    for start in range(0, len(passwords), PASSWORD_HASH_BULK_CHUNK_SIZE):
+        hashes += await _run_hash_job(_hash_all, passwords[start:start + PASSWORD_HASH_BULK_CHUNK_SIZE])
+    return hashes
+
+def decode_subject(token: str):
+    # トークンからユーザー名を取り出す（不正なトークンはJWTError）
+    payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    return payload.get("sub")
+
+async def verify_token(token: str):
+    try:
+        username = decode_subject(token)
         if username is None:
             raise HTTPException(status_code=401, detail="Invalid token")
-        return User.get_by_username(username)
+        return await get_principal(username)
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
-def get_current_user(token: str = Depends(oauth2_scheme)):
+async def get_current_user(token: str = Depends(oauth2_scheme)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -48,11 +200,10 @@ def get_current_user(token: str = Depends(oauth2_scheme)):
     )
     
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
+        username = decode_subject(token)
         if username is None:
             raise credentials_exception
-        user = User.get_by_username(username)
+        user = await get_principal(username)
         if user is None:
             raise credentials_exception
     except JWTError:
@@ -61,9 +212,15 @@ def get_current_user(token: str = Depends(oauth2_scheme)):
 
 @router.post("/token", response_model=Token)
 async def login(form_data: OAuth2PasswordRequestForm = Depends()):
-    user = User.get_by_username(form_data.username)
-    if not user or not verify_password(form_data.password, user.password):
+    user = await User.get_by_username(form_data.username)
+    if not user:
+        raise HTTPException(status_code=400, detail="Incorrect username or password")
+    is_valid, new_hash = await verify_password(form_data.password, user.password)
+    if not is_valid:
         raise HTTPException(status_code=400, detail="Incorrect username or password")
+    if new_hash:
+        # 平文や古い設定のハッシュはログイン時に保存し直す
+        await User.update_password(user.id, new_hash)
 
     # JWTトークンの発行
     token = jwt.encode({"sub": form_data.username}, SECRET_KEY, algorithm=ALGORITHM)
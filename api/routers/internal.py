@@ -0,0 +1,69 @@
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse, PlainTextResponse
+
+from api.database.db import engine
+from api.database.pool import pool_status
+from api.database.replicas import replica_monitor
+from api.live import live_feed
+from api.metrics import metrics
+from api.recommendations import recommendation_job
+from api.response_cache import cache_stats
+from api.review_queue import review_queue
+from api.routers.auth import principal_cache
+from api.warmup import readiness
+
+router = APIRouter()
+
+
+# コネクションプールの利用状況（使用中・待機中・オーバーフロー数、接続取得の待ち時間）
+@router.get("/internal/db-pool", include_in_schema=False)
+async def get_db_pool_status():
+    return pool_status(engine.pool)
+
+
+# レプリカの振り分け状態（遅延・障害で外れているか）
+@router.get("/internal/db-replicas", include_in_schema=False)
+async def get_db_replica_status():
+    return replica_monitor.status()
+
+
+# 認証済みユーザーキャッシュのヒット・ミス数
+@router.get("/internal/auth-cache", include_in_schema=False)
+async def get_auth_cache_status():
+    return principal_cache.stats()
+
+
+# 一覧系レスポンスキャッシュのヒット・ミス数
+@router.get("/internal/response-cache", include_in_schema=False)
+async def get_response_cache_status():
+    return cache_stats()
+
+
+# レビューの書き込み待ち行列の長さと書き込み件数
+@router.get("/internal/review-queue", include_in_schema=False)
+async def get_review_queue_status():
+    return review_queue.stats()
+
+
+# SSEの接続数
+@router.get("/internal/live", include_in_schema=False)
+async def get_live_feed_status():
+    return {"subscribers": live_feed.subscriber_count()}
+
+
+# 推薦に使う似ている屋台の表の更新状況
+@router.get("/internal/recommendations", include_in_schema=False)
+async def get_recommendation_status():
+    return recommendation_job.status()
+
+
+# ルートごとのレイテンシ・ステータス・クエリ数（Prometheusのテキスト形式）
+@router.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+# 起動時のウォームアップが終わっていれば200、準備中は503を返す（ロードバランサーの振り分け判定用）
+@router.get("/ready", include_in_schema=False)
+async def get_readiness():
+    return JSONResponse(readiness.status(), status_code=200 if readiness.ready else 503)
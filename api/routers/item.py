@@ -1,8 +1,13 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session
-from typing import List
-from api.database.models import Item  # 屋台モデル
+from typing import List, Optional
+from api.database.models import Item, Stall  # 屋台モデル
+from api.database.pagination import DEFAULT_LIMIT, MAX_LIMIT, InvalidCursorError
+from api.response_cache import cached_json_response
+from api.price_index import PRICE_INDEX_COLUMNS, price_index
+from api.serialization import encode_page, page_response
+from api.bulk import read_bulk_rows, validate_rows
 from pydantic import BaseModel
 
 router = APIRouter()
@@ -25,27 +30,94 @@ class ItemResponse(ItemBase):
     class Config:
         from_attributes = True  # Pydantic v2 でORM対応
 
+
+class ItemPage(BaseModel):
+    items: List[ItemResponse]
+    next_cursor: Optional[str] = None
+
+
+# 一覧で返す列（ItemResponse と同じ順番）
+ITEM_COLUMNS = list(ItemResponse.model_fields)
+
 # 商品の作成エンドポイント
 @router.post("/items/")
-def create_item(item: ItemCreate):
-    return JSONResponse({'is_success': Item.create(stall_id=item.stall_id, item_name=item.item_name, price=item.price)})
+async def create_item(item: ItemCreate):
+    return JSONResponse({'is_success': await Item.create(stall_id=item.stall_id, item_name=item.item_name, price=item.price)})
+
+# 存在しない屋台を指定した行を行ごとのエラーとして返す（rows は (入力での位置, 行) のリスト）
+async def find_unknown_stalls(rows: list):
+    stall_ids = await Stall.get_existing_ids([item.stall_id for _, item in rows])
+    return [
+        {
+            "index": index,
+            "errors": [{"loc": ["stall_id"], "msg": "Stall not found", "type": "not_found", "input": item.stall_id}],
+        }
+        for index, item in rows if item.stall_id not in stall_ids
+    ]
+
+# 商品の一括作成エンドポイント（JSON配列またはNDJSON）
+@router.post("/items/bulk")
+async def create_items_bulk(request: Request):
+    rows, errors = validate_rows(await read_bulk_rows(request), ItemCreate)
+    if not errors:
+        errors = await find_unknown_stalls(rows)
+    if errors:
+        return JSONResponse({'is_success': False, 'errors': errors}, status_code=422)
+    ids = await Item.create_many([item.model_dump() for _, item in rows])
+    if ids is None:
+        # 確認後に屋台が削除された場合は外部キーの違反で失敗するため、改めて屋台を調べる
+        errors = await find_unknown_stalls(rows)
+        if errors:
+            return JSONResponse({'is_success': False, 'errors': errors}, status_code=422)
+        return JSONResponse({'is_success': False, 'ids': []}, status_code=500)
+    return JSONResponse({'is_success': True, 'ids': ids})
 
 # 商品リスト取得エンドポイント
-@router.get("/items/", response_model=List[ItemResponse])
-def get_item():
+@router.get("/items/", response_model=ItemPage)
+async def get_item(request: Request, limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT), cursor: Optional[str] = None):
+    async def build():
+        # Itemテーブルから1ページ分のレコードを取得
+        rows, next_cursor = await Item.get_list_rows(ITEM_COLUMNS, limit=limit, cursor=cursor)
+        return encode_page(ITEM_COLUMNS, rows, next_cursor)
+
+    try:
+        return await cached_json_response(request, "items", build)
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# 価格の範囲で商品を検索するエンドポイント（/items/{stall_id} より前に定義する）
+# 例: /items/search?max_price=500&sort=price （500円以下を安い順）
+# 価格順はメモリ上の価格順の配列から、作成順は items から取得する
+@router.get("/items/search", response_model=ItemPage)
+async def search_items(
+    min_price: Optional[int] = Query(None, ge=0),
+    max_price: Optional[int] = Query(None, ge=0),
+    sort: str = Query("price", pattern="^(price|created_at)$"),
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+):
+    if min_price is not None and max_price is not None and min_price > max_price:
+        raise HTTPException(status_code=400, detail="min_price must not be greater than max_price")
+    if sort == "price" and price_index.ready:
+        return page_response(PRICE_INDEX_COLUMNS, price_index.range(min_price, max_price, limit))
     try:
-        # Itemテーブルから全レコードを取得
-        items = Item.get_list()
-        return items
+        rows = await Item.search_rows(ITEM_COLUMNS, min_price=min_price, max_price=max_price, sort=sort, limit=limit)
+        return page_response(ITEM_COLUMNS, rows)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # 店idから商品リストを取得
-@router.get("/items/{stall_id}", response_model=List[ItemResponse])
-def get_item_by_stall_id(stall_id: int):
+@router.get("/items/{stall_id}", response_model=ItemPage)
+async def get_item_by_stall_id(request: Request, stall_id: int, limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT), cursor: Optional[str] = None):
+    async def build():
+        # Itemテーブルから1ページ分のレコードを取得
+        rows, next_cursor = await Item.get_list_rows(ITEM_COLUMNS, stall_id=stall_id, limit=limit, cursor=cursor)
+        return encode_page(ITEM_COLUMNS, rows, next_cursor)
+
     try:
-        # Itemテーブルから全レコードを取得
-        items = Item.get_list_by_stall_id(stall_id=stall_id)
-        return items
+        return await cached_json_response(request, "items", build)
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
@@ -1,17 +1,35 @@
-from fastapi import APIRouter, Depends, HTTPException, Request, Header, Body
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, Depends, HTTPException, Request, Header, Body, Query
+from fastapi.responses import JSONResponse, StreamingResponse
 from sqlalchemy.orm import Session
-from typing import List
-from api.database.models import Review, User, Stall # 屋台モデル
+from typing import List, Optional
+from datetime import datetime
+import csv
+import io
+import json
+from api.database.models import Review, ReviewRollup, User, Stall, StallRatingStats # 屋台モデル
+from api.database.pagination import DEFAULT_LIMIT, MAX_LIMIT, InvalidCursorError
+from api.serialization import page_response
 from api.routers.stall import StallResponse, StallBase
 from pydantic import BaseModel, Field
-from api.routers.auth import get_current_user
+from api.routers.auth import Principal, get_current_user
+from api.review_queue import QueueFullError, review_queue
+from api.live import RANKING, SSE_HEADERS, live_feed, load_ranking
 import logging
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+# 一括取得できる屋台数の上限
+MAX_BATCH_STALL_IDS = 500
+
+# エクスポートで1回に読み込む行数
+EXPORT_BATCH_SIZE = 1000
+EXPORT_COLUMNS = ["id", "stall_id", "user_id", "rating", "comment", "created_at"]
+
+# 時間帯ごとの集計で1回に返す区切りの上限
+MAX_STATS_BUCKETS = 1000
+
 # Pydanticスキーマ
 # Reviewスキーマ（レビュー）
 # レビューモデルの定義
@@ -28,131 +46,207 @@ class ReviewResponse(ReviewBase):
     user_id: int
 
     class Config:
-        orm_mode = True 
         from_attributes=True# ORMとの互換性を有効にする
 
+class ReviewPage(BaseModel):
+    items: List[ReviewResponse]
+    next_cursor: Optional[str] = None
+
+# 一覧で返す列（ReviewResponse と同じ順番）
+REVIEW_COLUMNS = list(ReviewResponse.model_fields)
+
+class ReviewStatsBucket(BaseModel):
+    bucket_start: datetime
+    review_count: int
+    average_rating: float
+
+class ReviewStatsResponse(BaseModel):
+    stall_id: int
+    bucket: str
+    buckets: List[ReviewStatsBucket]
+
 class Reviewranking(BaseModel):
     ranking: List[StallResponse]
 
     class Config:
-        orm_mode = True 
         from_attributes = True  # ORMとの互換性を有効にする
 
 
 # レビューの作成エンドポイント
+# 書き込みの待ち行列が有効な場合は202を返してまとめて保存する（sync=trueで即時に保存してidを返す）
 @router.post("/reviews/", response_model=ReviewResponse)
-def create_review(review: ReviewCreate, current_user: User = Depends(get_current_user)):
+async def create_review(
+    review: ReviewCreate,
+    sync: bool = Query(False, description="待ち行列を使わずに保存する"),
+    current_user: Principal = Depends(get_current_user),
+):
+    if review_queue.running and not sync:
+        try:
+            review_queue.submit({**review.model_dump(), "user_id": current_user.id})
+        except QueueFullError:
+            raise HTTPException(status_code=503, detail="Too many reviews", headers={"Retry-After": "1"})
+        return JSONResponse({"is_success": True, "queued": True}, status_code=202)
     try:
         # レビューをデータベースに保存
-        new_review = Review.create(
+        new_review = await Review.create(
             stall_id=review.stall_id,
             user_id=current_user.id,
             rating=review.rating,
             comment=review.comment
         )
-        return ReviewResponse.from_orm(new_review) # FastAPIが自動的にresponse_modelの形式でレスポンスを返す
+        return ReviewResponse.model_validate(new_review) # FastAPIが自動的にresponse_modelの形式でレスポンスを返す
     except Exception as e:
         # エラーハンドリング
         raise HTTPException(status_code=500, detail=str(e))
 
 # レビューリスト取得エンドポイント
-@router.get("/reviews/", response_model=List[ReviewResponse])
-def get_reviews():
+@router.get("/reviews/", response_model=ReviewPage)
+async def get_reviews(limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT), cursor: Optional[str] = None):
     try:
-        # Stallテーブルから全レコードを取得
-        reviews = Review.get_list()
-        return reviews
+        # Reviewテーブルから1ページ分のレコードを取得
+        rows, next_cursor = await Review.get_list_rows(REVIEW_COLUMNS, limit=limit, cursor=cursor)
+        return page_response(REVIEW_COLUMNS, rows, next_cursor)
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# レビューのエクスポートエンドポイント（NDJSON / CSV をストリーミングで返す）
+@router.get("/reviews/export")
+async def export_reviews(
+    export_format: str = Query("ndjson", alias="format", pattern="^(ndjson|csv)$"),
+    since: Optional[datetime] = None,
+    stall_id: Optional[int] = None,
+    user_id: Optional[int] = None,
+):
+    batches = Review.iter_export_batches(
+        since=since, stall_id=stall_id, user_id=user_id, batch_size=EXPORT_BATCH_SIZE
+    )
+
+    async def ndjson_chunks():
+        async for rows in batches:
+            yield "".join(
+                json.dumps(dict(zip(EXPORT_COLUMNS, row)), ensure_ascii=False, default=str) + "\n"
+                for row in rows
+            )
+
+    async def csv_chunks():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(EXPORT_COLUMNS)
+        async for rows in batches:
+            writer.writerows(rows)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue()
+
+    if export_format == "csv":
+        return StreamingResponse(
+            csv_chunks(),
+            media_type="text/csv; charset=utf-8",
+            headers={"Content-Disposition": 'attachment; filename="reviews.csv"'},
+        )
+    return StreamingResponse(ndjson_chunks(), media_type="application/x-ndjson")
+
 # 店idからレビューリスト取得エンドポイント
 ## /reviews/{stall_id}から/reviews//stall/{stall_id}に変更
-@router.get("/reviews/stall/{stall_id}", response_model=List[ReviewResponse])
-def get_reviews_by_stall_id(stall_id: int):
+@router.get("/reviews/stall/{stall_id}", response_model=ReviewPage)
+async def get_reviews_by_stall_id(stall_id: int, limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT), cursor: Optional[str] = None):
     try:
         
-        reviews = Review.get_by_stall_id(stall_id)
-        return reviews
+        rows, next_cursor = await Review.get_list_rows(REVIEW_COLUMNS, stall_id=stall_id, limit=limit, cursor=cursor)
+        return page_response(REVIEW_COLUMNS, rows, next_cursor)
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # ユーザーidからレビューリスト取得エンドポイント
 ## /reviews/{user_id}から/reviews/user/{user_id}に変更
-@router.get("/reviews/user/{user_id}", response_model=List[ReviewResponse])
-def get_reviews_by_user_id(user_id: int):
+@router.get("/reviews/user/{user_id}", response_model=ReviewPage)
+async def get_reviews_by_user_id(user_id: int, limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT), cursor: Optional[str] = None):
     try:
         
-        reviews = Review.get_list_by_user_id(user_id)
-        return reviews
+        rows, next_cursor = await Review.get_list_rows(REVIEW_COLUMNS, user_id=user_id, limit=limit, cursor=cursor)
+        return page_response(REVIEW_COLUMNS, rows, next_cursor)
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # レビューの平均値のランキングtop3取得するエンドポイント
 @router.get("/reviews/top-ranking")
-def get_rating_ranking():
+async def get_rating_ranking():
     try:
-        all_reviews = Review.get_list()
-        stall_rating = {}
-        
-        for review in all_reviews:
-            if review.stall_id not in stall_rating:
-                stall_rating[review.stall_id] = []
-            stall_rating[review.stall_id].append(review.rating)
-        
-        average_ratings = {}
-        for stall_id, ratings in stall_rating.items():
-            if len(ratings) < 3:
-                continue
-            average_ratings[stall_id] = sum(ratings) / len(ratings)
-        
-        sorted_stalls = sorted(average_ratings.items(), key=lambda x: x[1], reverse=True)[:3]
-        
-        ranking_list = [(Stall.get_by_id(stall_id)) for stall_id, _ in sorted_stalls]
-        res = []
-        for stall in ranking_list:
-            all_reviews = Review.get_by_stall_id(stall.id)
-            average_rating = sum([review.rating for review in all_reviews]) / len(all_reviews)
-            rating_count = len(all_reviews)
-            rating_distribution = [0, 0, 0, 0, 0]
-            for review in all_reviews:
-                rating_distribution[review.rating - 1] += 1
-            res_dict = {
-                "stall_name": stall.stall_name,
-                "thumbnail_URL": stall.thumbnail_URL,
-                "ownwer_name": stall.owner_name,
-                "average_rating": average_rating,
-                "rating_count": rating_count,
-                "rating_distribution": rating_distribution
-            }
-            res.append(res_dict)
-        
-        return res
+        # 集計テーブルから平均評価の上位3件を取得（レビュー3件未満の屋台は除外）
+        return await load_ranking(limit=3, min_count=3)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# ランキングが変わるたびに最新の上位3件を送るエンドポイント（Server-Sent Events）
+@router.get("/reviews/top-ranking/stream")
+async def stream_rating_ranking():
+    return StreamingResponse(live_feed.stream(RANKING), media_type="text/event-stream", headers=SSE_HEADERS)
+
+# 複数店舗のレビューの平均評価、レビュー件数、それぞれの星の数をまとめて取得するエンドポイント
+# 例: /reviews/average?stall_ids=1,2,3
+@router.get("/reviews/average")
+async def get_average_ratings(stall_ids: str = Query(..., description="カンマ区切りの店舗id")):
+    try:
+        ids = list(dict.fromkeys(int(stall_id) for stall_id in stall_ids.split(",") if stall_id.strip()))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="stall_ids must be comma separated integers")
+    if not ids:
+        raise HTTPException(status_code=400, detail="stall_ids is empty")
+    if len(ids) > MAX_BATCH_STALL_IDS:
+        raise HTTPException(status_code=400, detail=f"stall_ids must be at most {MAX_BATCH_STALL_IDS}")
+    try:
+        return await StallRatingStats.get_summaries(ids)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # 店舗idのレビューの平均評価、レビュー件数、それぞれの星の数を取得するエンドポイント
 @router.get("/reviews/average/{stall_id}")
-def get_average_rating(stall_id: int):
+async def get_average_rating(stall_id: int):
+    try:
+        return await StallRatingStats.get_summary(stall_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# 店舗idのレビュー数と平均評価を時間帯（分・時・日）ごとに取得するエンドポイント
+# 例: /reviews/stats/1?bucket=hour&from=2024-11-02T00:00:00&to=2024-11-03T00:00:00
+# レビューが無い区切りは返さない。範囲が広い場合は新しい方から MAX_STATS_BUCKETS 件を返す
+@router.get("/reviews/stats/{stall_id}", response_model=ReviewStatsResponse)
+async def get_review_stats(
+    stall_id: int,
+    bucket: str = Query("hour", pattern="^(minute|hour|day)$"),
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+):
+    # 集計はタイムゾーン無しのDB時刻で保存している
+    start = start.replace(tzinfo=None) if start else None
+    end = end.replace(tzinfo=None) if end else None
+    if start and end and start >= end:
+        raise HTTPException(status_code=400, detail="from must be earlier than to")
     try:
-        all_reviews = Review.get_by_stall_id(stall_id)
-        average_rating = sum([review.rating for review in all_reviews]) / len(all_reviews)
-        rating_count = len(all_reviews)
-        rating_distribution = [0, 0, 0, 0, 0]
-        for review in all_reviews:
-            rating_distribution[review.rating - 1] += 1
-        return {
-            "average_rating": average_rating,
-            "rating_count": rating_count,
-            "rating_distribution": rating_distribution
-        }
+        rows = await ReviewRollup.get_buckets(stall_id, bucket, start=start, end=end, limit=MAX_STATS_BUCKETS)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    return {
+        "stall_id": stall_id,
+        "bucket": bucket,
+        "buckets": [
+            {"bucket_start": bucket_start, "review_count": count, "average_rating": rating_sum / count}
+            for bucket_start, count, rating_sum in rows
+        ],
+    }
 
 # レビューの削除エンドポイント
 @router.delete("/reviews/{review_id}")
-def delete_review(review_id: int):
+async def delete_review(review_id: int):
     try:
-        Review.delete(review_id)
-        return JSONResponse({'is_success': True})
+        return JSONResponse({'is_success': await Review.delete(review_id)})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,24 @@
+from fastapi import APIRouter, Query
+from typing import List, Optional
+from api.search import search_index
+from pydantic import BaseModel
+
+router = APIRouter()
+
+
+# 検索結果（屋台または商品）
+class SearchResult(BaseModel):
+    type: str
+    id: int
+    score: float
+    stall_name: Optional[str] = None
+    owner_name: Optional[str] = None
+    stall_id: Optional[int] = None
+    item_name: Optional[str] = None
+    price: Optional[int] = None
+
+
+# 屋台名・店主名・商品名の部分一致検索エンドポイント
+@router.get("/search", response_model=List[SearchResult], response_model_exclude_none=True)
+async def search(q: str = Query(..., min_length=1, max_length=100), limit: int = Query(20, ge=1, le=100)):
+    return search_index.search(q, limit=limit)
@@ -1,40 +1,142 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, File, HTTPException, Query, Request, UploadFile
 from fastapi.responses import JSONResponse
-from typing import List
+from typing import List, Optional
 from api.database.models import Stall  # 屋台モデル
-from pydantic import BaseModel
+from api.geo import geo_index
+from api.database.pagination import DEFAULT_LIMIT, MAX_LIMIT, InvalidCursorError
+from api.response_cache import cached_json_response
+from api.serialization import encode_page
+from api.bulk import read_bulk_rows, validate_rows
+from api.thumbnails import LIST_VARIANT, THUMBNAIL_MAX_UPLOAD_BYTES, InvalidImageError, create_thumbnails
+from pydantic import BaseModel, Field, model_validator
 
 router = APIRouter()
 
+# 近くの屋台を探す半径の上限（メートル）
+MAX_NEARBY_RADIUS_M = 5000
+
 # Stallスキーマ（屋台）
 class StallBase(BaseModel):
     stall_name: str
     owner_name: str
     thumbnail_URL: str
+    latitude: Optional[float] = Field(None, ge=-90, le=90)
+    longitude: Optional[float] = Field(None, ge=-180, le=180)
+
+
+# 緯度と経度はどちらか一方だけを設定できない
+def _check_location(location):
+    if (location.latitude is None) != (location.longitude is None):
+        raise ValueError("latitude and longitude must be set together")
+    return location
 
 
 class StallCreate(StallBase):
-    pass
+    @model_validator(mode="after")
+    def check_location(self):
+        return _check_location(self)
+
+
+class StallLocation(BaseModel):
+    latitude: Optional[float] = Field(None, ge=-90, le=90)
+    longitude: Optional[float] = Field(None, ge=-180, le=180)
+
+    @model_validator(mode="after")
+    def check_location(self):
+        return _check_location(self)
+
+
+class NearbyStall(BaseModel):
+    id: int
+    stall_name: str
+    owner_name: str
+    thumbnail_URL: Optional[str] = None
+    latitude: float
+    longitude: float
+    distance_m: float
 
 
 class StallResponse(StallBase):
     id: int
     class Config:
-        orm_mode = True
         from_attributes = True  # ORMとの互換性を有効にする
 
 
+class StallPage(BaseModel):
+    items: List[StallResponse]
+    next_cursor: Optional[str] = None
+
+
+# 一覧で返す列（StallResponse と同じ順番）
+STALL_COLUMNS = list(StallResponse.model_fields)
+
+
 # 屋台の作成エンドポイント
 @router.post("/stalls/")
-def create_stall(stall: StallCreate):
-    return JSONResponse({'is_success': Stall.create(stall_name=stall.stall_name, owner_name=stall.owner_name, thumbnail_URL=stall.thumbnail_URL)})
+async def create_stall(stall: StallCreate):
+    return JSONResponse({'is_success': await Stall.create(
+        stall_name=stall.stall_name, owner_name=stall.owner_name, thumbnail_URL=stall.thumbnail_URL,
+        latitude=stall.latitude, longitude=stall.longitude,
+    )})
+
+# 屋台の一括作成エンドポイント（JSON配列またはNDJSON）
+@router.post("/stalls/bulk")
+async def create_stalls_bulk(request: Request):
+    rows, errors = validate_rows(await read_bulk_rows(request), StallCreate)
+    if errors:
+        return JSONResponse({'is_success': False, 'errors': errors}, status_code=422)
+    ids = await Stall.create_many([stall.model_dump() for _, stall in rows])
+    if ids is None:
+        return JSONResponse({'is_success': False, 'ids': []}, status_code=500)
+    return JSONResponse({'is_success': True, 'ids': ids})
+
+# 指定した地点から半径 radius メートル以内の屋台を近い順に取得するエンドポイント
+# 例: /stalls/nearby?lat=35.6812&lon=139.7671&radius=300&limit=10
+@router.get("/stalls/nearby", response_model=List[NearbyStall])
+async def get_nearby_stalls(
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    radius: float = Query(500, gt=0, le=MAX_NEARBY_RADIUS_M, description="半径（メートル）"),
+    limit: int = Query(20, ge=1, le=MAX_LIMIT),
+):
+    # 位置の索引（メモリ上）だけで答え、DBには問い合わせない
+    return JSONResponse(geo_index.nearby(lat, lon, radius, limit))
+
+# 屋台の位置の更新エンドポイント（両方nullで位置を削除する）
+@router.put("/stalls/{stall_id}/location")
+async def update_stall_location(stall_id: int, location: StallLocation):
+    if await Stall.get_by_id(stall_id) is None:
+        raise HTTPException(status_code=404, detail="Stall not found")
+    return JSONResponse({'is_success': await Stall.update_location(stall_id, location.latitude, location.longitude)})
+
+# 屋台のサムネイル画像のアップロードエンドポイント
+# 一覧・カード・詳細用の派生画像（WebPとJPEG）を作成し、一覧用のURLを thumbnail_URL に保存する
+@router.post("/stalls/{stall_id}/thumbnail")
+async def upload_stall_thumbnail(stall_id: int, file: UploadFile = File(...)):
+    if await Stall.get_by_id(stall_id) is None:
+        raise HTTPException(status_code=404, detail="Stall not found")
+    data = await file.read(THUMBNAIL_MAX_UPLOAD_BYTES + 1)
+    if len(data) > THUMBNAIL_MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail=f"Image must be at most {THUMBNAIL_MAX_UPLOAD_BYTES} bytes")
+    try:
+        urls = await create_thumbnails(data)
+    except InvalidImageError:
+        raise HTTPException(status_code=400, detail="File is not a supported image")
+    variant, ext = LIST_VARIANT
+    is_success = await Stall.update_thumbnail_URL(stall_id, urls[variant][ext])
+    return JSONResponse({'is_success': is_success, 'thumbnail_URL': urls[variant][ext], 'thumbnails': urls})
 
 # 屋台リスト取得エンドポイント
-@router.get("/stalls/", response_model=List[StallResponse])
-def get_stalls():
+@router.get("/stalls/", response_model=StallPage)
+async def get_stalls(request: Request, limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT), cursor: Optional[str] = None):
+    async def build():
+        # Stallテーブルから1ページ分のレコードを取得
+        rows, next_cursor = await Stall.get_list_rows(STALL_COLUMNS, limit=limit, cursor=cursor)
+        return encode_page(STALL_COLUMNS, rows, next_cursor)
+
     try:
-        # Stallテーブルから全レコードを取得
-        stalls = Stall.get_list()
-        return stalls
+        return await cached_json_response(request, "stalls", build)
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
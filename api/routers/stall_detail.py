@@ -0,0 +1,55 @@
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from typing import Dict, List, Optional
+from api.database.models import Stall, StallRatingStats  # 屋台モデル
+from api.routers.stall import StallResponse
+from api.routers.item import ItemResponse
+from api.routers.review import ReviewResponse
+from api.live import SSE_HEADERS, live_feed, rating_topic
+from api.thumbnails import thumbnail_urls_from
+from pydantic import BaseModel
+
+router = APIRouter()
+
+
+# 評価の集計
+class RatingSummary(BaseModel):
+    average_rating: float
+    rating_count: int
+    rating_distribution: List[int]
+
+
+# 屋台ページ用のレスポンス（屋台・商品・評価集計・最新のレビュー）
+class StallDetailResponse(StallResponse):
+    # アップロードされた画像の場合は派生画像のURL（種類 -> 形式 -> URL）
+    thumbnails: Optional[Dict[str, Dict[str, str]]] = None
+    items: List[ItemResponse]
+    rating: RatingSummary
+    latest_reviews: List[ReviewResponse]
+
+
+# 屋台ページに必要な情報をまとめて取得するエンドポイント
+@router.get("/stalls/{stall_id}/full", response_model=StallDetailResponse)
+async def get_stall_detail(stall_id: int, review_limit: int = Query(10, ge=0, le=50)):
+    try:
+        detail = await Stall.get_detail(stall_id, review_limit=review_limit)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if detail is None:
+        raise HTTPException(status_code=404, detail="Stall not found")
+    stall, stats, reviews = detail
+    return {
+        **StallResponse.model_validate(stall).model_dump(),
+        "thumbnails": thumbnail_urls_from(stall.thumbnail_URL),
+        "items": stall.items,
+        "rating": StallRatingStats.summarize(stats),
+        "latest_reviews": reviews,
+    }
+
+
+# 屋台の評価集計が変わるたびに最新の集計を送るエンドポイント（Server-Sent Events）
+@router.get("/stalls/{stall_id}/rating/stream")
+async def stream_stall_rating(stall_id: int):
+    if await Stall.get_by_id(stall_id) is None:
+        raise HTTPException(status_code=404, detail="Stall not found")
+    return StreamingResponse(live_feed.stream(rating_topic(stall_id)), media_type="text/event-stream", headers=SSE_HEADERS)
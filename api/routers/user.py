@@ -1,12 +1,18 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
+import os
 from api.database.models import User # 屋台モデル
 from pydantic import BaseModel
-from api.routers.auth import get_current_user
+from api.bulk import find_duplicates, read_bulk_rows, validate_rows
+from api.routers.auth import Principal, get_current_user, get_password_hash, get_password_hashes
+from api.recommendations import recommend
 router = APIRouter()
 
+# ユーザーの一括作成で受け付ける最大行数（パスワードのハッシュ計算が重いため他の一括作成より小さくする）
+MAX_BULK_USER_ROWS = int(os.getenv("MAX_BULK_USER_ROWS", "100"))
+
 # Pydanticスキーマ
 class UserCreate(BaseModel):
     username: str
@@ -22,12 +28,73 @@ class UserResponse(BaseModel):
     class Config:
         from_attributes = True  # Pydantic v2 でORM対応
 
+
+class RecommendedStall(BaseModel):
+    id: int
+    stall_name: str
+    owner_name: str
+    thumbnail_URL: Optional[str] = None
+    score: float
+
 # 作成エンドポイント
 @router.post("/users/")
-def create_stall(user: UserCreate):
-    return JSONResponse({'is_success': User.create(username=user.username, password=user.password, email=user.email)})
+async def create_stall(user: UserCreate):
+    password = await get_password_hash(user.password)
+    return JSONResponse({'is_success': await User.create(username=user.username, password=password, email=user.email)})
+
+# 既に使われているユーザー名・メールアドレスを行ごとのエラーとして返す（rows は (入力での位置, 行) のリスト）
+async def find_conflicts(rows: list):
+    usernames, emails = await User.get_existing_keys(
+        [user.username for _, user in rows], [user.email for _, user in rows]
+    )
+    errors = []
+    for index, user in rows:
+        fields = [(field, value) for field, value, existing in (
+            ("username", user.username, usernames), ("email", user.email, emails),
+        ) if value in existing]
+        if fields:
+            errors.append({
+                "index": index,
+                "errors": [{"loc": [field], "msg": "Already exists", "type": "conflict", "input": value} for field, value in fields],
+            })
+    return errors
+
+# 一括作成エンドポイント（JSON配列またはNDJSON）
+@router.post("/users/bulk")
+async def create_users_bulk(request: Request):
+    rows, errors = validate_rows(await read_bulk_rows(request, max_rows=MAX_BULK_USER_ROWS), UserCreate)
+    errors += find_duplicates(rows, ("username", "email"))
+    if errors:
+        return JSONResponse({'is_success': False, 'errors': errors}, status_code=422)
+    # 既存のユーザーと重複する場合はハッシュ計算の前に409を返す
+    conflicts = await find_conflicts(rows)
+    if conflicts:
+        return JSONResponse({'is_success': False, 'errors': conflicts}, status_code=409)
+    passwords = await get_password_hashes([user.password for _, user in rows])
+    ids = await User.create_many([
+        {"username": user.username, "password": password, "email": user.email}
+        for (_, user), password in zip(rows, passwords)
+    ])
+    if ids is None:
+        # 確認後に同じ値で作成された場合は一意制約の違反で失敗するため、改めて重複を調べる
+        conflicts = await find_conflicts(rows)
+        if conflicts:
+            return JSONResponse({'is_success': False, 'errors': conflicts}, status_code=409)
+        return JSONResponse({'is_success': False, 'ids': []}, status_code=500)
+    return JSONResponse({'is_success': True, 'ids': ids})
 
 # 取得エンドポイント
 @router.get("/users/", response_model=UserResponse)
-def get_user_by_token(user: User=Depends(get_current_user)):
+async def get_user_by_token(user: Principal=Depends(get_current_user)):
     return user
+
+# ユーザーへのおすすめの屋台取得エンドポイント
+# 評価した屋台と似ている屋台（評価が似ているユーザーに好まれている屋台）のうち、まだ評価していないものを返す
+@router.get("/users/{user_id}/recommendations", response_model=List[RecommendedStall])
+async def get_recommendations(user_id: int, limit: int = Query(10, ge=1, le=50)):
+    if await User.get_by_id(user_id) is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    try:
+        return await recommend(user_id, limit=limit)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,218 @@
+import asyncio
+import heapq
+import logging
+import os
+import unicodedata
+from bisect import bisect_left, insort
+from collections import defaultdict
+from dataclasses import dataclass
+
+from api.database.hooks import on_commit
+from api.database.models import Item, Stall
+from api.index_refresher import IndexRefresher
+
+logger = logging.getLogger(__name__)
+
+# n-gramの長さ（日本語の単語は2文字単位で分割すると取りこぼしが少ない）
+NGRAM_SIZE = 2
+
+# 他のワーカーでの更新を拾うために索引を作り直す間隔（秒、0で無効）
+SEARCH_INDEX_REFRESH_INTERVAL = float(os.getenv("SEARCH_INDEX_REFRESH_INTERVAL", "60"))
+
+# 候補を読む単位（一致の確認はこの件数ずつまとめて行い、打ち切り後に余分に確認するのはこの件数まで）
+SEARCH_SCAN_CHUNK = 128
+
+# 項目ごとの重み（屋台名・商品名を店主名より優先する）
+FIELD_WEIGHTS = {"stall_name": 3.0, "item_name": 2.0, "owner_name": 1.0}
+
+_KATAKANA_TO_HIRAGANA = {code: code - 0x60 for code in range(ord("ァ"), ord("ヶ") + 1)}
+
+
+# 全角・半角、大文字・小文字、カタカナ・ひらがなの違いを吸収する
+def normalize(text: str) -> str:
+    text = unicodedata.normalize("NFKC", text or "").lower().translate(_KATAKANA_TO_HIRAGANA)
+    return "".join(text.split())
+
+
+def ngrams(text: str):
+    if len(text) < NGRAM_SIZE:
+        return {text} if text else set()
+    return {text[i:i + NGRAM_SIZE] for i in range(len(text) - NGRAM_SIZE + 1)}
+
+
+@dataclass(frozen=True)
+class Entry:
+    kind: str  # "stall" または "item"
+    id: int
+    field: str
+    text: str  # 正規化済みの文字列
+    document: dict  # 検索結果として返す内容
+    # 索引の並び順 (-重み/文字数, kind, id, entry_id, text)。同じ長さのクエリではスコアの高い順になる
+    key: tuple
+
+
+def _prefixes(text: str):
+    # 前方一致の索引に使う先頭の1文字と n-gram
+    return {text[:1], text[:NGRAM_SIZE]}
+
+
+def _hits(keys, text: str, bonus: float, match):
+    # key の順（スコアの高い順）に、一致した項目の ((-スコア, kind, id), entry_id) を返す
+    # 各まとまりの後には、そこまで読んだことを示す entry_id が -1 の目印を返す
+    # （一致の少ない索引を併合の最初に最後まで読まないよう、他の索引とスコアの順に交互に読み進める）
+    length = len(text)
+    for start in range(0, len(keys), SEARCH_SCAN_CHUNK):
+        chunk = keys[start:start + SEARCH_SCAN_CHUNK]
+        last = chunk[-1]
+        if match is not None:
+            chunk = [key for key in chunk if match(key[4])]
+        for weight_per_char, kind, id, entry_id, _ in chunk:
+            yield (weight_per_char * length - bonus, kind, id), entry_id
+        yield (last[0] * length - bonus, last[1], last[2]), -1
+
+
+# 屋台名・店主名・商品名の文字n-gram転置インデックス
+# 各索引は Entry.key の順に並べておき、検索ではスコアの高い順に読んで limit 件で打ち切る
+class SearchIndex:
+    def __init__(self):
+        self._entries = {}
+        # n-gram（と1文字） -> その文字列を含む項目のkeyのリスト
+        self._postings = defaultdict(list)
+        # 先頭の1文字・n-gram -> その文字列で始まる項目のkeyのリスト
+        self._prefix_postings = defaultdict(list)
+        # 文字列全体 -> 完全一致する項目のkeyのリスト
+        self._exact = defaultdict(list)
+        self._documents = {}
+        self._next_entry_id = 0
+
+    def __len__(self):
+        return len(self._documents)
+
+    def _lists(self, text: str):
+        for gram in ngrams(text) | set(text):
+            yield self._postings, gram
+        for prefix in _prefixes(text):
+            yield self._prefix_postings, prefix
+        yield self._exact, text
+
+    def _add(self, kind: str, id: int, fields: dict, document: dict, sort: bool = True):
+        self.remove(kind, id)
+        entry_ids = []
+        for field, value in fields.items():
+            text = normalize(value)
+            if not text:
+                continue
+            entry_id = self._next_entry_id
+            self._next_entry_id += 1
+            key = (-FIELD_WEIGHTS[field] / len(text), kind, id, entry_id, text)
+            self._entries[entry_id] = Entry(kind, id, field, text, document, key)
+            # 1文字の検索にも答えられるよう、1文字単位の索引も作る
+            for lists, term in self._lists(text):
+                if sort:
+                    insort(lists[term], key)
+                else:
+                    lists[term].append(key)
+            entry_ids.append(entry_id)
+        self._documents[(kind, id)] = entry_ids
+
+    def remove(self, kind: str, id: int):
+        for entry_id in self._documents.pop((kind, id), ()):
+            entry = self._entries.pop(entry_id)
+            for lists, term in self._lists(entry.text):
+                keys = lists.get(term)
+                if keys is None:
+                    continue
+                position = bisect_left(keys, entry.key)
+                if position < len(keys) and keys[position] == entry.key:
+                    del keys[position]
+                if not keys:
+                    del lists[term]
+
+    def add_stall(self, id: int, stall_name: str, owner_name: str, sort: bool = True):
+        self._add(
+            "stall", id,
+            {"stall_name": stall_name, "owner_name": owner_name},
+            {"type": "stall", "id": id, "stall_name": stall_name, "owner_name": owner_name},
+            sort,
+        )
+
+    def add_item(self, id: int, stall_id: int, item_name: str, price: int, sort: bool = True):
+        self._add(
+            "item", id,
+            {"item_name": item_name},
+            {"type": "item", "id": id, "stall_id": stall_id, "item_name": item_name, "price": price},
+            sort,
+        )
+
+    def load(self, stall_rows, item_rows):
+        # (id, stall_name, owner_name) と (id, stall_id, item_name, price) の行から作り、最後にまとめて並べる
+        for row in stall_rows:
+            self.add_stall(*row, sort=False)
+        for row in item_rows:
+            self.add_item(*row, sort=False)
+        for lists in (self._postings, self._prefix_postings, self._exact):
+            for keys in lists.values():
+                keys.sort()
+
+    def search(self, query: str, limit: int = 20):
+        text = normalize(query)
+        if not text:
+            return []
+        # スコア = 重み × クエリの文字数 / 項目の文字数 + 前方一致（完全一致は1.0、それ以外は0.5）
+        # 完全一致・前方一致・途中の一致の候補を別々の索引から読む。一致していればスコアは索引の並び順で決まるため、
+        # 3つの索引から一致したものをスコアの高い順に併合し、limit 件そろった時点で打ち切る
+        postings = min((self._postings.get(gram, ()) for gram in ngrams(text)), key=len)
+        streams = [
+            _hits(self._exact.get(text, ()), text, 1.0, None),
+            _hits(
+                self._prefix_postings.get(text[:NGRAM_SIZE], ()), text, 0.5,
+                lambda value: len(value) > len(text) and value.startswith(text),
+            ),
+            # n-gramが揃っていても連続していないものと、前方一致（別の索引で数える）は除外する
+            _hits(postings, text, 0.0, lambda value: text in value and not value.startswith(text)),
+        ]
+        results = []
+        seen = set()
+        for order, entry_id in heapq.merge(*streams):
+            # 同じ屋台の屋台名・店主名が両方一致した場合は、先に出る（スコアの高い）方だけを返す
+            if entry_id < 0 or order[1:] in seen:
+                continue
+            seen.add(order[1:])
+            results.append({**self._entries[entry_id].document, "score": round(-order[0], 4)})
+            if len(results) >= limit:
+                break
+        return results
+
+    def swap(self, other):
+        # 作り直した索引の中身に入れ替える（検索中に空の索引が見えないよう、構築が終わってから入れ替える）
+        self._entries, self._postings, self._prefix_postings = other._entries, other._postings, other._prefix_postings
+        self._exact, self._documents, self._next_entry_id = other._exact, other._documents, other._next_entry_id
+
+
+search_index = SearchIndex()
+
+
+# 起動時と SEARCH_INDEX_REFRESH_INTERVAL ごとにDBから索引を作る
+async def build_search_index():
+    stall_rows, item_rows = await Stall.get_name_rows(), await Item.get_name_rows()
+    index = SearchIndex()
+    # 数万件の索引作りはイベントループを止めないよう別スレッドで行う（完成するまで検索には使わない）
+    await asyncio.to_thread(index.load, stall_rows, item_rows)
+    search_index.swap(index)
+    logger.info(f"Search index built with {len(search_index)} documents")
+
+
+search_refresher = IndexRefresher("search index", build_search_index, SEARCH_INDEX_REFRESH_INTERVAL)
+
+
+# 作成された屋台・商品を索引に追加する
+@on_commit("stalls")
+def _index_stalls(stalls):
+    for stall in stalls:
+        search_index.add_stall(stall.id, stall.stall_name, stall.owner_name)
+
+
+@on_commit("items")
+def _index_items(items):
+    for item in items:
+        search_index.add_item(item.id, item.stall_id, item.item_name, item.price)
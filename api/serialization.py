@@ -0,0 +1,12 @@
+import orjson
+from fastapi import Response
+
+
+# 列名とタプルの行から一覧のJSON（{"items": [...], "next_cursor": ...}）を作る
+# ORMオブジェクトとPydanticの検証を経由しないため、行数の多いレスポンスで使う
+def encode_page(columns, rows, next_cursor=None) -> bytes:
+    return orjson.dumps({"items": [dict(zip(columns, row)) for row in rows], "next_cursor": next_cursor})
+
+
+def page_response(columns, rows, next_cursor=None) -> Response:
+    return Response(content=encode_page(columns, rows, next_cursor), media_type="application/json")
@@ -0,0 +1,144 @@
+import asyncio
+import hashlib
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from fastapi import HTTPException, status
+from fastapi.staticfiles import StaticFiles
+
+# サムネイルの保存先と公開するURL
+THUMBNAIL_DIR = os.getenv("THUMBNAIL_DIR", "media/thumbnails")
+THUMBNAIL_URL_PREFIX = os.getenv("THUMBNAIL_URL_PREFIX", "/media/thumbnails")
+# アップロードできる画像の最大サイズ（バイト）
+THUMBNAIL_MAX_UPLOAD_BYTES = int(os.getenv("THUMBNAIL_MAX_UPLOAD_BYTES", str(10 * 1024 * 1024)))
+
+# 変換はイベントループを止めないよう専用のプロセスプールで行う
+THUMBNAIL_WORKERS = int(os.getenv("THUMBNAIL_WORKERS", str(min(2, os.cpu_count() or 1))))
+# 待ち行列の上限（超えた場合は503を返す）
+THUMBNAIL_MAX_PENDING = int(os.getenv("THUMBNAIL_MAX_PENDING", "16"))
+
+# 派生画像の種類 -> (幅, 高さ, 切り抜くか)
+# 一覧とカードは枠に合わせて切り抜き、詳細は縦横比を保って枠に収める
+VARIANTS = {
+    "list": (160, 120, True),
+    "card": (480, 360, True),
+    "detail": (1200, 900, False),
+}
+FORMATS = {"webp": ("WEBP", {"quality": 80, "method": 4}), "jpg": ("JPEG", {"quality": 82, "optimize": True, "progressive": True})}
+
+# 一覧で使う派生画像（Stall.thumbnail_URL に保存する）
+LIST_VARIANT = ("list", "webp")
+
+# 変換処理の版（変えると同じ画像でも別のファイル名になる）
+PIPELINE_VERSION = "1"
+
+_executor = None
+_pending = 0
+
+
+class InvalidImageError(ValueError):
+    pass
+
+
+def _filename(digest: str, variant: str, ext: str):
+    return f"{digest}-{variant}.{ext}"
+
+
+def thumbnail_urls(digest: str):
+    return {
+        variant: {ext: f"{THUMBNAIL_URL_PREFIX}/{_filename(digest, variant, ext)}" for ext in FORMATS}
+        for variant in VARIANTS
+    }
+
+
+# Stall.thumbnail_URL がアップロードされた画像のものなら、全ての派生画像のURLを返す
+def thumbnail_urls_from(url: str):
+    prefix = f"{THUMBNAIL_URL_PREFIX}/"
+    suffix = f"-{LIST_VARIANT[0]}.{LIST_VARIANT[1]}"
+    if not url or not url.startswith(prefix) or not url.endswith(suffix):
+        return None
+    return thumbnail_urls(url[len(prefix):-len(suffix)])
+
+
+def _write_atomic(path: str, data: bytes):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+# プロセスプールで実行する（元画像からすべての派生画像を作って保存し、ファイル名のハッシュを返す）
+def _render(data: bytes, directory: str):
+    from PIL import Image, ImageOps, UnidentifiedImageError
+
+    digest = hashlib.sha256(PIPELINE_VERSION.encode() + data).hexdigest()[:32]
+    paths = {
+        (variant, ext): os.path.join(directory, _filename(digest, variant, ext))
+        for variant in VARIANTS for ext in FORMATS
+    }
+    # 同じ画像が既に変換済みなら何もしない
+    if all(os.path.exists(path) for path in paths.values()):
+        return digest
+    try:
+        with Image.open(io.BytesIO(data)) as original:
+            original.draft("RGB", (VARIANTS["detail"][0], VARIANTS["detail"][1]))
+            image = ImageOps.exif_transpose(original).convert("RGB")
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError) as e:
+        raise InvalidImageError(str(e))
+    os.makedirs(directory, exist_ok=True)
+    for variant, (width, height, crop) in VARIANTS.items():
+        if crop:
+            resized = ImageOps.fit(image, (width, height), Image.Resampling.LANCZOS)
+        else:
+            resized = image.copy()
+            resized.thumbnail((width, height), Image.Resampling.LANCZOS)
+        for ext, (format, options) in FORMATS.items():
+            buffer = io.BytesIO()
+            resized.save(buffer, format, **options)
+            _write_atomic(paths[(variant, ext)], buffer.getvalue())
+    return digest
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=THUMBNAIL_WORKERS)
+    return _executor
+
+
+def shutdown_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
+
+
+# 派生画像を作成してURLを返す（画像として読めない場合は InvalidImageError）
+async def create_thumbnails(data: bytes):
+    global _pending
+    if _pending >= THUMBNAIL_MAX_PENDING:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many thumbnail requests",
+            headers={"Retry-After": "1"},
+        )
+    _pending += 1
+    try:
+        digest = await asyncio.get_running_loop().run_in_executor(_get_executor(), _render, data, THUMBNAIL_DIR)
+    finally:
+        _pending -= 1
+    return thumbnail_urls(digest)
+
+
+# ファイル名が内容のハッシュなので、一度配信した画像はブラウザ・CDNに長期間キャッシュさせる
+class ImmutableStaticFiles(StaticFiles):
+    def file_response(self, *args, **kwargs):
+        response = super().file_response(*args, **kwargs)
+        response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+        return response
+
+
+def thumbnail_files():
+    os.makedirs(THUMBNAIL_DIR, exist_ok=True)
+    return ImmutableStaticFiles(directory=THUMBNAIL_DIR)
@@ -0,0 +1,128 @@
+import asyncio
+import logging
+import os
+
+from sqlalchemy import text
+
+from api.database.db import Session, engine, replica_engines
+from api.geo import build_geo_index
+from api.price_index import build_price_index
+from api.search import build_search_index
+
+logger = logging.getLogger(__name__)
+
+# 起動時に開いておくDB接続の数（デフォルトはプールの常時保持数）
+WARMUP_CONNECTIONS = int(os.getenv("WARMUP_CONNECTIONS", os.getenv("DB_POOL_SIZE", "10")))
+# 起動時に1回リクエストしておくパス（クエリのコンパイルとレスポンスキャッシュの作成のため）
+WARMUP_PATHS = [path for path in os.getenv(
+    "WARMUP_PATHS", "/stalls/,/items/,/reviews/,/reviews/top-ranking"
+).split(",") if path]
+# ウォームアップに失敗した場合に再試行する間隔（秒）
+WARMUP_RETRY_INTERVAL = float(os.getenv("WARMUP_RETRY_INTERVAL", "5"))
+
+
+class Readiness:
+    def __init__(self):
+        self.ready = False
+        self.error = None
+        self._retry = None
+
+    def status(self):
+        return {"ready": self.ready, "error": self.error}
+
+
+readiness = Readiness()
+
+
+# プライマリとレプリカのプールに接続を作っておく（同時に取得しないと1本の接続が使い回される）
+async def open_pool(connections: int):
+    async def ping(target):
+        async with target.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+
+    count = max(1, connections)
+    await asyncio.gather(*(ping(engine) for _ in range(count)))
+    # レプリカに接続できなくてもプライマリで処理できるため、準備の失敗とはしない
+    results = await asyncio.gather(
+        *(ping(replica) for replica in replica_engines for _ in range(count)), return_exceptions=True
+    )
+    for error in {str(result) for result in results if isinstance(result, Exception)}:
+        logger.warning(f"Failed to open replica connection: {error}")
+
+
+# ASGIアプリに直接GETリクエストを送る（ルーティングから応答のシリアライズまでを通す）
+async def _request(app, path: str):
+    path, _, query = path.partition("?")
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": query.encode(),
+        "root_path": "",
+        "headers": [(b"host", b"warmup")],
+        "client": None,
+        "server": ("warmup", 80),
+    }
+    status = None
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    await app(scope, receive, send)
+    if status is None or status >= 500:
+        raise RuntimeError(f"GET {path} returned {status}")
+
+
+async def warm_up(app):
+    await open_pool(WARMUP_CONNECTIONS)
+    try:
+        await build_search_index()
+        await build_geo_index()
+        await build_price_index()
+    finally:
+        await Session.remove()
+    for path in WARMUP_PATHS:
+        await _request(app, path)
+
+
+async def _try_warm_up(app):
+    try:
+        await warm_up(app)
+    except Exception as e:
+        readiness.error = str(e)
+        logger.error(f"Warm-up failed: {e}")
+        return False
+    readiness.ready = True
+    readiness.error = None
+    logger.info("Warm-up finished")
+    return True
+
+
+async def _retry(app):
+    while True:
+        await asyncio.sleep(WARMUP_RETRY_INTERVAL)
+        if await _try_warm_up(app):
+            return
+
+
+# 起動時に接続プール・検索・位置・価格のインデックス・よく使うクエリを準備する
+# 失敗した場合（DBの起動待ちなど）は起動を止めず、成功するまで裏で再試行する（その間は準備中を返す）
+async def start(app):
+    if not await _try_warm_up(app):
+        readiness._retry = asyncio.create_task(_retry(app))
+
+
+async def stop():
+    readiness.ready = False
+    if readiness._retry is not None:
+        readiness._retry.cancel()
+        readiness._retry = None
@@ -0,0 +1,281 @@
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+DATA_DIR = Path(__file__).resolve().parent / ".data"
+
+# p95がベースラインからこの割合以上悪化したら退行とみなす
+DEFAULT_THRESHOLD = 0.2
+
+_unique = itertools.count()
+
+
+def _unique_name(prefix: str):
+    return f"{prefix}-{os.getpid()}-{next(_unique)}"
+
+
+# 計測するエンドポイント（名前, リクエストを組み立てる関数）
+# 関数は乱数生成器と実行中の状態を受け取り、(メソッド, パス, httpxに渡す引数)を返す
+def _get(path):
+    return lambda rng, state: ("GET", path(rng, state) if callable(path) else path, {})
+
+
+def _create_review(rng, state):
+    return "POST", "/reviews/", {
+        "headers": state["auth"],
+        "json": {"stall_id": rng.randint(1, state["stalls"]), "rating": rng.randint(1, 5), "comment": "ベンチマーク"},
+    }
+
+
+def _delete_review(rng, state):
+    # 計測中に作成したレビューを消す（元データの集計を変えないため）
+    review_id = state["created_reviews"].pop() if state["created_reviews"] else 0
+    return "DELETE", f"/reviews/{review_id}", {}
+
+
+def _login(rng, state):
+    return "POST", "/token", {"data": {"username": f"user{rng.randint(1, state['users'])}", "password": state["password"]}}
+
+
+def _create_stall(rng, state):
+    return "POST", "/stalls/", {"json": {"stall_name": _unique_name("stall"), "owner_name": "bench", "thumbnail_URL": ""}}
+
+
+def _create_item(rng, state):
+    return "POST", "/items/", {"json": {"stall_id": rng.randint(1, state["stalls"]), "item_name": _unique_name("item"), "price": 300}}
+
+
+def _create_user(rng, state):
+    name = _unique_name("bench")
+    return "POST", "/users/", {"json": {"username": name, "password": state["password"], "email": f"{name}@example.com"}}
+
+
+def _bulk(path, row):
+    return lambda rng, state: ("POST", path, {"json": [row(rng, state) for _ in range(state["bulk_rows"])]})
+
+
+def _bulk_user(rng, state):
+    name = _unique_name("bulk")
+    return {"username": name, "password": state["password"], "email": f"{name}@example.com"}
+
+
+SCENARIOS = [
+    ("GET /stalls/", _get("/stalls/")),
+    ("GET /stalls/nearby", _get(lambda rng, state: "/stalls/nearby?lat={:.5f}&lon={:.5f}&radius=200".format(
+        state["center"][0] + rng.random() * 0.002, state["center"][1] + rng.random() * 0.005))),
+    ("GET /stalls/{id}/full", _get(lambda rng, state: f"/stalls/{rng.randint(1, state['stalls'])}/full")),
+    ("GET /items/", _get("/items/")),
+    ("GET /items/search", _get(lambda rng, state: f"/items/search?max_price={rng.randrange(100, 1000, 50)}")),
+    ("GET /items/{stall_id}", _get(lambda rng, state: f"/items/{rng.randint(1, state['stalls'])}")),
+    ("GET /reviews/", _get("/reviews/")),
+    ("GET /reviews/stall/{id}", _get(lambda rng, state: f"/reviews/stall/{rng.randint(1, state['stalls'])}")),
+    ("GET /reviews/user/{id}", _get(lambda rng, state: f"/reviews/user/{rng.randint(1, state['users'])}")),
+    ("GET /reviews/top-ranking", _get("/reviews/top-ranking")),
+    ("GET /reviews/average", _get(lambda rng, state: "/reviews/average?stall_ids=" + ",".join(
+        str(rng.randint(1, state["stalls"])) for _ in range(20)))),
+    ("GET /reviews/average/{id}", _get(lambda rng, state: f"/reviews/average/{rng.randint(1, state['stalls'])}")),
+    ("GET /reviews/export", _get(lambda rng, state: f"/reviews/export?stall_id={rng.randint(1, state['stalls'])}")),
+    ("GET /search", _get(lambda rng, state: "/search?q=" + rng.choice(["焼き", "たこ", "あめ", "バナナ", "店主"]))),
+    ("GET /users/{id}/recommendations", _get(lambda rng, state: f"/users/{rng.randint(1, state['users'])}/recommendations")),
+    ("GET /users/", lambda rng, state: ("GET", "/users/", {"headers": state["auth"]})),
+    ("GET /internal/db-pool", _get("/internal/db-pool")),
+    ("POST /token", _login),
+    ("POST /reviews/", _create_review),
+    ("DELETE /reviews/{id}", _delete_review),
+    ("POST /stalls/", _create_stall),
+    ("POST /items/", _create_item),
+    ("POST /users/", _create_user),
+    ("POST /stalls/bulk", _bulk("/stalls/bulk", lambda rng, state: {
+        "stall_name": _unique_name("stall"), "owner_name": "bench", "thumbnail_URL": ""})),
+    ("POST /items/bulk", _bulk("/items/bulk", lambda rng, state: {
+        "stall_id": rng.randint(1, state["stalls"]), "item_name": _unique_name("item"), "price": 300})),
+    ("POST /users/bulk", _bulk("/users/bulk", _bulk_user)),
+]
+
+
+def summarize(latencies, errors, elapsed):
+    latencies = sorted(latencies)
+    if len(latencies) > 1:
+        percentiles = statistics.quantiles(latencies, n=100, method="inclusive")
+        p50, p95, p99 = percentiles[49], percentiles[94], percentiles[98]
+    else:
+        p50 = p95 = p99 = latencies[0] if latencies else 0.0
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 3) if latencies else 0.0,
+        "p50_ms": round(p50 * 1000, 3),
+        "p95_ms": round(p95 * 1000, 3),
+        "p99_ms": round(p99 * 1000, 3),
+        "max_ms": round(latencies[-1] * 1000, 3) if latencies else 0.0,
+    }
+
+
+# 作成系のエンドポイントは失敗しても200で {"is_success": false} を返す
+def _is_error(response):
+    if response.status_code >= 400:
+        return True
+    if response.headers.get("content-type") != "application/json":
+        return False
+    body = response.json()
+    return isinstance(body, dict) and body.get("is_success") is False
+
+
+# 1つのエンドポイントにconcurrency個のワーカーから合計requests回リクエストを送る
+async def run_scenario(client, build, state, requests, concurrency, seed):
+    latencies = []
+    errors = 0
+    remaining = iter(range(requests))
+
+    async def worker(rng):
+        nonlocal errors
+        for _ in remaining:
+            method, path, kwargs = build(rng, state)
+            started = time.perf_counter()
+            response = await client.request(method, path, **kwargs)
+            # ストリーミングのレスポンスも本文を読み終えるまでを計測する
+            await response.aread()
+            latencies.append(time.perf_counter() - started)
+            if _is_error(response):
+                errors += 1
+            elif method == "POST" and path == "/reviews/":
+                state["created_reviews"].append(response.json()["id"])
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(random.Random(seed * 1000 + i)) for i in range(concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=Path(__file__).resolve().parent,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# ベースラインと比べてp95が悪化したエンドポイントを返す
+def find_regressions(results, baseline, threshold):
+    regressions = []
+    for name, result in results["endpoints"].items():
+        before = baseline.get("endpoints", {}).get(name)
+        if not before or not before["p95_ms"]:
+            continue
+        ratio = result["p95_ms"] / before["p95_ms"]
+        if ratio > 1 + threshold:
+            regressions.append({"endpoint": name, "baseline_p95_ms": before["p95_ms"], "p95_ms": result["p95_ms"], "ratio": round(ratio, 2)})
+    return regressions
+
+
+async def benchmark(args, db_path, needs_seed):
+    # DB_URLを読み込んだ後にアプリを読み込む
+    import httpx
+    from api.database.db import Session, engine
+    from api.main import app
+    from api.routers.auth import get_password_hash
+    from benchmarks.seed import FESTIVAL_CENTER, PASSWORD, SIZES, dataset_counts, seed_database
+
+    if needs_seed:
+        print(f"Seeding {args.size} dataset into {db_path}", file=sys.stderr)
+        await seed_database(SIZES[args.size], await get_password_hash(PASSWORD), seed=args.seed)
+        await engine.dispose()
+        shutil.copyfile(db_path, DATA_DIR / f"{args.size}.seed.db")
+    counts = dataset_counts(SIZES[args.size])
+
+    state = {**counts, "password": PASSWORD, "center": FESTIVAL_CENTER, "bulk_rows": args.bulk_rows, "created_reviews": []}
+    selected = [(name, build) for name, build in SCENARIOS if not args.only or any(key in name for key in args.only)]
+    endpoints = {}
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+            response = await client.post("/token", data={"username": "user1", "password": PASSWORD})
+            state["auth"] = {"Authorization": f"Bearer {response.json()['access_token']}"}
+            for name, build in selected:
+                # 接続やキャッシュの初回作成を計測に含めない
+                await run_scenario(client, build, state, args.warmup, 1, args.seed)
+                endpoints[name] = await run_scenario(client, build, state, args.requests, args.concurrency, args.seed)
+                print(f"{name}: {json.dumps(endpoints[name])}", file=sys.stderr)
+    await Session.remove()
+    await engine.dispose()
+
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "database": "sqlite",
+            "size": args.size,
+            "dataset": counts,
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "seed": args.seed,
+        },
+        "endpoints": endpoints,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="APIの負荷ベンチマーク")
+    parser.add_argument("--size", choices=["1k", "100k", "1m"], default="1k", help="レビュー件数で表したデータセットの規模")
+    parser.add_argument("--requests", type=int, default=200, help="エンドポイントごとのリクエスト数")
+    parser.add_argument("--concurrency", type=int, default=16, help="同時に送るリクエスト数")
+    parser.add_argument("--warmup", type=int, default=5, help="計測前に送るリクエスト数")
+    parser.add_argument("--bulk-rows", type=int, default=10, help="一括作成で1回に送る行数")
+    parser.add_argument("--seed", type=int, default=14, help="データ生成とリクエストの乱数シード")
+    parser.add_argument("--only", nargs="*", help="名前にこの文字列を含むエンドポイントだけ計測する")
+    parser.add_argument("--reseed", action="store_true", help="キャッシュ済みのデータセットを作り直す")
+    parser.add_argument("--output", type=Path, help="結果のJSONを書き出すファイル")
+    parser.add_argument("--baseline", type=Path, help="比較するベースラインの結果JSON")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="退行とみなすp95の悪化率")
+    return parser.parse_args(argv)
+
+
+# 使い方: poetry run python -m benchmarks.run --size 100k --output result.json --baseline main.json
+def main(argv=None):
+    args = parse_args(argv)
+    DATA_DIR.mkdir(exist_ok=True)
+    # 計測中の書き込みで元データが変わらないよう、生成済みのデータセットを複製して使う
+    seed_path = DATA_DIR / f"{args.size}.seed.db"
+    db_path = DATA_DIR / f"{args.size}.db"
+    needs_seed = args.reseed or not seed_path.exists()
+    if not needs_seed:
+        shutil.copyfile(seed_path, db_path)
+    os.environ["DB_URL"] = f"sqlite+aiosqlite:///{db_path}"
+    # 推薦の表はデータセットの作成時に計算し、計測中にバックグラウンドで再計算しない
+    os.environ.setdefault("RECOMMEND_JOB", "false")
+
+    results = asyncio.run(benchmark(args, db_path, needs_seed))
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text())
+        results["regressions"] = find_regressions(results, baseline, args.threshold)
+
+    output = json.dumps(results, ensure_ascii=False, indent=2)
+    if args.output:
+        args.output.write_text(output + "\n")
+    else:
+        print(output)
+
+    for regression in results.get("regressions", []):
+        print(
+            f"Regression: {regression['endpoint']} p95 {regression['baseline_p95_ms']}ms -> {regression['p95_ms']}ms",
+            file=sys.stderr,
+        )
+    return 1 if results.get("regressions") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
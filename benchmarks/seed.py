@@ -0,0 +1,106 @@
+import random
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert
+
+from api.database.db import ModelBase, Session, engine
+from api.database.models import Item, Review, ReviewRollup, Stall, StallRatingStats, User
+from api.recommendations import recommendation_job
+
+# 合成データの規模（レビュー件数）
+SIZES = {"1k": 1_000, "100k": 100_000, "1m": 1_000_000}
+
+# 1文あたりの挿入行数
+CHUNK_SIZE = 10_000
+
+FOODS = ["焼きそば", "たこ焼き", "お好み焼き", "りんご飴", "かき氷", "わたあめ", "フランクフルト", "じゃがバター", "チョコバナナ", "ラムネ"]
+PASSWORD = "benchmark-password"
+
+# 2024年の学園祭の開始時刻
+FESTIVAL_START = datetime(2024, 9, 14, 9, 0, 0)
+# 会場の中心と屋台の並べ方（1列50店、約10m間隔）
+FESTIVAL_CENTER = (35.6812, 139.7671)
+STALLS_PER_ROW = 50
+STALL_SPACING_DEGREES = 0.00009
+
+
+# レビュー件数から屋台・商品・ユーザー数を決める
+def dataset_counts(reviews: int):
+    stalls = max(10, reviews // 200)
+    return {
+        "stalls": stalls,
+        "items": stalls * 10,
+        "users": max(50, reviews // 20),
+        "reviews": reviews,
+    }
+
+
+async def _insert_rows(conn, model, rows):
+    for start in range(0, len(rows), CHUNK_SIZE):
+        await conn.execute(insert(model.__table__), rows[start:start + CHUNK_SIZE])
+
+
+async def seed_database(reviews: int, password_hash: str, seed: int = 14):
+    rng = random.Random(seed)
+    counts = dataset_counts(reviews)
+    async with engine.begin() as conn:
+        await conn.run_sync(ModelBase.metadata.drop_all)
+        await conn.run_sync(ModelBase.metadata.create_all)
+
+        await _insert_rows(conn, Stall, [
+            {
+                "id": i,
+                "stall_name": f"{rng.choice(FOODS)}屋 {i}",
+                "owner_name": f"店主 {i}",
+                "thumbnail_URL": f"https://example.com/stalls/{i}.jpg",
+                "latitude": FESTIVAL_CENTER[0] + (i // STALLS_PER_ROW) * STALL_SPACING_DEGREES,
+                "longitude": FESTIVAL_CENTER[1] + (i % STALLS_PER_ROW) * STALL_SPACING_DEGREES,
+                "created_at": FESTIVAL_START + timedelta(seconds=i),
+            }
+            for i in range(1, counts["stalls"] + 1)
+        ])
+        await _insert_rows(conn, Item, [
+            {
+                "id": i,
+                "stall_id": (i - 1) % counts["stalls"] + 1,
+                "item_name": f"{rng.choice(FOODS)} {i}",
+                "price": rng.randrange(100, 1000, 50),
+                "created_at": FESTIVAL_START + timedelta(seconds=i),
+            }
+            for i in range(1, counts["items"] + 1)
+        ])
+        await _insert_rows(conn, User, [
+            {
+                "id": i,
+                "username": f"user{i}",
+                "password": password_hash,
+                "email": f"user{i}@example.com",
+                "created_at": FESTIVAL_START + timedelta(seconds=i),
+            }
+            for i in range(1, counts["users"] + 1)
+        ])
+        # 屋台ごとに評価の傾向を変える（人気の屋台ほどレビューが多い）
+        quality = [rng.uniform(1.5, 5.0) for _ in range(counts["stalls"])]
+        weights = [rng.paretovariate(1.2) for _ in range(counts["stalls"])]
+        stall_ids = rng.choices(range(1, counts["stalls"] + 1), weights=weights, k=reviews)
+        festival_seconds = 2 * 24 * 60 * 60
+        for start in range(0, reviews, CHUNK_SIZE):
+            rows = []
+            for i in range(start, min(start + CHUNK_SIZE, reviews)):
+                stall_id = stall_ids[i]
+                rating = min(5, max(1, round(rng.gauss(quality[stall_id - 1], 0.8))))
+                rows.append({
+                    "id": i + 1,
+                    "stall_id": stall_id,
+                    "user_id": rng.randint(1, counts["users"]),
+                    "rating": rating,
+                    "comment": "おいしかったです" * rng.randint(1, 8),
+                    "created_at": FESTIVAL_START + timedelta(seconds=i * festival_seconds // reviews),
+                })
+            await conn.execute(insert(Review.__table__), rows)
+
+    await StallRatingStats.rebuild()
+    await ReviewRollup.rebuild()
+    await recommendation_job.refresh_full()
+    await Session.remove()
+    return counts
@@ -0,0 +1,99 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+# インメモリのSQLiteに合成データを作って計測する
+os.environ.setdefault("DB_URL", "sqlite+aiosqlite://")
+
+from api.database.db import Session, engine
+from api.database.models import Item, Review
+from api.database.pagination import MAX_LIMIT
+from api.routers.item import ITEM_COLUMNS, ItemPage
+from api.routers.review import REVIEW_COLUMNS, ReviewPage
+from api.serialization import encode_page
+from benchmarks.seed import SIZES, dataset_counts, seed_database
+
+
+# 変更前の経路（ORMオブジェクトを取得し、response_model で検証してからJSONにする）
+async def orm_page(model, page_model, cursor):
+    rows, next_cursor = await model.get_list(limit=MAX_LIMIT, cursor=cursor)
+    started = time.perf_counter()
+    # FastAPIの response_model と JSONResponse と同じ処理
+    content = page_model.model_validate({"items": rows, "next_cursor": next_cursor}).model_dump(mode="json")
+    body = json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode()
+    return len(rows), next_cursor, time.perf_counter() - started, body
+
+
+# 列を絞ってタプルで取得し、orjsonで直接JSONにする経路
+async def row_page(model, columns, cursor):
+    rows, next_cursor = await model.get_list_rows(columns, limit=MAX_LIMIT, cursor=cursor)
+    started = time.perf_counter()
+    body = encode_page(columns, rows, next_cursor)
+    return len(rows), next_cursor, time.perf_counter() - started, body
+
+
+# 全ページを順にたどり、1行あたりの取得・シリアライズ時間を返す
+async def walk(fetch_page, rounds):
+    rows = 0
+    encode_seconds = 0.0
+    started = time.perf_counter()
+    for _ in range(rounds):
+        cursor = None
+        while True:
+            count, cursor, seconds, _ = await fetch_page(cursor)
+            rows += count
+            encode_seconds += seconds
+            await Session.remove()
+            if cursor is None:
+                break
+    total_seconds = time.perf_counter() - started
+    return {
+        "rows": rows,
+        "total_us_per_row": round(total_seconds / rows * 1e6, 3),
+        "serialize_us_per_row": round(encode_seconds / rows * 1e6, 3),
+        "fetch_us_per_row": round((total_seconds - encode_seconds) / rows * 1e6, 3),
+    }
+
+
+async def benchmark(size: str, rounds: int):
+    await seed_database(SIZES[size], password_hash="unused")
+    # 両方の経路が同じJSONを返すことを確認する
+    for before, after in (
+        (orm_page(Review, ReviewPage, None), row_page(Review, REVIEW_COLUMNS, None)),
+        (orm_page(Item, ItemPage, None), row_page(Item, ITEM_COLUMNS, None)),
+    ):
+        assert json.loads((await before)[3]) == json.loads((await after)[3])
+        await Session.remove()
+
+    results = {}
+    for name, model, page_model, columns in (
+        ("reviews", Review, ReviewPage, REVIEW_COLUMNS),
+        ("items", Item, ItemPage, ITEM_COLUMNS),
+    ):
+        before = await walk(lambda cursor: orm_page(model, page_model, cursor), rounds)
+        after = await walk(lambda cursor: row_page(model, columns, cursor), rounds)
+        results[name] = {
+            "orm_pydantic": before,
+            "rows_orjson": after,
+            "speedup": round(before["total_us_per_row"] / after["total_us_per_row"], 2),
+        }
+    await engine.dispose()
+    return {"meta": {"size": size, "dataset": dataset_counts(SIZES[size]), "page_size": MAX_LIMIT, "rounds": rounds}, "results": results}
+
+
+# 一覧レスポンスの1行あたりのコストを、ORM＋Pydanticの経路と列指定＋orjsonの経路で比較する
+# 使い方: poetry run python -m benchmarks.serialization --size 100k
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="一覧レスポンスのシリアライズのベンチマーク")
+    parser.add_argument("--size", choices=list(SIZES), default="1k", help="レビュー件数で表したデータセットの規模")
+    parser.add_argument("--rounds", type=int, default=3, help="全ページをたどる回数")
+    args = parser.parse_args(argv)
+    print(json.dumps(asyncio.run(benchmark(args.size, args.rounds)), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,5 +3,11 @@
 # Apply database migrations
 poetry run alembic upgrade head
 
+if [ "$SERVER_MODE" = "production" ]; then
+    # Start gunicorn with one uvicorn worker per CPU (see gunicorn.conf.py)
+    # exec so that signals (HUP, USR2, TERM) reach the gunicorn master
+    exec poetry run gunicorn api.main:app -c gunicorn.conf.py
+fi
+
 # Start the FastAPI server
 poetry run uvicorn api.main:app --host 0.0.0.0 --reload
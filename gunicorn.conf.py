@@ -0,0 +1,26 @@
+# 本番環境用のgunicornの設定（entrypoint.sh から SERVER_MODE=production で使う）
+import multiprocessing
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+worker_class = "uvicorn.workers.UvicornWorker"
+# ワーカー数（デフォルトはCPU数。非同期のワーカーなので1コアに1プロセスで足りる）
+workers = int(os.getenv("WEB_CONCURRENCY", str(multiprocessing.cpu_count())))
+
+# アプリの読み込みをマスタープロセスで1回だけ行い、ワーカーはforkで共有する
+preload_app = os.getenv("GUNICORN_PRELOAD", "true").lower() in ("1", "true", "yes", "on")
+
+# 終了・再起動時に処理中のリクエストとレビューの待ち行列を終えるまで待つ秒数
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
+
+accesslog = "-"
+errorlog = "-"
+
+
+# マスターで作られたエンジンの接続をワーカーに引き継がない
+def post_fork(server, worker):
+    from api.database.db import engine
+
+    engine.sync_engine.dispose(close=False)
@@ -0,0 +1,41 @@
+import os
+import tempfile
+from pathlib import Path
+
+# api のモジュールは読み込み時に環境変数を読むため、読み込む前にテスト用の設定にする
+# テーブルはテストごとに作り直すので、TEST_DB_URL には消えてよいデータベースを指定する
+TEST_DATA_DIR = Path(tempfile.mkdtemp(prefix="api-tests-"))
+os.environ["DB_URL"] = os.getenv("TEST_DB_URL", f"sqlite+aiosqlite:///{TEST_DATA_DIR / 'primary.db'}")
+os.environ["DB_REPLICA_URLS"] = ""
+os.environ["RECOMMEND_JOB"] = "false"
+
+import pytest
+from httpx import ASGITransport, AsyncClient
+
+from api.database.db import ModelBase, Session, engine
+from api.response_cache import invalidate
+from api.routers.auth import principal_cache
+
+
+# テーブルを作り直したデータベース（プロセス内のキャッシュも空にする）
+@pytest.fixture
+async def db():
+    async with engine.begin() as conn:
+        await conn.run_sync(ModelBase.metadata.drop_all)
+        await conn.run_sync(ModelBase.metadata.create_all)
+    for table in ("stalls", "items"):
+        invalidate(table)
+    principal_cache.clear()
+    yield engine
+    await Session.remove()
+    # 接続はテストごとのイベントループに結び付くため、次のテストに持ち越さない
+    await engine.dispose()
+
+
+# ASGIアプリに直接リクエストを送るクライアント（lifespan のバックグラウンド処理は動かさない）
+@pytest.fixture
+async def client(db):
+    from api.main import app
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        yield client
@@ -0,0 +1,44 @@
+import pytest
+from passlib.exc import MissingBackendError
+
+from api.database.models import User
+from api.routers import auth
+from api.routers.auth import PASSWORD_HASH_LEGACY_SCHEMES, _has_backend, get_password_hash
+
+# argon2 の形式のハッシュ
+ARGON2_HASH = "$argon2id$v=19$m=65536,t=3,p=4$MIIRqgvgQbgj220jfp0MPA$YfwJSVjtjSU0zzV/P3S9nnQ/USre2wvJMjfCIjrTQbg"
+missing_argon2 = pytest.mark.skipif(_has_backend("argon2"), reason="argon2 backend is installed")
+
+
+async def _login(client, username, password):
+    return await client.post("/token", data={"username": username, "password": password})
+
+
+@missing_argon2
+def test_legacy_schemes_skip_missing_backends():
+    assert "argon2" not in PASSWORD_HASH_LEGACY_SCHEMES
+    assert "pbkdf2_sha512" in PASSWORD_HASH_LEGACY_SCHEMES
+
+
+@missing_argon2
+async def test_login_with_unverifiable_hash_fails_without_error(client):
+    assert await User.create(username="user1", password=ARGON2_HASH, email="user1@example.com")
+    assert (await _login(client, "user1", "password")).status_code == 400
+
+
+async def test_missing_backend_is_a_failed_verification(client, monkeypatch):
+    assert await User.create(username="user1", password=await get_password_hash("password"), email="user1@example.com")
+
+    def missing_backend(*args):
+        raise MissingBackendError("bcrypt: no backends available")
+
+    monkeypatch.setattr(auth.pwd_context, "verify_and_update", missing_backend)
+    response = await _login(client, "user1", "password")
+    assert response.status_code == 400
+
+
+async def test_login_rehashes_plaintext_password(client):
+    assert await User.create(username="user1", password="password", email="user1@example.com")
+    assert (await _login(client, "user1", "wrong")).status_code == 400
+    assert (await _login(client, "user1", "password")).status_code == 200
+    assert (await User.get_by_username("user1")).password.startswith("$pbkdf2-sha256$")
@@ -0,0 +1,71 @@
+from api.database.models import Item, Stall, User
+from api.routers.user import MAX_BULK_USER_ROWS
+
+
+def _user(name, **values):
+    return {"username": name, "password": "password", "email": f"{name}@example.com", **values}
+
+
+async def test_bulk_users_report_input_index_of_duplicates(client):
+    response = await client.post("/users/bulk", json=[
+        {"username": "invalid"},
+        _user("user1"),
+        _user("user1", email="other@example.com"),
+    ])
+    assert response.status_code == 422
+    errors = {error["index"]: error["errors"] for error in response.json()["errors"]}
+    assert set(errors) == {0, 2}
+    assert errors[2][0]["loc"] == ["username"]
+    assert errors[2][0]["msg"] == "Duplicate of row 1"
+
+
+async def test_bulk_users_conflict_with_existing_users(client):
+    assert await User.create(username="user1", password="password", email="taken@example.com")
+
+    response = await client.post("/users/bulk", json=[_user("user2"), _user("user1"), _user("user3", email="taken@example.com")])
+    assert response.status_code == 409
+    assert response.json()["errors"] == [
+        {"index": 1, "errors": [{"loc": ["username"], "msg": "Already exists", "type": "conflict", "input": "user1"}]},
+        {"index": 2, "errors": [{"loc": ["email"], "msg": "Already exists", "type": "conflict", "input": "taken@example.com"}]},
+    ]
+    assert await User.get_by_username("user2") is None
+
+
+async def test_bulk_users_create_and_limit_rows(client):
+    response = await client.post("/users/bulk", json=[_user(f"user{i}") for i in range(20)])
+    assert response.status_code == 200
+    assert len(response.json()["ids"]) == 20
+
+    response = await client.post("/users/bulk", json=[_user(f"many{i}") for i in range(MAX_BULK_USER_ROWS + 1)])
+    assert response.status_code == 413
+
+
+async def test_bulk_items_report_unknown_stalls_by_input_index(client):
+    assert await Stall.create(stall_name="屋台", owner_name="店主", thumbnail_URL="")
+    stall = (await Stall.get_list())[0][0]
+
+    response = await client.post("/items/bulk", json=[
+        {"stall_id": stall.id, "item_name": "焼きそば", "price": 500},
+        {"stall_id": stall.id + 1, "item_name": "たこ焼き", "price": 400},
+        {"stall_id": stall.id + 1, "item_name": "かき氷", "price": 300},
+    ])
+    assert response.status_code == 422
+    assert response.json()["errors"] == [
+        {"index": index, "errors": [{"loc": ["stall_id"], "msg": "Stall not found", "type": "not_found", "input": stall.id + 1}]}
+        for index in (1, 2)
+    ]
+    assert (await Item.get_list())[0] == []
+
+    response = await client.post("/items/bulk", json=[{"stall_id": stall.id, "item_name": "焼きそば", "price": 500}])
+    assert response.status_code == 200
+    assert len(response.json()["ids"]) == 1
+
+
+async def test_bulk_failure_is_not_reported_as_success(client, monkeypatch):
+    async def fail(rows):
+        return None
+
+    monkeypatch.setattr(Stall, "create_many", fail)
+    response = await client.post("/stalls/bulk", json=[{"stall_name": "屋台", "owner_name": "店主", "thumbnail_URL": ""}])
+    assert response.status_code == 500
+    assert response.json() == {"is_success": False, "ids": []}
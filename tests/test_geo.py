@@ -0,0 +1,98 @@
+import random
+
+import pytest
+from sqlalchemy.dialects import mysql
+from sqlalchemy.schema import CreateTable
+
+from api.database.models import Stall
+from api.geo import METERS_PER_DEGREE, GridIndex, distance_m
+
+CENTER = (35.6812, 139.7671)
+
+
+def _linear_nearby(points, latitude, longitude, radius_m, limit):
+    # 全件の距離を求めて近い順に並べる（索引の結果と比べる）
+    candidates = []
+    for id, (point_lat, point_lon) in points.items():
+        distance = distance_m(latitude, longitude, point_lat, point_lon)
+        if distance <= radius_m:
+            candidates.append((distance, id))
+    return [(id, round(distance, 1)) for distance, id in sorted(candidates)[:limit]]
+
+
+def _index(points, cell_size_m=100):
+    index = GridIndex(cell_size_m)
+    for id, (latitude, longitude) in points.items():
+        index.add(id, latitude, longitude, {"id": id})
+    return index
+
+
+def _results(index, latitude, longitude, radius_m, limit):
+    return [(hit["id"], hit["distance_m"]) for hit in index.nearby(latitude, longitude, radius_m, limit)]
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("radius_m,limit", [(50, 5), (200, 1), (200, 20), (1000, 50), (5000, 10)])
+def test_nearby_matches_linear_scan(seed, radius_m, limit):
+    rng = random.Random(seed)
+    spread = 2000 / METERS_PER_DEGREE
+    points = {
+        id: (CENTER[0] + rng.uniform(-spread, spread), CENTER[1] + rng.uniform(-spread, spread))
+        for id in range(1, 501)
+    }
+    index = _index(points)
+    for _ in range(20):
+        latitude = CENTER[0] + rng.uniform(-spread, spread)
+        longitude = CENTER[1] + rng.uniform(-spread, spread)
+        assert _results(index, latitude, longitude, radius_m, limit) == \
+            _linear_nearby(points, latitude, longitude, radius_m, limit)
+
+
+def test_nearby_across_cell_borders():
+    index = GridIndex(100)
+    size = index.cell_degrees
+    # 検索地点はマスの端、最も近い屋台は隣のマス、同じマスの屋台はそれより遠い
+    latitude, longitude = 3000 * size + size * 0.99, 12000 * size + size * 0.5
+    index.add(1, latitude + size * 0.02, longitude, {"id": 1})
+    index.add(2, latitude - size * 0.9, longitude, {"id": 2})
+    index.add(3, latitude, longitude + size * 1.6, {"id": 3})
+    assert [hit["id"] for hit in index.nearby(latitude, longitude, 1000, 1)] == [1]
+    assert [hit["id"] for hit in index.nearby(latitude, longitude, 1000, 3)] == [1, 2, 3]
+
+
+def test_nearby_radius_is_inclusive():
+    index = GridIndex(100)
+    index.add(1, CENTER[0] + 150 / METERS_PER_DEGREE, CENTER[1], {"id": 1})
+    distance = distance_m(*CENTER, CENTER[0] + 150 / METERS_PER_DEGREE, CENTER[1])
+    assert [hit["id"] for hit in index.nearby(*CENTER, distance, 10)] == [1]
+    assert index.nearby(*CENTER, distance - 0.01, 10) == []
+
+
+def test_nearby_breaks_ties_by_id():
+    index = GridIndex(100)
+    offset = 50 / METERS_PER_DEGREE
+    for id, latitude in [(3, CENTER[0] + offset), (1, CENTER[0] - offset), (2, CENTER[0] + offset)]:
+        index.add(id, latitude, CENTER[1], {"id": id})
+    assert [hit["id"] for hit in index.nearby(*CENTER, 100, 2)] == [1, 2]
+
+
+def test_nearby_at_high_latitude():
+    # 経度1度が短い高緯度でも、半径内の屋台を取りこぼさない
+    points = {id: (78.2 + id * 1e-4, 15.6 + id * 7e-4) for id in range(1, 101)}
+    index = _index(points)
+    assert _results(index, 78.205, 15.63, 1000, 10) == _linear_nearby(points, 78.205, 15.63, 1000, 10)
+
+
+def test_remove_drops_point():
+    index = GridIndex(100)
+    index.add(1, *CENTER, {"id": 1})
+    index.add(1, CENTER[0] + 0.01, CENTER[1], {"id": 1})
+    assert index.nearby(*CENTER, 100, 10) == []
+    index.remove(1)
+    assert len(index) == 0
+
+
+def test_coordinates_are_double_precision_on_mysql():
+    ddl = str(CreateTable(Stall.__table__).compile(dialect=mysql.dialect()))
+    assert "latitude FLOAT(53)" in ddl
+    assert "longitude FLOAT(53)" in ddl
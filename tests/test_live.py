@@ -0,0 +1,31 @@
+from api.live import RANKING, LiveFeed, rating_topic
+
+
+def _feed():
+    return LiveFeed(interval=0, poll_interval=0, keepalive_interval=15)
+
+
+async def test_publish_without_subscribers_keeps_no_snapshot(db):
+    feed = _feed()
+    stream = feed.stream(rating_topic(1))
+    assert "event: rating" in await stream.__anext__()
+    await stream.aclose()
+    assert feed.subscriber_count() == 0
+
+    # 最後の購読者が切断した後に再計算の結果が届いても、スナップショットを作り直さない
+    feed._publish(rating_topic(1), {"stall_id": 1})
+    feed._publish(RANKING, [])
+    assert feed._snapshots == {}
+    assert dict(feed._subscribers) == {}
+
+
+async def test_publish_sends_changed_snapshot_to_subscribers(db):
+    feed = _feed()
+    stream = feed.stream(RANKING)
+    first = await stream.__anext__()
+    assert first.startswith("id: 1\nevent: ranking\ndata: []")
+
+    feed._publish(RANKING, [{"stall_name": "焼きそば屋"}])
+    assert "焼きそば屋" in await stream.__anext__()
+    await stream.aclose()
+    assert feed._snapshots == {}
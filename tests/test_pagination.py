@@ -0,0 +1,38 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy import insert
+
+from api.database.db import Session
+from api.database.models import Stall
+from api.database.pagination import InvalidCursorError, decode_cursor, encode_cursor
+
+
+@pytest.mark.parametrize("created_at", [datetime(2024, 9, 14, 12, 0, 0), None])
+def test_cursor_round_trip(created_at):
+    assert decode_cursor(encode_cursor(created_at, 7)) == (created_at, 7)
+
+
+@pytest.mark.parametrize("cursor", ["not-a-cursor", encode_cursor(datetime(2024, 9, 14), 1)[:-2]])
+def test_invalid_cursor(cursor):
+    with pytest.raises(InvalidCursorError):
+        decode_cursor(cursor)
+
+
+async def test_pages_include_rows_without_created_at(db):
+    # created_at がNULLの行（server_default より前に作られた行など）を含めて、すべての行を1回ずつ返す
+    await Session.execute(insert(Stall.__table__), [
+        {"id": 1, "stall_name": "a", "owner_name": "o", "created_at": datetime(2024, 9, 14, 9, 0, 0)},
+        {"id": 2, "stall_name": "b", "owner_name": "o", "created_at": None},
+        {"id": 3, "stall_name": "c", "owner_name": "o", "created_at": None},
+        {"id": 4, "stall_name": "d", "owner_name": "o", "created_at": datetime(2024, 9, 14, 8, 0, 0)},
+    ])
+    await Session.commit()
+
+    ids, cursor = [], None
+    while True:
+        rows, cursor = await Stall.get_list_rows(["id"], limit=1, cursor=cursor)
+        ids += [row[0] for row in rows]
+        if cursor is None:
+            break
+    assert ids == [2, 3, 4, 1]
@@ -0,0 +1,60 @@
+import random
+
+import pytest
+
+from api.price_index import PRICE_INDEX_MERGE_THRESHOLD, PriceIndex
+
+
+def _index(rows):
+    index = PriceIndex()
+    index.load(rows)
+    return index
+
+
+def _ids(rows):
+    return [row[3] for row in rows]
+
+
+ROWS = [(1, "ラムネ", 200, 4), (1, "焼きそば", 500, 1), (2, "たこ焼き", 500, 3), (2, "かき氷", 300, 2), (3, "お好み焼き", 800, 5)]
+
+
+def test_range_bounds_are_inclusive():
+    index = _index(ROWS)
+    assert _ids(index.range(300, 500)) == [2, 1, 3]
+    assert _ids(index.range(min_price=500)) == [1, 3, 5]
+    assert _ids(index.range(max_price=300)) == [4, 2]
+    assert _ids(index.range(500, 500)) == [1, 3]
+    assert index.range(301, 499) == []
+    assert index.range(900) == []
+
+
+def test_range_orders_duplicate_prices_by_id_and_limits():
+    index = _index(ROWS)
+    assert _ids(index.range()) == [4, 2, 1, 3, 5]
+    assert _ids(index.range(500, 500, limit=1)) == [1]
+    assert _ids(index.range(limit=3)) == [4, 2, 1]
+
+
+def test_add_keeps_order_and_replaces_same_item():
+    index = _index(ROWS)
+    index.add(3, "じゃがバター", 500, 0)
+    index.add(3, "フランクフルト", 500, 9)
+    assert _ids(index.range(500, 500)) == [0, 1, 3, 9]
+    index.add(3, "フランクフルト（大）", 500, 9)
+    assert len(index) == 7
+    assert index.range(500, 500)[-1] == (3, "フランクフルト（大）", 500, 9)
+
+
+@pytest.mark.parametrize("count", [1, PRICE_INDEX_MERGE_THRESHOLD - 1, PRICE_INDEX_MERGE_THRESHOLD, 500])
+def test_add_many_matches_sorted_rows(count):
+    rng = random.Random(count)
+    rows = [(1, f"item{id}", rng.choice([100, 300, 500]), id) for id in range(1, 400, 2)]
+    index = _index(rows)
+    # 作成された商品（idは既存の商品の間にも入る）
+    added = [(2, f"new{id}", rng.choice([100, 200, 300, 500]), id) for id in rng.sample(range(2, 2000, 2), count)]
+    rng.shuffle(added)
+    index.add_many(added)
+
+    expected = sorted(rows + added, key=lambda row: (row[2], row[3]))
+    assert index.range(limit=len(expected) + 1) == expected
+    assert index.range(200, 300, limit=1000) == [row for row in expected if 200 <= row[2] <= 300]
@@ -0,0 +1,10 @@
+import pytest
+
+from api.database.check_query_plans import QUERIES, check_query, create_fixture_rows
+
+
+@pytest.mark.parametrize("name, call", QUERIES, ids=[name for name, _ in QUERIES])
+async def test_query_does_not_scan_whole_table(db, name, call):
+    await create_fixture_rows()
+    regressions = await check_query(name, call)
+    assert not regressions, "\n".join(f"{statement}\n{' | '.join(plan)}" for _, statement, plan in regressions)
@@ -0,0 +1,46 @@
+from api.database.db import Session
+from api.database.models import JobLease, Review, Stall, StallNeighbor, User
+from api.recommendations import RECOMMEND_LEASE_NAME, RecommendationJob
+
+
+def _job():
+    return RecommendationJob(interval=60, full_interval=3600, top_k=20, shrinkage=0, lease_seconds=300)
+
+
+async def test_job_lease_is_held_by_one_owner(db):
+    assert await JobLease.acquire("job", "worker-1", 300)
+    assert not await JobLease.acquire("job", "worker-2", 300)
+    # 持っているプロセスは延長できる
+    assert await JobLease.acquire("job", "worker-1", 300)
+    # 期限が切れると他のプロセスが取得できる
+    assert await JobLease.acquire("job", "worker-1", -1)
+    assert await JobLease.acquire("job", "worker-2", 300)
+    assert not await JobLease.acquire("job", "worker-1", 300)
+
+
+async def test_only_lease_holder_refreshes_neighbors(db):
+    names = ("焼きそば屋", "たこ焼き屋", "かき氷屋")
+    for name in names:
+        assert await Stall.create(stall_name=name, owner_name="店主")
+    stall_ids = [(await Stall.get_by_stall_name(name)).id for name in names]
+    # 焼きそば屋とたこ焼き屋は評価の傾向が似ている
+    for i, ratings in enumerate(((5, 5, 1), (4, 4, 2), (1, 2, 5))):
+        assert await User.create(username=f"user{i}", password="password", email=f"user{i}@example.com")
+        user_id = (await User.get_by_username(f"user{i}")).id
+        for stall_id, rating in zip(stall_ids, ratings):
+            assert await Review.create(stall_id=stall_id, user_id=user_id, rating=rating, comment="")
+
+    assert await JobLease.acquire(RECOMMEND_LEASE_NAME, "other-process", 300)
+    job = _job()
+    await job.run_once()
+    assert job.status()["leader"] is False
+    assert await StallNeighbor.get_for_stalls(stall_ids) == []
+
+    # リースが切れた後は引き継いで全件から計算する
+    assert await JobLease.acquire(RECOMMEND_LEASE_NAME, "other-process", -1)
+    await job.run_once()
+    status = job.status()
+    assert (status["leader"], status["last_refresh"]) == (True, "full")
+    await Session.remove()
+    rows = await StallNeighbor.get_for_stalls(stall_ids)
+    assert {(row[0], row[1]) for row in rows} == {(stall_ids[0], stall_ids[1]), (stall_ids[1], stall_ids[0])}
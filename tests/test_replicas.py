@@ -0,0 +1,72 @@
+import pytest
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from api.database.db import ModelBase, replica_engines
+from api.database.db import unhealthy_replicas
+from api.database.replicas import STICKY_COOKIE, watch_replica
+
+
+# 書き込みが反映されていない（遅れている）レプリカとして、プライマリとは別のSQLiteファイルを使う
+@pytest.fixture
+async def lagging_replica(db, tmp_path):
+    replica = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'replica.db'}")
+    async with replica.begin() as conn:
+        await conn.run_sync(ModelBase.metadata.create_all)
+    replica_engines.append(replica)
+    yield replica
+    replica_engines.remove(replica)
+    await replica.dispose()
+
+
+# テーブルの無いSQLiteファイルを、クエリがエラーになるレプリカとして使う
+@pytest.fixture
+async def broken_replica(db, tmp_path):
+    replica = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'broken.db'}")
+    watch_replica(replica)
+    replica_engines.append(replica)
+    yield replica
+    replica_engines.remove(replica)
+    unhealthy_replicas.discard(replica)
+    await replica.dispose()
+
+
+def _stall_names(response):
+    assert response.status_code == 200
+    return [stall["stall_name"] for stall in response.json()["items"]]
+
+
+async def test_write_makes_client_read_primary(client, lagging_replica):
+    # Cookieの無いクライアントはレプリカを読む
+    assert _stall_names(await client.get("/stalls/")) == []
+
+    response = await client.post("/stalls/", json={"stall_name": "焼きそば屋", "owner_name": "店主", "thumbnail_URL": ""})
+    assert response.json() == {"is_success": True}
+    assert STICKY_COOKIE in response.cookies
+    # 書き込んだクライアントはしばらくプライマリを読む
+    assert _stall_names(await client.get("/stalls/")) == ["焼きそば屋"]
+
+
+async def test_sticky_read_skips_cache_filled_from_replica(client, lagging_replica):
+    from api.main import app
+
+    response = await client.post("/stalls/", json={"stall_name": "たこ焼き屋", "owner_name": "店主", "thumbnail_URL": ""})
+    assert response.json() == {"is_success": True}
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as other:
+        # commitでキャッシュが破棄された後、他のクライアントが遅れたレプリカの内容でキャッシュを作る
+        assert _stall_names(await other.get("/stalls/")) == []
+        assert _stall_names(await other.get("/stalls/")) == []
+        # 書き込んだクライアントにはキャッシュではなくプライマリの内容を返す
+        assert _stall_names(await client.get("/stalls/")) == ["たこ焼き屋"]
+
+
+async def test_read_is_retried_on_primary_after_replica_error(client, broken_replica):
+    response = await client.post("/stalls/", json={"stall_name": "焼きそば屋", "owner_name": "店主", "thumbnail_URL": ""})
+    assert response.json() == {"is_success": True}
+    client.cookies.clear()
+
+    assert _stall_names(await client.get("/stalls/")) == ["焼きそば屋"]
+    response = await client.get("/items/")
+    assert response.status_code == 200
+    assert response.json()["items"] == []
@@ -0,0 +1,84 @@
+import pytest
+
+from api.database.models import Review, Stall, User
+from api.review_queue import QueueFullError, ReviewWriteQueue, review_queue
+
+
+@pytest.fixture
+async def auth_headers(client):
+    assert await User.create(username="user1", password="password", email="user1@example.com")
+    response = await client.post("/token", data={"username": "user1", "password": "password"})
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+@pytest.fixture
+async def stall_id(db):
+    assert await Stall.create(stall_name="焼きそば屋", owner_name="店主")
+    return (await Stall.get_by_stall_name("焼きそば屋")).id
+
+
+@pytest.fixture
+async def running_queue(db):
+    review_queue.start()
+    yield review_queue
+    await review_queue.stop()
+
+
+async def _comments():
+    reviews, _ = await Review.get_list()
+    return sorted(review.comment for review in reviews)
+
+
+async def test_review_is_queued_and_written(client, auth_headers, stall_id, running_queue):
+    review = {"stall_id": stall_id, "rating": 5, "comment": "おいしい"}
+    response = await client.post("/reviews/", json=review, headers=auth_headers)
+    assert response.status_code == 202
+    assert response.json() == {"is_success": True, "queued": True}
+
+    # sync=true は待ち行列を使わずにidを返す
+    response = await client.post("/reviews/?sync=true", json={**review, "comment": "すぐ保存"}, headers=auth_headers)
+    assert response.status_code == 200
+    assert response.json()["comment"] == "すぐ保存"
+
+    # 停止時に溜まっているレビューを書き込む
+    await running_queue.stop()
+    assert running_queue.written == 1
+    assert await _comments() == ["おいしい", "すぐ保存"]
+
+
+async def test_full_queue_returns_503(client, auth_headers, stall_id, running_queue, monkeypatch):
+    def full(row):
+        raise QueueFullError("Review queue is full")
+
+    monkeypatch.setattr(running_queue, "submit", full)
+    response = await client.post("/reviews/", json={"stall_id": stall_id, "rating": 5, "comment": "おいしい"}, headers=auth_headers)
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "1"
+
+
+async def test_submit_rejects_rows_over_maxsize(db):
+    queue = ReviewWriteQueue(maxsize=2, batch_size=10, flush_interval=0.01)
+    with pytest.raises(QueueFullError):
+        queue.submit({})
+    queue.start()
+    queue.submit({"comment": "1"})
+    queue.submit({"comment": "2"})
+    # ワーカーが取り出す前に上限を超えた分は断る
+    with pytest.raises(QueueFullError):
+        queue.submit({"comment": "3"})
+    assert queue.stats()["rejected"] == 1
+    await queue.stop()
+
+
+async def test_failed_batch_is_retried_row_by_row(db, stall_id):
+    assert await User.create(username="user1", password="password", email="user1@example.com")
+    user_id = (await User.get_by_username("user1")).id
+    queue = ReviewWriteQueue(maxsize=10, batch_size=10, flush_interval=0.01)
+    queue.start()
+    for comment in ("1件目", None, "3件目"):
+        queue.submit({"stall_id": stall_id, "user_id": user_id, "rating": 4, "comment": comment})
+    await queue.stop()
+
+    # まとめた書き込みが失敗した場合は1件ずつ書き込み、失敗した行だけを捨てる
+    assert (queue.batches, queue.written, queue.failed) == (1, 2, 1)
+    assert await _comments() == ["1件目", "3件目"]
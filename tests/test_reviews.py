@@ -0,0 +1,120 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy import event
+
+from api.database.db import Session
+
+from api.database.models import Review, ReviewRollup, Stall, StallRatingStats, User
+from api.routers import review as review_router
+
+
+async def _stall_and_user():
+    assert await Stall.create(stall_name="焼きそば屋", owner_name="店主")
+    assert await User.create(username="user1", password="password", email="user1@example.com")
+    return (await Stall.get_by_stall_name("焼きそば屋")).id, (await User.get_by_username("user1")).id
+
+
+# 集計テーブルへの書き込みを実行順に記録する
+@pytest.fixture
+def aggregate_writes(db):
+    tables = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        for table in ("stall_rating_stats", "review_rollups"):
+            if statement.lstrip().upper().startswith(("UPDATE", "INSERT")) and table in statement:
+                tables.append(table)
+
+    event.listen(db.sync_engine, "before_cursor_execute", before_cursor_execute)
+    yield tables
+    event.remove(db.sync_engine, "before_cursor_execute", before_cursor_execute)
+
+
+async def test_create_many_updates_stats_and_rollups(db):
+    stall_id, user_id = await _stall_and_user()
+    ids = await Review.create_many([
+        {"stall_id": stall_id, "user_id": user_id, "rating": rating, "comment": "おいしい"} for rating in (5, 4, 5)
+    ])
+    assert ids is not None and len(ids) == 3
+
+    stats = await StallRatingStats.get_by_stall_id(stall_id)
+    assert (stats.rating_count, stats.rating_sum, stats.rating_5) == (3, 14, 2)
+    buckets = await ReviewRollup.get_buckets(stall_id, "day")
+    assert [(bucket.review_count, bucket.rating_sum) for bucket in buckets] == [(3, 14)]
+
+
+async def test_review_writes_lock_stats_before_rollups(db, aggregate_writes):
+    # 書き込みの種類によって行をロックする順番が異なるとデッドロックするため、常に評価集計を先に更新する
+    stall_id, user_id = await _stall_and_user()
+
+    review = await Review.create(stall_id=stall_id, user_id=user_id, rating=5, comment="おいしい")
+    assert review is not None
+    assert await Review.create_many([{"stall_id": stall_id, "user_id": user_id, "rating": 4, "comment": "まあまあ"}])
+    assert await Review.delete(review.id)
+
+    # create・create_many・delete のいずれも、評価集計 → 時間帯ごとの集計 の順で書き込む
+    tables = aggregate_writes
+    order = [table for i, table in enumerate(tables) if i == 0 or tables[i - 1] != table]
+    assert order == ["stall_rating_stats", "review_rollups"] * 3
+
+
+# 2024-11-02 の 10:05・10:40・11:10、2024-11-03 の 09:00 に付いた評価の集計
+@pytest.fixture
+async def rollups(db):
+    stall_id, _ = await _stall_and_user()
+    await ReviewRollup.apply([
+        (stall_id, datetime(2024, 11, 2, 10, 5, 30), 5, 1),
+        (stall_id, datetime(2024, 11, 2, 10, 40), 2, 1),
+        (stall_id, datetime(2024, 11, 2, 11, 10), 4, 1),
+        (stall_id, datetime(2024, 11, 3, 9, 0), 3, 1),
+    ])
+    await Session.commit()
+    return stall_id
+
+
+def _buckets(response):
+    assert response.status_code == 200
+    return [(bucket["bucket_start"], bucket["review_count"], bucket["average_rating"]) for bucket in response.json()["buckets"]]
+
+
+async def test_review_stats_buckets(client, rollups):
+    assert _buckets(await client.get(f"/reviews/stats/{rollups}")) == [
+        ("2024-11-02T10:00:00", 2, 3.5), ("2024-11-02T11:00:00", 1, 4.0), ("2024-11-03T09:00:00", 1, 3.0),
+    ]
+    assert _buckets(await client.get(f"/reviews/stats/{rollups}?bucket=day")) == [
+        ("2024-11-02T00:00:00", 3, 11 / 3), ("2024-11-03T00:00:00", 1, 3.0),
+    ]
+    assert _buckets(await client.get(f"/reviews/stats/{rollups}?bucket=minute&to=2024-11-02T11:00:00")) == [
+        ("2024-11-02T10:05:00", 1, 5.0), ("2024-11-02T10:40:00", 1, 2.0),
+    ]
+    assert _buckets(await client.get(f"/reviews/stats/{rollups + 1}")) == []
+
+
+async def test_review_stats_range(client, rollups):
+    url = f"/reviews/stats/{rollups}"
+    # from は区切りの途中でもその区切りを含み、to は含まない
+    assert _buckets(await client.get(url, params={"from": "2024-11-02T10:30:00", "to": "2024-11-02T11:00:00"})) == [
+        ("2024-11-02T10:00:00", 2, 3.5),
+    ]
+    assert _buckets(await client.get(url, params={"from": "2024-11-02T11:00:00", "to": "2024-11-03T09:00:01"})) == [
+        ("2024-11-02T11:00:00", 1, 4.0), ("2024-11-03T09:00:00", 1, 3.0),
+    ]
+    # タイムゾーン付きの指定はDB時刻としてそのまま比べる
+    assert _buckets(await client.get(url, params={"from": "2024-11-03T00:00:00+09:00"})) == [("2024-11-03T09:00:00", 1, 3.0)]
+    assert (await client.get(url, params={"from": "2024-11-03T00:00:00", "to": "2024-11-03T00:00:00"})).status_code == 400
+    assert (await client.get(url, params={"bucket": "week"})).status_code == 422
+
+
+async def test_review_stats_return_newest_buckets_and_skip_empty(client, rollups, monkeypatch):
+    monkeypatch.setattr(review_router, "MAX_STATS_BUCKETS", 2)
+    assert [bucket[0] for bucket in _buckets(await client.get(f"/reviews/stats/{rollups}"))] == [
+        "2024-11-02T11:00:00", "2024-11-03T09:00:00",
+    ]
+    monkeypatch.undo()
+
+    # 削除で0件になった区切りは返さない
+    await ReviewRollup.apply([(rollups, datetime(2024, 11, 3, 9, 0), 3, -1)])
+    await Session.commit()
+    assert [bucket[0] for bucket in _buckets(await client.get(f"/reviews/stats/{rollups}"))] == [
+        "2024-11-02T10:00:00", "2024-11-02T11:00:00",
+    ]
@@ -0,0 +1,113 @@
+import random
+import statistics
+import time
+
+import pytest
+
+from api.database.models import Stall
+from api.search import FIELD_WEIGHTS, SearchIndex, build_search_index, ngrams, normalize, search_index
+
+FOODS = ["焼きそば", "たこ焼き", "お好み焼き", "りんご飴", "かき氷", "わたあめ", "フランクフルト", "じゃがバター", "チョコバナナ", "ラムネ"]
+
+
+def _rows(stalls: int, items: int, seed: int = 1):
+    rng = random.Random(seed)
+    stall_rows = [(i, f"{rng.choice(FOODS)}屋 {i}", f"店主 {i}") for i in range(1, stalls + 1)]
+    item_rows = [(i, (i - 1) % stalls + 1, f"{rng.choice(FOODS)} {i}", 300) for i in range(1, items + 1)]
+    return stall_rows, item_rows
+
+
+def _linear_search(stall_rows, item_rows, query: str, limit: int = 20):
+    # 全件を走査する素朴な検索（索引の結果と比べる）
+    text = normalize(query)
+    best = {}
+    documents = [("stall", id, {"stall_name": name, "owner_name": owner}) for id, name, owner in stall_rows]
+    documents += [("item", id, {"item_name": name}) for id, _, name, _ in item_rows]
+    for kind, id, fields in documents:
+        for field, value in fields.items():
+            value = normalize(value)
+            position = value.find(text)
+            if position < 0:
+                continue
+            score = FIELD_WEIGHTS[field] * len(text) / len(value)
+            if position == 0:
+                score += 0.5 if len(value) > len(text) else 1.0
+            best[(kind, id)] = max(score, best.get((kind, id), 0))
+    ranked = sorted(best.items(), key=lambda pair: (-pair[1], pair[0]))[:limit]
+    return [(kind, id, round(score, 4)) for (kind, id), score in ranked]
+
+
+def _results(index, query: str, limit: int = 20):
+    return [(hit["type"], hit["id"], hit["score"]) for hit in index.search(query, limit=limit)]
+
+
+def test_normalize_ignores_width_case_kana_and_spaces():
+    assert normalize("ﾀｺ焼き Ａｂｃ") == normalize("たこ焼きabc") == "たこ焼きabc"
+    assert normalize("  チョコ　バナナ ") == "ちょこばなな"
+    assert normalize(None) == ""
+
+
+def test_ngrams():
+    assert ngrams("たこ焼き") == {"たこ", "こ焼", "焼き"}
+    assert ngrams("た") == {"た"}
+    assert ngrams("") == set()
+
+
+@pytest.mark.parametrize("query", [
+    "焼き", "焼きそば", "ヤキソバ", "たこ", "店主", "店主 12", "1", "12", "屋", "き", "ラムネ屋 99", "焼きそば屋 1", "焼そ", "zz",
+])
+@pytest.mark.parametrize("limit", [1, 20, 100])
+def test_search_matches_linear_scan(query, limit):
+    stall_rows, item_rows = _rows(300, 2000)
+    index = SearchIndex()
+    index.load(stall_rows, item_rows)
+    assert _results(index, query, limit) == _linear_search(stall_rows, item_rows, query, limit)
+
+
+def test_search_ranks_exact_then_prefix_then_contains():
+    index = SearchIndex()
+    index.add_item(1, 1, "焼きそば大盛り", 500)
+    index.add_item(2, 1, "ソース焼きそば", 500)
+    index.add_item(3, 1, "焼きそば", 500)
+    index.add_stall(1, "焼き鳥屋", "やきそば")
+    assert [(hit["type"], hit["id"]) for hit in index.search("やきそば")] == [("stall", 1)]
+    assert [(hit["type"], hit["id"]) for hit in index.search("焼きそば")] == [("item", 3), ("item", 1), ("item", 2)]
+
+
+def test_add_replaces_and_remove_deletes_entries():
+    index = SearchIndex()
+    index.add_stall(1, "たこ焼き屋", "店主")
+    index.add_stall(1, "焼きそば屋", "店主")
+    assert index.search("たこ") == []
+    assert [hit["stall_name"] for hit in index.search("焼きそば")] == ["焼きそば屋"]
+    index.remove("stall", 1)
+    assert len(index) == 0
+    assert index.search("店主") == []
+
+
+@pytest.fixture(scope="module")
+def large_index():
+    # 屋台5千件・商品4万5千件（1k件のレビューのベンチマークの約10倍の規模）
+    index = SearchIndex()
+    index.load(*_rows(5000, 45000))
+    return index
+
+
+@pytest.mark.parametrize("query", ["焼き", "焼きそば", "たこ", "あめ", "バナナ", "店主"])
+def test_search_latency(large_index, query):
+    large_index.search(query)
+    timings = []
+    for _ in range(50):
+        started = time.perf_counter()
+        large_index.search(query)
+        timings.append(time.perf_counter() - started)
+    # よく使われるクエリは候補の一部を読むだけで上位20件がそろう
+    assert statistics.median(timings) < 0.001
+
+
+async def test_build_search_index_swaps_contents(db):
+    assert await Stall.create(stall_name="たこ焼き屋", owner_name="店主")
+    index = search_index
+    await build_search_index()
+    assert search_index is index
+    assert [hit["stall_name"] for hit in search_index.search("たこ焼き")] == ["たこ焼き屋"]
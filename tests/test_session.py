@@ -0,0 +1,53 @@
+import asyncio
+
+import pytest
+from sqlalchemy import text
+
+from api.database.db import Session, remove_session
+from api.database.models import Stall
+
+
+async def test_remove_session_discards_task_session(db):
+    dependency = remove_session()
+    await dependency.__anext__()
+    session = Session()
+    # 同じタスクの中では同じセッションが返る
+    assert Session() is session
+    await session.execute(text("SELECT 1"))
+    assert session.in_transaction()
+
+    with pytest.raises(StopAsyncIteration):
+        await dependency.__anext__()
+    assert not session.in_transaction()
+    assert Session() is not session
+
+
+async def test_sessions_are_scoped_per_task(db):
+    async def task_session():
+        session = Session()
+        await Session.remove()
+        return session
+
+    outer = Session()
+    inner = await asyncio.create_task(task_session())
+    assert inner is not outer
+    # 別のタスクでの破棄は呼び出し元のセッションに影響しない
+    assert Session() is outer
+
+
+async def test_model_write_is_visible_in_new_session(db):
+    assert await Stall.create(stall_name="焼きそば屋", owner_name="店主")
+    await Session.remove()
+
+    stall = await Stall.get_by_stall_name("焼きそば屋")
+    assert stall is not None
+    assert (await Stall.get_by_id(stall.id)).owner_name == "店主"
+
+
+async def test_api_round_trip(client):
+    response = await client.post("/stalls/", json={"stall_name": "たこ焼き屋", "owner_name": "店主", "thumbnail_URL": ""})
+    assert response.json() == {"is_success": True}
+
+    response = await client.get("/stalls/")
+    assert response.status_code == 200
+    assert [stall["stall_name"] for stall in response.json()["items"]] == ["たこ焼き屋"]
@@ -0,0 +1,75 @@
+import io
+import os
+
+import pytest
+from PIL import Image
+
+from api import thumbnails
+from api.database.models import Stall
+from api.thumbnails import FORMATS, THUMBNAIL_MAX_PENDING, THUMBNAIL_URL_PREFIX, VARIANTS, _render, thumbnail_urls_from
+
+
+def _image(width, height, format="PNG"):
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height), (200, 80, 40)).save(buffer, format)
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def thumbnail_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(thumbnails, "THUMBNAIL_DIR", str(tmp_path))
+    yield tmp_path
+    thumbnails.shutdown_executor()
+
+
+@pytest.fixture
+async def stall_id(db):
+    assert await Stall.create(stall_name="焼きそば屋", owner_name="店主")
+    return (await Stall.get_by_stall_name("焼きそば屋")).id
+
+
+def test_render_creates_every_variant(tmp_path):
+    digest = _render(_image(2000, 1000), str(tmp_path))
+    for variant, (width, height, crop) in VARIANTS.items():
+        for ext, (format, _) in FORMATS.items():
+            with Image.open(tmp_path / f"{digest}-{variant}.{ext}") as image:
+                assert image.format == format
+                # 切り抜く種類は枠と同じ大きさ、それ以外は縦横比を保って枠に収める
+                assert image.size == ((width, height) if crop else (1200, 600))
+
+
+def test_render_is_idempotent_and_content_addressed(tmp_path):
+    data = _image(300, 300)
+    digest = _render(data, str(tmp_path))
+    mtimes = {path: path.stat().st_mtime_ns for path in tmp_path.iterdir()}
+    assert _render(data, str(tmp_path)) == digest
+    assert {path: path.stat().st_mtime_ns for path in tmp_path.iterdir()} == mtimes
+    assert _render(_image(300, 301), str(tmp_path)) != digest
+
+
+def test_render_rejects_non_images(tmp_path):
+    with pytest.raises(thumbnails.InvalidImageError):
+        _render(b"not an image", str(tmp_path))
+    assert os.listdir(tmp_path) == []
+
+
+async def test_upload_stores_list_variant(client, stall_id, thumbnail_dir):
+    response = await client.post(f"/stalls/{stall_id}/thumbnail", files={"file": ("stall.jpg", _image(640, 480, "JPEG"), "image/jpeg")})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["thumbnail_URL"].startswith(f"{THUMBNAIL_URL_PREFIX}/")
+    assert body["thumbnail_URL"].endswith("-list.webp")
+    assert thumbnail_urls_from(body["thumbnail_URL"]) == body["thumbnails"]
+    assert len(os.listdir(thumbnail_dir)) == len(VARIANTS) * len(FORMATS)
+    assert (await Stall.get_by_id(stall_id)).thumbnail_URL == body["thumbnail_URL"]
+
+    response = await client.post(f"/stalls/{stall_id}/thumbnail", files={"file": ("stall.txt", b"text", "text/plain")})
+    assert response.status_code == 400
+
+
+async def test_upload_returns_503_when_too_many_pending(client, stall_id, thumbnail_dir, monkeypatch):
+    monkeypatch.setattr(thumbnails, "_pending", THUMBNAIL_MAX_PENDING)
+    response = await client.post(f"/stalls/{stall_id}/thumbnail", files={"file": ("stall.png", _image(10, 10), "image/png")})
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "1"
+    assert os.listdir(thumbnail_dir) == []